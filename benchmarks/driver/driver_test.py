@@ -0,0 +1,84 @@
+import pytest
+
+from esrally import metrics, track
+from esrally.driver import driver
+
+CLIENTS = 16
+SAMPLES_PER_CLIENT = 20000
+
+task = track.Task(track.Operation("index", track.OperationType.Index))
+
+
+def create_samples(clients, samples_per_client):
+    buffers = []
+    for client_id in range(clients):
+        buffer = driver.SampleBuffer(client_id, task)
+        for i in range(samples_per_client):
+            # clients issue requests at slightly different points in time
+            t = i * 0.001 + client_id * 0.0001
+            sample_type = metrics.SampleType.Warmup if i < samples_per_client // 10 else metrics.SampleType.Normal
+            buffer.add(1500000000 + t, t, sample_type, {"success": True}, 1, 1, 5000, "docs", t, i / samples_per_client)
+        buffer.trim()
+        buffers.append(buffer)
+    return buffers
+
+
+def calculate_global_throughput_per_sample(samples, bucket_interval_secs=1):
+    # previous implementation that sorts all samples and inspects each of them (kept as a baseline)
+    samples_per_task = {}
+    for sample in samples:
+        samples_per_task.setdefault(sample.task, []).append(sample)
+
+    global_throughput = {}
+    for t, v in samples_per_task.items():
+        global_throughput[t] = []
+        current_samples = sorted(v, key=lambda s: s.absolute_time)
+        total_count = 0
+        interval = 0
+        current_bucket = 0
+        current_sample_type = current_samples[0].sample_type
+        sample_count_for_current_sample_type = 0
+        start_time = current_samples[0].absolute_time - current_samples[0].time_period
+        for sample in current_samples:
+            if current_sample_type < sample.sample_type:
+                current_sample_type = sample.sample_type
+                sample_count_for_current_sample_type = 0
+            total_count += sample.total_ops
+            interval = max(sample.absolute_time - start_time, interval)
+            if interval > 0 and interval >= current_bucket:
+                sample_count_for_current_sample_type += 1
+                current_bucket = int(interval) + bucket_interval_secs
+                global_throughput[t].append(
+                    (sample.absolute_time, sample.relative_time, current_sample_type, total_count / interval, "%s/s" % sample.total_ops_unit))
+        if interval > 0 and sample_count_for_current_sample_type == 0:
+            global_throughput[t].append(
+                (sample.absolute_time, sample.relative_time, current_sample_type, total_count / interval, "%s/s" % sample.total_ops_unit))
+    return global_throughput
+
+
+sample_buffers = create_samples(CLIENTS, SAMPLES_PER_CLIENT)
+samples = [s for buffer in sample_buffers for s in buffer]
+
+
+def test_calculates_same_throughput_as_baseline():
+    assert calculate_global_throughput_per_sample(samples) == driver.calculate_global_throughput(sample_buffers)
+
+
+@pytest.mark.benchmark(
+    group="global-throughput",
+    warmup="on",
+    warmup_iterations=1,
+    disable_gc=True
+)
+def test_calculate_global_throughput_per_sample(benchmark):
+    benchmark(calculate_global_throughput_per_sample, samples)
+
+
+@pytest.mark.benchmark(
+    group="global-throughput",
+    warmup="on",
+    warmup_iterations=1,
+    disable_gc=True
+)
+def test_calculate_global_throughput(benchmark):
+    benchmark(driver.calculate_global_throughput, sample_buffers)
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 from esrally.driver import runner
@@ -36,7 +38,24 @@ class ElasticsearchMock:
         return self.no_errors
 
 
+class TransportMock:
+    def __init__(self, response):
+        self.response = response
+
+    def perform_request(self, method, url, params=None, body=None):
+        return self.response
+
+
+class RawElasticsearchMock:
+    """
+    Returns the raw bytes of a bulk response instead of a deserialized response.
+    """
+    def __init__(self, bulk_size):
+        self.transport = TransportMock(json.dumps(ElasticsearchMock(bulk_size).no_errors).encode("utf-8"))
+
+
 es = ElasticsearchMock(bulk_size=BULK_SIZE)
+raw_es = RawElasticsearchMock(bulk_size=BULK_SIZE)
 
 
 @pytest.mark.benchmark(
@@ -66,3 +85,32 @@ def test_bulk_runner_without_errors_with_detailed_results(benchmark):
         "bulk-size": BULK_SIZE,
         "detailed-results": True
     })
+
+
+@pytest.mark.benchmark(
+    group="bulk-runner",
+    warmup="on",
+    warmup_iterations=10000,
+    disable_gc=True
+)
+def test_bulk_runner_raw_response_without_errors_no_detailed_results(benchmark):
+    benchmark(bulk_index, raw_es, {
+        "action_metadata_present": True,
+        "body": b"bulk API body",
+        "bulk-size": BULK_SIZE
+    })
+
+
+@pytest.mark.benchmark(
+    group="bulk-runner",
+    warmup="on",
+    warmup_iterations=100,
+    disable_gc=True
+)
+def test_bulk_runner_raw_response_without_errors_with_detailed_results(benchmark):
+    benchmark(bulk_index, raw_es, {
+        "action_metadata_present": True,
+        "body": b"bulk API body",
+        "bulk-size": BULK_SIZE,
+        "detailed-results": True
+    })
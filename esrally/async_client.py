@@ -0,0 +1,355 @@
+import asyncio
+import base64
+import gzip
+import itertools
+import json
+import logging
+import socket
+import ssl
+import time
+import urllib.parse
+
+import certifi
+
+from esrally import client, exceptions
+
+logger = logging.getLogger("rally.client")
+
+# the standard client's default request timeout in seconds
+DEFAULT_TIMEOUT = 10
+# the standard client's default connection pool size per host
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 10
+# client options of the standard client that this client does not support
+UNSUPPORTED_CLIENT_OPTIONS = ["sniff_on_start", "sniff_on_connection_fail", "sniffer_timeout", "host_selector"]
+# requests with these methods can be retried safely as they don't change any state in Elasticsearch
+IDEMPOTENT_METHODS = ["GET", "HEAD"]
+
+
+def check_client_options(client_options):
+    """
+    Rejects client options that this client does not support instead of silently ignoring them.
+
+    :param client_options: The client options of the standard client (may be ``None``).
+    :raises exceptions.SystemSetupError: if any unsupported client option is set.
+    """
+    unsupported = sorted(k for k in UNSUPPORTED_CLIENT_OPTIONS if client_options and client_options.get(k))
+    if unsupported:
+        raise exceptions.SystemSetupError("The client options %s are not supported in the asyncio load generator mode. Please remove them "
+                                          "or use the process load generator mode." % unsupported)
+
+
+class AsyncEsClient:
+    """
+    A non-blocking HTTP client for Elasticsearch that is used by the runners of the asyncio load generator (see ``async_runner``). It keeps
+    connections to all hosts alive and distributes requests round-robin across hosts. Responses are always returned as
+    ``client.RawResponse``.
+
+    It understands the same client options as ``client.EsClientFactory`` (after the factory has normalized them) except for sniffing and
+    custom host selectors which are rejected (see ``check_client_options()``). It must be created and used on the same event loop.
+    """
+
+    def __init__(self, hosts, client_options=None):
+        check_client_options(client_options)
+        opts = client_options or {}
+        self.timeout = opts.get("timeout", DEFAULT_TIMEOUT)
+        self.compressed = opts.get("compressed", False)
+        self.compression_level = opts.get("compression_level", client.DEFAULT_COMPRESSION_LEVEL)
+        self.tcp_nodelay = opts.get("tcp_nodelay", True)
+        self.headers = {"Connection": "keep-alive", "Content-Type": "application/json"}
+        if opts.get("http_auth"):
+            user, password = opts["http_auth"]
+            self.headers["Authorization"] = "Basic %s" % base64.b64encode(("%s:%s" % (user, password)).encode("utf-8")).decode("ascii")
+        ssl_context = self._ssl_context(opts) if opts.get("use_ssl", False) else None
+        maxsize = opts.get("maxsize", DEFAULT_MAX_CONNECTIONS_PER_HOST)
+        self.hosts = [HostConnections(h.get("host", "localhost"), h.get("port", 9200), maxsize, ssl_context, self.tcp_nodelay)
+                      for h in hosts]
+        self.offset = itertools.count()
+
+    @staticmethod
+    def _ssl_context(opts):
+        if opts.get("verify_certs", True):
+            return ssl.create_default_context(cafile=opts.get("ca_certs", certifi.where()))
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def timed(self, request_timings):
+        """
+        :param request_timings: ``client.RequestTimings`` or ``None``.
+        :return: A view of this client that records the timings of all its requests in ``request_timings``.
+        """
+        return self if request_timings is None else TimedAsyncEsClient(self, request_timings)
+
+    async def perform_request(self, method, path, params=None, body=None, request_timings=None):
+        """
+        Issues one request.
+
+        :param method: The HTTP method.
+        :param path: The request path (see ``make_path()``).
+        :param params: Request parameters (optional). ``client.RAW_RESPONSE_PARAM`` is ignored as all responses are raw.
+        :param body: The request body (optional). Either ``bytes``, a ``str`` or an object that is serialized as JSON.
+        :param request_timings: ``client.RequestTimings`` that should record this request (optional).
+        :return: The response as ``client.RawResponse``.
+        :raises elasticsearch.TransportError: if the request has failed.
+        """
+        host = self.hosts[next(self.offset) % len(self.hosts)]
+        request = self._encode_request(method, path, params, body, host)
+        start = time.perf_counter()
+        connection = await host.acquire()
+        try:
+            connection_ready = time.perf_counter()
+            try:
+                status, data = await asyncio.wait_for(connection.round_trip(request, method), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                if not connection.reused or not self._may_retry(method, e):
+                    raise
+                # Elasticsearch has probably closed an idle connection in the meantime. Retry once on a new connection.
+                connection.close()
+                await connection.connect()
+                connection_ready = time.perf_counter()
+                status, data = await asyncio.wait_for(connection.round_trip(request, method), self.timeout)
+            stop = time.perf_counter()
+        except asyncio.TimeoutError as e:
+            connection.close()
+            import elasticsearch
+            raise elasticsearch.ConnectionTimeout("TIMEOUT", str(e), e)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            connection.close()
+            import elasticsearch
+            raise elasticsearch.ConnectionError("N/A", str(e), e)
+        finally:
+            host.release(connection)
+        response = client.RawResponse(data, status)
+        if request_timings is not None:
+            request_timings.requests += 1
+            request_timings.connection_wait_time += connection_ready - start
+            request_timings.wire_time += stop - connection_ready
+            request_timings.add_server_time(response.took)
+        if not 200 <= status < 300:
+            raise_error(status, data)
+        return response
+
+    @staticmethod
+    def _may_retry(method, e):
+        """
+        :return: ``True`` iff a request that has failed without any response may be sent again. We cannot tell whether Elasticsearch
+                 has already processed it so this is only the case for requests that don't change any state (e.g. retrying a bulk request
+                 would index all documents twice).
+        """
+        no_response = not isinstance(e, asyncio.IncompleteReadError) or not e.partial
+        return no_response and method in IDEMPOTENT_METHODS
+
+    def _encode_request(self, method, path, params, body, host):
+        query = encode_params(params)
+        target = "%s?%s" % (path, query) if query else path
+        headers = dict(self.headers)
+        headers["Host"] = "%s:%d" % (host.host, host.port)
+        if body is not None:
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            elif not isinstance(body, bytes):
+                body = json.dumps(body).encode("utf-8")
+            if isinstance(body, client.GzipCompressedBody):
+                headers["Content-Encoding"] = "gzip"
+            elif self.compressed:
+                body = gzip.compress(body, compresslevel=self.compression_level)
+                headers["Content-Encoding"] = "gzip"
+            headers["Content-Length"] = str(len(body))
+        elif method in ("POST", "PUT"):
+            headers["Content-Length"] = "0"
+        head = "%s %s HTTP/1.1\r\n%s\r\n\r\n" % (method, target, "\r\n".join("%s: %s" % (k, v) for k, v in headers.items()))
+        return head.encode("latin-1") + (body or b"")
+
+    def connection_stats(self):
+        """
+        :return: Statistics about requests and connections per host in the same format as ``client.connection_stats()``.
+        """
+        return [{
+            "host": "http://%s:%d" % (h.host, h.port),
+            "requests": h.requests,
+            "connections": h.connections,
+            "reused": max(h.requests - h.connections, 0)
+        } for h in self.hosts]
+
+    def close(self):
+        for h in self.hosts:
+            h.close()
+
+
+class TimedAsyncEsClient:
+    """
+    A view of an ``AsyncEsClient`` that records the timings of all requests. Concurrent requests of different clients on the same event loop
+    cannot be told apart by thread so each request gets its own view.
+    """
+
+    def __init__(self, es, request_timings):
+        self.es = es
+        self.request_timings = request_timings
+
+    def timed(self, request_timings):
+        return self.es.timed(request_timings)
+
+    async def perform_request(self, method, path, params=None, body=None):
+        return await self.es.perform_request(method, path, params=params, body=body, request_timings=self.request_timings)
+
+
+class HostConnections:
+    """
+    Keep-alive connections to one host. At most ``maxsize`` requests are outstanding at the same time. Further requests wait for a
+    connection.
+    """
+
+    def __init__(self, host, port, maxsize, ssl_context=None, tcp_nodelay=True):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.tcp_nodelay = tcp_nodelay
+        self.slots = asyncio.Semaphore(maxsize)
+        self.idle = []
+        # number of requests and connections that have been opened (for statistics)
+        self.requests = 0
+        self.connections = 0
+
+    async def acquire(self):
+        await self.slots.acquire()
+        self.requests += 1
+        while self.idle:
+            connection = self.idle.pop()
+            if connection.is_open():
+                connection.reused = True
+                return connection
+        connection = HttpConnection(self)
+        try:
+            await connection.connect()
+        except BaseException:
+            self.slots.release()
+            raise
+        return connection
+
+    def release(self, connection):
+        if connection.is_open():
+            self.idle.append(connection)
+        self.slots.release()
+
+    def close(self):
+        for connection in self.idle:
+            connection.close()
+        self.idle = []
+
+
+class HttpConnection:
+    def __init__(self, host_connections):
+        self.host_connections = host_connections
+        self.reader = None
+        self.writer = None
+        self.reused = False
+
+    async def connect(self):
+        h = self.host_connections
+        self.reader, self.writer = await asyncio.open_connection(h.host, h.port, ssl=h.ssl_context)
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if h.tcp_nodelay else 0)
+        h.connections += 1
+        self.reused = False
+
+    def is_open(self):
+        return self.writer is not None and not self.writer.transport.is_closing() and not self.reader.at_eof()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+    async def round_trip(self, request, method):
+        """
+        Sends a request and reads the response.
+
+        :return: A pair of the HTTP status and the response body.
+        """
+        self.writer.write(request)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        status = int(status_line.split(b" ", 2)[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n"):
+                break
+            if not line:
+                raise asyncio.IncompleteReadError(b"", None)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304):
+            data = b""
+        elif "content-length" in headers:
+            data = await self.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            data = await self._read_chunks()
+        else:
+            # the response ends when the server closes the connection
+            data = await self.reader.read()
+            keep_alive = False
+        if headers.get("content-encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+        if not keep_alive:
+            self.close()
+        return status, data
+
+    async def _read_chunks(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b";", 1)[0], 16)
+            if size == 0:
+                # skip trailers
+                while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+
+def make_path(*parts):
+    """
+    :return: A request path of all provided parts that are not empty. Lists are joined by a comma.
+    """
+    return "/" + "/".join(urllib.parse.quote(_escape(p), b",*") for p in parts if p not in (None, "", [], ()))
+
+
+def encode_params(params):
+    if not params:
+        return ""
+    return urllib.parse.urlencode([(k, _escape(v)) for k, v in params.items() if k != client.RAW_RESPONSE_PARAM])
+
+
+def _escape(value):
+    if isinstance(value, (list, tuple)):
+        return ",".join(value)
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    else:
+        return str(value)
+
+
+def raise_error(status, data):
+    """
+    Raises the same exception that the standard client raises for an unsuccessful response.
+    """
+    import elasticsearch
+    from elasticsearch.exceptions import HTTP_EXCEPTIONS
+    error = data.decode("utf-8", errors="replace")
+    info = None
+    try:
+        info = json.loads(error)
+        error = info.get("error", error)
+        if isinstance(error, dict) and "type" in error:
+            error = error["type"]
+    except (ValueError, TypeError, AttributeError):
+        pass
+    raise HTTP_EXCEPTIONS.get(status, elasticsearch.TransportError)(status, error, info)
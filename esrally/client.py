@@ -1,11 +1,219 @@
 import gzip
+import itertools
+import json
 import logging
+import re
+import socket
+import threading
+import time
 
 import certifi
 import urllib3
 
+from esrally import exceptions
+
 logger = logging.getLogger("rally.client")
 
+# compression level for request bodies if HTTP compression is enabled (same as gzip's default)
+DEFAULT_COMPRESSION_LEVEL = 9
+
+
+class GzipCompressedBody(bytes):
+    """
+    A request body that has already been compressed with gzip (e.g. ahead of time by a parameter source). The client sends it as is,
+    regardless of whether HTTP compression is enabled.
+    """
+    pass
+
+
+def gzip_compressed(body, compression_level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    :param body: A request body as ``bytes``.
+    :param compression_level: The gzip compression level (0 - 9).
+    :return: The compressed body that the client will pass through untouched.
+    """
+    return GzipCompressedBody(gzip.compress(body, compresslevel=compression_level))
+
+
+# request parameter that instructs the transport to return a ``RawResponse`` instead of the deserialized response. It is not sent.
+RAW_RESPONSE_PARAM = "rally_raw_response"
+
+# state of the current request per thread (shared by the connection and the transport)
+_request_context = threading.local()
+
+
+class RawResponse(bytes):
+    """
+    The body of a successful response without deserialization. Runners that need at most a few fields of a response request this
+    representation (see ``raw_response_params()``) so no time is spent on deserializing the complete response. Fields are extracted on
+    demand.
+    """
+    TOOK_PATTERN = re.compile(rb'\{\s*"took"\s*:\s*(\d+)')
+
+    def __new__(cls, data, status=None):
+        response = super().__new__(cls, data)
+        response.status = status
+        return response
+
+    @property
+    def took(self):
+        """
+        :return: The value of the top-level ``took`` field or ``None`` if the response does not start with it (Elasticsearch renders it
+                 first in e.g. search and bulk responses).
+        """
+        match = RawResponse.TOOK_PATTERN.match(self)
+        return int(match.group(1)) if match else None
+
+    def json(self):
+        """
+        :return: The deserialized response.
+        """
+        return json.loads(self.decode("utf-8"))
+
+
+def raw_response_params(params=None):
+    """
+    :param params: Request parameters. They are not modified.
+    :return: A copy of the provided request parameters that instructs a client, which has been created by ``EsClientFactory``, to return a
+             ``RawResponse``.
+    """
+    raw_params = dict(params) if params else {}
+    raw_params[RAW_RESPONSE_PARAM] = True
+    return raw_params
+
+
+class RequestTimings:
+    """
+    Breaks down the time that all requests, which are issued while it is active, spend in the client and in Elasticsearch. Times are
+    recorded by clients that have been created by ``EsClientFactory`` on the current thread. Use it as a context manager::
+
+        with client.RequestTimings() as timings:
+            es.search(index="logs", body=query)
+        print(timings.server_time, timings.wire_time)
+
+    All times are in seconds.
+    """
+    def __init__(self):
+        # number of responses that have been received
+        self.requests = 0
+        # sum of the ``took`` values that Elasticsearch has reported or ``None`` if no response contained ``took``
+        self.server_time = None
+        # time spent waiting for a connection from the pool (including establishing a new connection)
+        self.connection_wait_time = 0.0
+        # time from sending the request until the complete response has been read (excluding the connection wait time)
+        self.wire_time = 0.0
+        # time spent deserializing responses
+        self.deserialization_time = 0.0
+        self._previous = None
+
+    def add_server_time(self, took):
+        if took is not None:
+            self.server_time = (self.server_time or 0.0) + took / 1000.0
+
+    def merge(self, other):
+        """
+        Adds the timings of requests that have been recorded by ``other`` (e.g. on another thread).
+        """
+        self.requests += other.requests
+        if other.server_time is not None:
+            self.server_time = (self.server_time or 0.0) + other.server_time
+        self.connection_wait_time += other.connection_wait_time
+        self.wire_time += other.wire_time
+        self.deserialization_time += other.deserialization_time
+
+    def __enter__(self):
+        self._previous = getattr(_request_context, "timings", None)
+        _request_context.timings = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _request_context.timings = self._previous
+        self._previous = None
+        return False
+
+
+def current_request_timings():
+    """
+    :return: The ``RequestTimings`` that are active on the current thread or ``None``.
+    """
+    return getattr(_request_context, "timings", None)
+
+
+class RawResponseDeserializer:
+    """
+    Returns a ``RawResponse`` instead of deserializing the response if the current request has asked for it. It also records the
+    deserialization time and the server-side time of the response if ``RequestTimings`` are active.
+    """
+    def __init__(self, deserializer):
+        self.deserializer = deserializer
+
+    def loads(self, s, mimetype=None):
+        timings = current_request_timings()
+        if timings is None:
+            return self._loads(s, mimetype)
+        start = time.perf_counter()
+        response = self._loads(s, mimetype)
+        timings.deserialization_time += time.perf_counter() - start
+        timings.requests += 1
+        if isinstance(response, RawResponse):
+            timings.add_server_time(response.took)
+        elif isinstance(response, dict):
+            took = response.get("took")
+            if isinstance(took, int):
+                timings.add_server_time(took)
+        return response
+
+    def _loads(self, s, mimetype):
+        if getattr(_request_context, "raw", False):
+            # ``ConfigurableHttpConnection`` does not decode raw responses. Other connection classes always do.
+            return RawResponse(s.encode("utf-8") if isinstance(s, str) else s, getattr(_request_context, "status", None))
+        return self.deserializer.loads(s, mimetype)
+
+
+class LeastLoadedSelector:
+    """
+    Selects the connection with the fewest outstanding requests. Ties are broken round-robin so idle nodes are used evenly.
+    """
+    def __init__(self, opts):
+        self.connection_opts = opts
+        self.offset = itertools.count()
+
+    def select(self, connections):
+        start = next(self.offset) % len(connections)
+        return min(connections[start:] + connections[:start], key=lambda c: getattr(c, "in_flight", 0))
+
+
+def _selector_class(name):
+    from elasticsearch import connection_pool
+    selectors = {
+        "round-robin": connection_pool.RoundRobinSelector,
+        "random": connection_pool.RandomSelector,
+        "least-loaded": LeastLoadedSelector
+    }
+    try:
+        return selectors[name]
+    except KeyError:
+        raise exceptions.SystemSetupError("Unknown host selector [%s]. Use one of %s." % (name, sorted(selectors.keys())))
+
+
+def connection_stats(es):
+    """
+    :param es: A client that has been created by ``EsClientFactory``.
+    :return: A list with one dict per host that contains the number of requests that have been sent to this host, the number of connections
+             that have been opened and how many requests have reused an existing connection.
+    """
+    stats = []
+    for connection in es.transport.connection_pool.connections:
+        requests = connection.pool.num_requests
+        connections = connection.pool.num_connections
+        stats.append({
+            "host": connection.host,
+            "requests": requests,
+            "connections": connections,
+            "reused": max(requests - connections, 0)
+        })
+    return stats
+
 
 class EsClientFactory:
     """
@@ -29,15 +237,47 @@ class EsClientFactory:
             return False
 
     def create(self):
+        opts = dict(self.client_options)
+        if "host_selector" in opts:
+            opts["selector_class"] = _selector_class(opts.pop("host_selector"))
+        pre_connect = opts.pop("pre_connect", False)
+
         class PoolWrap(object):
-            def __init__(self, pool, compressed=False, **kwargs):
+            def __init__(self, pool, compressed=False, compression_level=DEFAULT_COMPRESSION_LEVEL, **kwargs):
                 self.pool = pool
                 self.compressed = compressed
+                self.compression_level = compression_level
+                # urllib3 has no hook to observe how long a request waits for a connection so we time the pool's internal method
+                get_conn = pool._get_conn
+
+                def timed_get_conn(*args, **kwargs):
+                    timings = current_request_timings()
+                    if timings is None:
+                        return get_conn(*args, **kwargs)
+                    start = time.perf_counter()
+                    try:
+                        return get_conn(*args, **kwargs)
+                    finally:
+                        timings.connection_wait_time += time.perf_counter() - start
+
+                pool._get_conn = timed_get_conn
 
             def urlopen(self, method, url, body, retries, headers, **kw):
-                if body is not None and self.compressed:
-                    body = gzip.compress(body)
-                return self.pool.urlopen(method, url, body=body, retries=retries, headers=headers, **kw)
+                if isinstance(body, GzipCompressedBody):
+                    if not self.compressed:
+                        headers = dict(headers)
+                        headers["Content-Encoding"] = "gzip"
+                elif body is not None and self.compressed:
+                    body = gzip.compress(body, compresslevel=self.compression_level)
+                timings = current_request_timings()
+                if timings is None:
+                    return self.pool.urlopen(method, url, body=body, retries=retries, headers=headers, **kw)
+                connection_wait_time = timings.connection_wait_time
+                start = time.perf_counter()
+                try:
+                    return self.pool.urlopen(method, url, body=body, retries=retries, headers=headers, **kw)
+                finally:
+                    timings.wire_time += time.perf_counter() - start - (timings.connection_wait_time - connection_wait_time)
 
             def __getattr__(self, attr_name):
                 return getattr(self.pool, attr_name)
@@ -45,11 +285,116 @@ class EsClientFactory:
         import elasticsearch
 
         class ConfigurableHttpConnection(elasticsearch.Urllib3HttpConnection):
-            def __init__(self, compressed=False, **kwargs):
+            def __init__(self, compressed=False, compression_level=DEFAULT_COMPRESSION_LEVEL, tcp_nodelay=True, tcp_keepalive=False,
+                         **kwargs):
                 super(ConfigurableHttpConnection, self).__init__(**kwargs)
                 if compressed:
                     self.headers.update(urllib3.make_headers(accept_encoding=True))
                     self.headers.update({"Content-Encoding": "gzip"})
-                self.pool = PoolWrap(self.pool, **kwargs)
+                self.pool.conn_kw["socket_options"] = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if tcp_nodelay else 0),
+                                                       (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1 if tcp_keepalive else 0)]
+                self.pool = PoolWrap(self.pool, compressed=compressed, compression_level=compression_level, **kwargs)
+                # number of outstanding requests (used by ``LeastLoadedSelector``)
+                self.in_flight = 0
+                self.in_flight_lock = threading.Lock()
+
+            def perform_request(self, *args, **kwargs):
+                with self.in_flight_lock:
+                    self.in_flight += 1
+                try:
+                    if getattr(_request_context, "raw", False):
+                        status, headers, data = self.perform_raw_request(*args, **kwargs)
+                    else:
+                        status, headers, data = super(ConfigurableHttpConnection, self).perform_request(*args, **kwargs)
+                finally:
+                    with self.in_flight_lock:
+                        self.in_flight -= 1
+                _request_context.status = status
+                return status, headers, data
+
+            def perform_raw_request(self, method, url, params=None, body=None, timeout=None, ignore=()):
+                """
+                Equivalent of ``Urllib3HttpConnection.perform_request`` that returns the body of a successful response as is instead of
+                decoding it to a string (which ``RawResponseDeserializer`` would only need to encode again).
+                """
+                from elasticsearch.compat import urlencode
+                url = self.url_prefix + url
+                if params:
+                    url = "%s?%s" % (url, urlencode(params))
+                full_url = self.host + url
+
+                start = time.time()
+                try:
+                    kw = {"timeout": timeout} if timeout else {}
+                    response = self.pool.urlopen(method, url, body, retries=False, headers=self.headers, **kw)
+                    duration = time.time() - start
+                    raw_data = response.data
+                except Exception as e:
+                    self.log_request_fail(method, full_url, url, body, time.time() - start, exception=e)
+                    if isinstance(e, urllib3.exceptions.SSLError):
+                        raise elasticsearch.SSLError("N/A", str(e), e)
+                    if isinstance(e, urllib3.exceptions.ReadTimeoutError):
+                        raise elasticsearch.ConnectionTimeout("TIMEOUT", str(e), e)
+                    raise elasticsearch.ConnectionError("N/A", str(e), e)
+
+                if not (200 <= response.status < 300) and response.status not in ignore:
+                    # errors are reported exactly like by the standard connection
+                    error_data = raw_data.decode("utf-8")
+                    self.log_request_fail(method, full_url, url, body, duration, response.status, error_data)
+                    self._raise_error(response.status, error_data)
+
+                self.log_request_success(method, full_url, url, body, response.status, raw_data, duration)
+                return response.status, response.getheaders(), raw_data
+
+            def pre_connect(self, number_of_connections):
+                """
+                Opens up to ``number_of_connections`` connections (at most the pool size) so no request needs to wait for a connection to
+                be established.
+                """
+                pool = self.pool.pool
+                connections = []
+                try:
+                    for _ in range(min(number_of_connections, pool.pool.maxsize)):
+                        connection = pool._get_conn()
+                        connections.append(connection)
+                        if connection.sock is None:
+                            connection.connect()
+                finally:
+                    for connection in connections:
+                        pool._put_conn(connection)
+
+        class RawResponseTransport(elasticsearch.Transport):
+            """
+            Supports ``RAW_RESPONSE_PARAM`` in addition to all features of the standard transport.
+            """
+            def __init__(self, *args, **kwargs):
+                super(RawResponseTransport, self).__init__(*args, **kwargs)
+                self.deserializer = RawResponseDeserializer(self.deserializer)
+
+            def perform_request(self, method, url, params=None, body=None):
+                _request_context.raw = params.pop(RAW_RESPONSE_PARAM, False) if params else False
+                try:
+                    return super(RawResponseTransport, self).perform_request(method, url, params=params, body=body)
+                finally:
+                    _request_context.raw = False
+
+            def _get_sniff_data(self, initial=False):
+                # sniffing may happen in the middle of a request (see ``get_connection()`` and ``mark_dead()``) but node info is always
+                # needed as a dict
+                raw = getattr(_request_context, "raw", False)
+                _request_context.raw = False
+                try:
+                    return super(RawResponseTransport, self)._get_sniff_data(initial)
+                finally:
+                    _request_context.raw = raw
 
-        return elasticsearch.Elasticsearch(hosts=self.hosts, connection_class=ConfigurableHttpConnection, **self.client_options)
+        es = elasticsearch.Elasticsearch(hosts=self.hosts, connection_class=ConfigurableHttpConnection,
+                                         transport_class=RawResponseTransport, **opts)
+        if pre_connect:
+            number_of_connections = opts.get("maxsize", 10) if pre_connect is True else int(pre_connect)
+            for connection in es.transport.connection_pool.connections:
+                try:
+                    connection.pre_connect(number_of_connections)
+                except Exception:
+                    logger.exception("Could not open connections to [%s] in advance." % connection.host)
+        return es
@@ -0,0 +1,344 @@
+import math
+from collections import Counter
+
+# maximum number of latency / service time values per task, second and sample type that are stored in the metrics store
+DEFAULT_MAX_VALUES_PER_SECOND = 1000
+
+# request meta-data keys that describe an error. They are counted per distinct combination instead of being summed up.
+ERROR_META_DATA_KEYS = ["error-type", "http-status", "error-description"]
+
+
+class Histogram:
+    """
+    A histogram with logarithmic buckets. The relative error of each recorded value is bounded by the provided precision. Histograms
+    with the same precision can be merged.
+    """
+
+    # bucket for all values <= 0
+    ZERO_BUCKET = -(2 ** 31)
+
+    def __init__(self, precision=0.01):
+        self.precision = precision
+        self.log_base = math.log1p(precision)
+        # bucket index -> count
+        self.counts = {}
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        idx = self._index(value)
+        self.counts[idx] = self.counts.get(idx, 0) + count
+        self.count += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError("Cannot merge histograms with precision [%s] and [%s]." % (str(self.precision), str(other.precision)))
+        for idx, count in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def _index(self, value):
+        if value <= 0:
+            return Histogram.ZERO_BUCKET
+        return math.floor(math.log(value) / self.log_base)
+
+    def _value(self, idx):
+        if idx == Histogram.ZERO_BUCKET:
+            return 0.0
+        # use the geometric center of the bucket but never report a value outside of the actually recorded range
+        return min(max(math.exp((idx + 0.5) * self.log_base), self.min), self.max)
+
+    def summary(self):
+        """
+        :return: A dict with the exact number, minimum, maximum and mean of all recorded values.
+        """
+        return {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.sum / self.count if self.count > 0 else None
+        }
+
+    def values(self, limit=None):
+        """
+        Provides representative values for all recorded values in ascending order.
+
+        :param limit: The maximum number of values to return. If more values have been recorded, evenly spaced quantiles are returned
+                      instead (default: None, i.e. one value per recorded value).
+        :return: A list of representative values.
+        """
+        buckets = sorted(self.counts.items())
+        if limit is None or self.count <= limit:
+            result = []
+            for idx, count in buckets:
+                result.extend([self._value(idx)] * count)
+            return result
+        result = []
+        cumulative = 0
+        k = 0
+        for idx, count in buckets:
+            cumulative += count
+            # the k-th quantile is at rank (k + 0.5) / limit * self.count
+            while k < limit and (k + 0.5) * self.count / limit < cumulative:
+                result.append(self._value(idx))
+                k += 1
+        return result
+
+
+class Throughput:
+    """
+    Aggregated throughput information of one task within one second.
+    """
+
+    def __init__(self, unit):
+        self.unit = unit
+        self.total_ops = 0
+        self.absolute_time = None
+        self.relative_time = None
+
+    def add(self, total_ops, absolute_time, relative_time):
+        self.total_ops += total_ops
+        self.absolute_time = absolute_time if self.absolute_time is None else max(self.absolute_time, absolute_time)
+        self.relative_time = relative_time if self.relative_time is None else max(self.relative_time, relative_time)
+
+    def merge(self, other):
+        self.add(other.total_ops, other.absolute_time, other.relative_time)
+
+
+class RequestMetrics:
+    """
+    Aggregated latency, service time and request meta-data of one task within one second for either successful or failed requests.
+    """
+
+    def __init__(self, precision):
+        self.precision = precision
+        self.latency = Histogram(precision)
+        self.service_time = Histogram(precision)
+        self.schedule_lag = Histogram(precision)
+        # metric name -> Histogram for the breakdown of the service time (only for metrics that have been recorded)
+        self.time_breakdown = {}
+        # (error-type, http-status, error-description) -> number of requests
+        self.errors = Counter()
+        # meta-data key -> sum of its numeric values (e.g. the number of indexed documents of bulk requests)
+        self.meta_data_totals = {}
+        self.absolute_time = None
+        self.relative_time = None
+
+    def add(self, sample):
+        self._add_meta_data(sample.request_meta_data)
+        self.latency.record(sample.latency_ms)
+        self.service_time.record(sample.service_time_ms)
+        if sample.schedule_lag_ms is not None:
+            self.schedule_lag.record(sample.schedule_lag_ms)
+        for name, value in sample.request_time_breakdown():
+            if value is not None:
+                if name not in self.time_breakdown:
+                    self.time_breakdown[name] = Histogram(self.precision)
+                self.time_breakdown[name].record(value)
+        self._update_time(sample.absolute_time, sample.relative_time)
+
+    def _add_meta_data(self, request_meta_data):
+        if not request_meta_data:
+            return
+        if request_meta_data.get("success", True) is False:
+            self.errors[tuple(request_meta_data.get(k) for k in ERROR_META_DATA_KEYS)] += 1
+        for k, v in request_meta_data.items():
+            # bool is a subclass of int but it does not make sense to sum it up
+            if k not in ERROR_META_DATA_KEYS and isinstance(v, (int, float)) and not isinstance(v, bool):
+                self.meta_data_totals[k] = self.meta_data_totals.get(k, 0) + v
+
+    def meta_data(self):
+        """
+        :return: A dict with the aggregated request meta-data. It contains the number of requests per distinct error in ``errors`` and the
+                 sum of all numeric request meta-data in ``totals``. If all errors are identical, their error meta-data are also provided
+                 as top-level keys like for individual samples.
+        """
+        result = {}
+        if self.errors:
+            result["errors"] = []
+            for error, count in sorted(self.errors.items(), key=lambda e: (-e[1], str(e[0]))):
+                e = {k: v for k, v in zip(ERROR_META_DATA_KEYS, error) if v is not None}
+                e["count"] = count
+                result["errors"].append(e)
+            if len(self.errors) == 1:
+                result.update({k: v for k, v in result["errors"][0].items() if k != "count"})
+        if self.meta_data_totals:
+            result["totals"] = dict(self.meta_data_totals)
+        return result
+
+    def merge(self, other):
+        self.errors.update(other.errors)
+        for k, v in other.meta_data_totals.items():
+            self.meta_data_totals[k] = self.meta_data_totals.get(k, 0) + v
+        self.latency.merge(other.latency)
+        self.service_time.merge(other.service_time)
+        self.schedule_lag.merge(other.schedule_lag)
+        for name, histogram in other.time_breakdown.items():
+            if name in self.time_breakdown:
+                self.time_breakdown[name].merge(histogram)
+            else:
+                self.time_breakdown[name] = histogram
+        self._update_time(other.absolute_time, other.relative_time)
+
+    def _update_time(self, absolute_time, relative_time):
+        self.absolute_time = absolute_time if self.absolute_time is None else max(self.absolute_time, absolute_time)
+        self.relative_time = relative_time if self.relative_time is None else max(self.relative_time, relative_time)
+
+
+class AggregatedSamples:
+    """
+    Aggregates samples per task, per second and per sample type. The size of this data structure depends only on the number of tasks
+    and on the covered time span but not on the number of requests. Aggregated samples can be merged.
+    """
+
+    def __init__(self, client_id=None, precision=0.01):
+        self.client_id = client_id
+        self.precision = precision
+        # the most recent progress (used for progress reporting)
+        self.percent_completed = 0
+        # number of aggregated samples
+        self.count = 0
+        # (task, second, sample type, success) -> RequestMetrics
+        self.request_metrics = {}
+        # (task, second, sample type) -> Throughput
+        self.throughput = {}
+        # task -> (absolute time, start time) of the earliest sample
+        self.first_samples = {}
+
+    def add(self, sample, request_metrics=True):
+        """
+        :param sample: A sample.
+        :param request_metrics: If ``False``, only throughput is aggregated (e.g. because request metrics have already been stored).
+        """
+        second = math.floor(sample.absolute_time)
+        if request_metrics:
+            request_meta_data = sample.request_meta_data if sample.request_meta_data else {}
+            success = request_meta_data.get("success", True) is not False
+            k = (sample.task, second, sample.sample_type, success)
+            if k not in self.request_metrics:
+                self.request_metrics[k] = RequestMetrics(self.precision)
+            self.request_metrics[k].add(sample)
+
+        k = (sample.task, second, sample.sample_type)
+        if k not in self.throughput:
+            self.throughput[k] = Throughput(sample.total_ops_unit)
+        self.throughput[k].add(sample.total_ops, sample.absolute_time, sample.relative_time)
+
+        self._update_first_sample(sample.task, (sample.absolute_time, sample.absolute_time - sample.time_period))
+        self.percent_completed = sample.percent_completed
+        self.count += 1
+
+    def add_all(self, samples, request_metrics=True):
+        for sample in samples:
+            self.add(sample, request_metrics)
+        return self
+
+    def merge(self, other):
+        for k, v in other.request_metrics.items():
+            if k in self.request_metrics:
+                self.request_metrics[k].merge(v)
+            else:
+                self.request_metrics[k] = v
+        for k, v in other.throughput.items():
+            if k in self.throughput:
+                self.throughput[k].merge(v)
+            else:
+                self.throughput[k] = v
+        for task, first_sample in other.first_samples.items():
+            self._update_first_sample(task, first_sample)
+        self.count += other.count
+
+    def _update_first_sample(self, task, first_sample):
+        if task not in self.first_samples or first_sample[0] < self.first_samples[task][0]:
+            self.first_samples[task] = first_sample
+
+    def start_time(self, task):
+        """
+        :return: The point in time when the earliest sample of the provided task has been started.
+        """
+        return self.first_samples[task][1]
+
+    def __len__(self):
+        return self.count
+
+    def request_metrics_values(self, max_values_per_second):
+        """
+        Provides one summary per latency, service time, schedule lag and service time breakdown histogram. Per task, second and sample type
+        at most ``max_values_per_second`` representative values are provided. If more requests have been recorded, the values are evenly
+        spaced quantiles and the ratio between successful and failed requests is retained.
+
+        :return: A generator of tuples (task, sample type, success, absolute time, relative time, metric name, list of values, summary,
+                 request meta-data). The summary is a dict with the exact ``count``, ``min``, ``max`` and ``mean`` of the histogram. See
+                 ``RequestMetrics.meta_data()`` for the request meta-data.
+        """
+        totals = {}
+        for (task, second, sample_type, success), m in self.request_metrics.items():
+            k = (task, second, sample_type)
+            totals[k] = totals.get(k, 0) + m.latency.count
+
+        for (task, second, sample_type, success), m in self.request_metrics.items():
+            total = totals[(task, second, sample_type)]
+            if total <= max_values_per_second:
+                limit = None
+            else:
+                limit = max(round(max_values_per_second * m.latency.count / total), 1)
+            histograms = [("latency", m.latency), ("service_time", m.service_time), ("schedule_lag", m.schedule_lag)]
+            histograms.extend(sorted(m.time_breakdown.items()))
+            meta_data = m.meta_data()
+            for name, histogram in histograms:
+                if histogram.count > 0:
+                    yield (task, sample_type, success, m.absolute_time, m.relative_time, name, histogram.values(limit), histogram.summary(),
+                           meta_data)
+
+
+def calculate_global_throughput(aggregated_samples, bucket_interval_secs=1):
+    """
+    Calculates global throughput based on aggregated samples. This is the equivalent of ``driver.calculate_global_throughput`` for
+    aggregated samples.
+
+    :param aggregated_samples: Aggregated samples from all load generators.
+    :param bucket_interval_secs: The bucket interval for aggregations.
+    :return: A global view of throughput samples.
+    """
+    per_task = {}
+    for (task, second, sample_type), throughput in aggregated_samples.throughput.items():
+        if task not in per_task:
+            per_task[task] = []
+        per_task[task].append((second, sample_type, throughput))
+
+    global_throughput = {}
+    for task, seconds in per_task.items():
+        global_throughput[task] = []
+        start_time = aggregated_samples.start_time(task)
+        total_count = 0
+        interval = 0
+        current_bucket = 0
+        current_sample_type = None
+        sample_count_for_current_sample_type = 0
+        throughput = None
+        for second, sample_type, throughput in sorted(seconds, key=lambda t: (t[0], t[1])):
+            # once we have seen a new sample type, we stick to it.
+            if current_sample_type is None or current_sample_type < sample_type:
+                current_sample_type = sample_type
+                sample_count_for_current_sample_type = 0
+            total_count += throughput.total_ops
+            interval = max(throughput.absolute_time - start_time, interval)
+            if interval > 0 and interval >= current_bucket:
+                sample_count_for_current_sample_type += 1
+                current_bucket = int(interval) + bucket_interval_secs
+                global_throughput[task].append((throughput.absolute_time, throughput.relative_time, current_sample_type,
+                                                total_count / interval, "%s/s" % throughput.unit))
+        if interval > 0 and sample_count_for_current_sample_type == 0:
+            global_throughput[task].append((throughput.absolute_time, throughput.relative_time, current_sample_type,
+                                            total_count / interval, "%s/s" % throughput.unit))
+    return global_throughput
+
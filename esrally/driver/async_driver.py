@@ -0,0 +1,336 @@
+import asyncio
+import concurrent.futures
+import datetime
+import logging
+import time
+
+from esrally import async_client, client, track
+from esrally.driver import async_runner, driver, runner, scheduler
+from esrally.utils import convert
+
+logger = logging.getLogger("rally.driver")
+profile_logger = logging.getLogger("rally.profile")
+
+
+class AsyncLoadGenerator(driver.LoadGenerator):
+    """
+    A load generator that drives multiple clients within a single process. Each client is represented by a coroutine on a shared event
+    loop. Built-in runners issue their requests with a non-blocking client (see ``async_runner``) so no client blocks the event loop while
+    it waits for a response.
+
+    All clients of this load generator advance in lockstep from join point to join point. Hence, the load generator reports a join point
+    only once for all of its clients (identified by its generator id).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.generator_id = None
+        self.client_ids = None
+        self.tasks_per_client = None
+        self.samplers = []
+        self.client_options = None
+        self.async_connection_stats = []
+
+    def receiveMessage(self, msg, sender):
+        if isinstance(msg, driver.StartLoadGenerators):
+            try:
+                logger.info("LoadGenerator[%d] is about to start clients %s." % (msg.generator_id, msg.client_ids))
+                self.master = sender
+                self.generator_id = msg.generator_id
+                # used by the base class for coordination and error reporting
+                self.client_id = msg.generator_id
+                self.client_ids = msg.client_ids
+                self.config = msg.config
+                self.track = msg.track
+                self.tasks_per_client = msg.tasks_per_client
+                client_factory = client.EsClientFactory(msg.config.opts("client", "hosts"),
+                                                        client_options(msg.config.opts("client", "options"), msg.tasks_per_client))
+                # the standard client is only used by custom runners that are not coroutine functions
+                self.es = client_factory.create()
+                self.client_options = client_factory.client_options
+                self.current_task = 0
+                self.cancel.clear()
+                # we need to wake up more often in test mode
+                if self.config.opts("track", "test.mode.enabled"):
+                    self.wakeup_interval = 0.5
+                self.start_timestamp = time.perf_counter()
+                track.load_track_plugins(self.config, runner.register_runner, scheduler.register_scheduler)
+                self.drive()
+            except Exception as e:
+                logger.exception("Fatal error in LoadGenerator[%d]" % msg.generator_id)
+                self.send(self.master, driver.BenchmarkFailure("Fatal error in load generator [%d]" % msg.generator_id, e))
+        else:
+            super().receiveMessage(msg, sender)
+
+    def drive(self):
+        # The allocation matrix is rectangular so all clients reach their join points at the same index.
+        join_point_index = self.current_task
+        while not isinstance(self.tasks_per_client[0][join_point_index], driver.JoinPoint):
+            join_point_index += 1
+        tasks_per_client = [[task for task in tasks[self.current_task:join_point_index] if task is not None]
+                            for tasks in self.tasks_per_client]
+
+        if any(tasks_per_client):
+            clients = []
+            for client_id, tasks in zip(self.client_ids, tasks_per_client):
+                if tasks:
+                    logger.info("LoadGenerator[%d] is executing %s for client [%d]." % (self.generator_id, tasks, client_id))
+                    client_tasks = []
+                    for task in tasks:
+                        sampler = driver.Sampler(client_id, task, self.start_timestamp)
+                        self.samplers.append(sampler)
+                        client_tasks.append((task, sampler))
+                    clients.append((client_id, client_tasks))
+            self.current_task = join_point_index
+            hosts = self.config.opts("client", "hosts")
+            self.executor_future = self.pool.submit(run, self.cancel, self.track, clients, self.es,
+                                                    lambda: async_client.AsyncEsClient(hosts, self.client_options),
+                                                    self.config.opts("driver", "profiling"))
+            self.wakeupAfter(datetime.timedelta(seconds=self.wakeup_interval))
+        else:
+            join_point = self.tasks_per_client[0][join_point_index]
+            self.current_task = join_point_index + 1
+            logger.info("LoadGenerator[%d] reached join point [%s]." % (self.generator_id, join_point))
+            if self.executor_future is not None:
+                self.async_connection_stats = self.executor_future.result()
+            self.send_samples()
+            driver.log_connection_stats(self.generator_id, client.connection_stats(self.es) + self.async_connection_stats)
+            self.async_connection_stats = []
+            self.cancel.clear()
+            self.executor_future = None
+            self.samplers = []
+            self.send(self.master, driver.JoinPointReached(self.generator_id, join_point))
+
+    def send_samples(self):
+        for sampler in self.samplers:
+            samples = sampler.samples
+            if len(samples) > 0:
+                self.send(self.master, driver.UpdateSamples(sampler.client_id,
+                                                            driver.prepare_samples(self.config, sampler.client_id, samples)))
+
+
+def client_options(options, tasks_per_client):
+    """
+    All clients of a load generator share one Elasticsearch client. Unless the user has chosen otherwise, we need to size its connection
+    pool (per host) so clients (and their in-flight requests in open-loop mode) don't wait for each other.
+
+    :param options: The client options that the user has specified (may be ``None``).
+    :param tasks_per_client: A list of tasks per client of this load generator.
+    :return: The client options to use.
+    """
+    opts = dict(options) if options else {}
+    connections = sum(driver.required_connections(tasks) for tasks in tasks_per_client)
+    if "maxsize" not in opts:
+        opts["maxsize"] = max(connections, 1)
+    elif int(opts["maxsize"]) < connections:
+        logger.warning("The client option maxsize [%s] is lower than the maximum number of concurrent requests [%d]. Requests may "
+                       "wait for a connection which adds to their latency." % (str(opts["maxsize"]), connections))
+    return opts
+
+
+def run(cancel, current_track, clients, es, create_async_client, enable_profiling=False):
+    """
+    Runs the tasks of all provided clients concurrently on a new event loop. Returns when all clients have finished their tasks.
+
+    :param cancel: A shared boolean that indicates we need to cancel execution.
+    :param current_track: The current track.
+    :param clients: A list of pairs (client id, list of (task, sampler)).
+    :param es: Elasticsearch client that will be used by runners that are not coroutine functions.
+    :param create_async_client: A function that creates the ``async_client.AsyncEsClient`` which is used by all other runners. It is
+                                called on the event loop.
+    :param enable_profiling: Enables a Python profiler for this execution (default: False).
+    :return: The connection statistics of the non-blocking client.
+    """
+    if enable_profiling:
+        import cProfile, pstats
+        import io as python_io
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    loop = asyncio.new_event_loop()
+    # custom runners that are not coroutine functions block so they are executed on a thread per client (threads are only started on
+    # demand).
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(len(clients), 1))
+    loop.set_default_executor(executor)
+
+    async def run_all():
+        async_es = create_async_client()
+        try:
+            await asyncio.gather(*[run_client(cancel, current_track, client_id, tasks, es, async_es, loop) for client_id, tasks in clients])
+        finally:
+            async_es.close()
+        return async_es.connection_stats()
+
+    try:
+        return loop.run_until_complete(run_all())
+    finally:
+        loop.close()
+        executor.shutdown()
+        if enable_profiling:
+            profiler.disable()
+            s = python_io.StringIO()
+            ps = pstats.Stats(profiler, stream=s).sort_stats("cumulative")
+            ps.print_stats()
+            client_ids = [client_id for client_id, _ in clients]
+            profile = "\n=== Profile START for clients %s ===\n" % client_ids
+            profile += s.getvalue()
+            profile += "=== Profile END for clients %s ===" % client_ids
+            profile_logger.info(profile)
+
+
+async def run_client(cancel, current_track, client_id, tasks, es, async_es, loop):
+    for task, sampler in tasks:
+        schedule = driver.schedule_for(current_track, task, client_id, runner_for=async_runner.runner_for)
+        await execute_schedule(cancel, client_id, task.operation, schedule, es, async_es, sampler, loop,
+                               driver.max_in_flight_requests(task))
+
+
+async def execute_schedule(cancel, client_id, op, schedule, es, async_es, sampler, loop, max_in_flight_requests=None):
+    """
+    Executes tasks according to the schedule for a given operation. This is the asynchronous equivalent of ``driver.execute_schedule``.
+
+    :param cancel: A shared boolean that indicates we need to cancel execution.
+    :param client_id: The id of the client that executes the operation.
+    :param op: The operation that is executed.
+    :param schedule: The schedule for this operation.
+    :param es: Elasticsearch client that will be used by runners that are not coroutine functions.
+    :param async_es: ``async_client.AsyncEsClient`` that will be used by coroutine runners.
+    :param sampler: A container to store raw samples.
+    :param loop: The event loop on which this coroutine is running.
+    :param max_in_flight_requests: If set, requests are issued in open-loop mode with at most this number of outstanding requests
+                                   (default: None, i.e. closed-loop).
+    """
+    total_start = time.perf_counter()
+    try:
+        if max_in_flight_requests:
+            await execute_open_loop_schedule(cancel, client_id, op, schedule, es, async_es, sampler, loop, total_start,
+                                             max_in_flight_requests)
+            return
+        for expected_scheduled_time, sample_type, percent_completed, runner_for_op, params in schedule:
+            if cancel.is_set():
+                logger.info("User cancelled execution.")
+                break
+            absolute_expected_schedule_time = total_start + expected_scheduled_time
+            throughput_throttled = expected_scheduled_time > 0
+            if throughput_throttled:
+                await wait_until(absolute_expected_schedule_time)
+            request_timings = client.RequestTimings()
+            start = time.perf_counter()
+            total_ops, total_ops_unit, request_meta_data = await execute_single(runner_for_op, es, async_es, params, loop,
+                                                                                request_timings=request_timings)
+            stop = time.perf_counter()
+
+            service_time = stop - start
+            # Do not calculate latency separately when we don't throttle throughput. This metric is just confusing then.
+            latency = stop - absolute_expected_schedule_time if throughput_throttled else service_time
+            schedule_lag = convert.seconds_to_ms(start - absolute_expected_schedule_time) if throughput_throttled else None
+            sampler.add(sample_type, request_meta_data, convert.seconds_to_ms(latency), convert.seconds_to_ms(service_time), total_ops,
+                        total_ops_unit, (stop - total_start), percent_completed, schedule_lag, request_timings)
+    except BaseException:
+        logger.exception("Could not execute schedule for client [%s] and operation [%s]" % (str(client_id), str(op)))
+        raise
+
+
+async def execute_open_loop_schedule(cancel, client_id, op, schedule, es, async_es, sampler, loop, total_start, max_in_flight_requests):
+    """
+    Asynchronous equivalent of ``driver.execute_open_loop_schedule``.
+    """
+    slots = asyncio.Semaphore(max_in_flight_requests)
+    # each outstanding request of a runner that is not a coroutine function occupies one thread (threads are only started on demand)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight_requests)
+    pending = set()
+    in_flight = 0
+    max_in_flight = 0
+    requests_issued = 0
+    requests_issued_late = 0
+    max_schedule_lag = 0
+
+    async def issue(expected_scheduled_time, sample_type, percent_completed, runner_for_op, params, in_flight_requests):
+        nonlocal in_flight
+        absolute_expected_schedule_time = total_start + expected_scheduled_time
+        throughput_throttled = expected_scheduled_time > 0
+        request_timings = client.RequestTimings()
+        try:
+            start = time.perf_counter()
+            schedule_lag = start - absolute_expected_schedule_time
+            total_ops, total_ops_unit, request_meta_data = await execute_single(runner_for_op, es, async_es, params, loop, executor,
+                                                                                request_timings)
+            stop = time.perf_counter()
+        finally:
+            in_flight -= 1
+            slots.release()
+        service_time = stop - start
+        latency = stop - absolute_expected_schedule_time if throughput_throttled else service_time
+        sampler.add(sample_type, request_meta_data, convert.seconds_to_ms(latency), convert.seconds_to_ms(service_time), total_ops,
+                    total_ops_unit, (stop - total_start), percent_completed,
+                    convert.seconds_to_ms(schedule_lag) if throughput_throttled else None, request_timings, in_flight_requests)
+
+    try:
+        for expected_scheduled_time, sample_type, percent_completed, runner_for_op, params in schedule:
+            if cancel.is_set():
+                logger.info("User cancelled execution.")
+                break
+            absolute_expected_schedule_time = total_start + expected_scheduled_time
+            await wait_until(absolute_expected_schedule_time)
+            # waits if the maximum number of requests is in flight
+            await slots.acquire()
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            schedule_lag = time.perf_counter() - absolute_expected_schedule_time
+            if schedule_lag > 0.001:
+                requests_issued_late += 1
+            max_schedule_lag = max(max_schedule_lag, schedule_lag)
+            requests_issued += 1
+            pending.add(loop.create_task(issue(expected_scheduled_time, sample_type, percent_completed,
+                                               async_runner.instance_per_request(runner_for_op), params, in_flight)))
+            # propagate errors as early as possible
+            done = {t for t in pending if t.done()}
+            pending -= done
+            for t in done:
+                t.result()
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        executor.shutdown(wait=False)
+
+    logger.info("Client [%s] issued [%d] requests for [%s] in open-loop mode. At most [%d] requests were in flight (limit: [%d]). "
+                "[%d] requests were issued more than 1 ms late (maximum schedule lag: [%.3f] ms)." %
+                (str(client_id), requests_issued, str(op), max_in_flight, max_in_flight_requests, requests_issued_late,
+                 convert.seconds_to_ms(max_schedule_lag)))
+
+
+async def wait_until(deadline):
+    """
+    Asynchronous equivalent of ``driver.wait_until``. Contrary to ``driver.wait_until``, it never busy-waits because that would stall all
+    other clients on the event loop. Hence, it may oversleep by the resolution of the event loop's timer.
+    """
+    rest = deadline - time.perf_counter()
+    if rest > 0:
+        await asyncio.sleep(rest)
+
+
+async def execute_single(r, es, async_es, params, loop, executor=None, request_timings=None):
+    """
+    Invokes the given runner once. Runners that are coroutine functions are awaited on the event loop and issue requests with
+    ``async_es``. All other runners are executed with ``es`` on the provided executor (default: the event loop's default executor).
+
+    :param request_timings: If provided, ``client.RequestTimings`` that record all requests of this invocation.
+    :return: a triple of: total number of operations, unit of operations, a dict of request meta data (may be None).
+    """
+    if not is_coroutine_runner(r):
+        return await loop.run_in_executor(executor, driver.execute_single, r, es, params, request_timings)
+
+    import elasticsearch
+    try:
+        with r:
+            return_value = await r(async_es.timed(request_timings) if async_es is not None else None, params)
+        return driver.unpack_return_value(return_value)
+    except elasticsearch.TransportError as e:
+        return driver.transport_error_result(e)
+    except KeyError as e:
+        raise driver.missing_parameters_error(r, params, e)
+
+
+def is_coroutine_runner(r):
+    target = r.runnable if isinstance(r, runner.DelegatingRunner) else r
+    return asyncio.iscoroutinefunction(target) or asyncio.iscoroutinefunction(getattr(target, "__call__", None))
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import time
+
+from esrally import async_client
+from esrally.driver import runner
+
+logger = logging.getLogger("rally.driver")
+
+
+def runner_for(operation_type):
+    """
+    :return: The runner for the provided operation type in asyncio mode. Built-in runners are replaced by their non-blocking equivalent
+             (that is called with an ``async_client.AsyncEsClient``). All other runners, e.g. custom runners of track plugins, are returned
+             as is.
+    """
+    r = runner.runner_for(operation_type)
+    async_runner = __ASYNC_RUNNERS.get(type(r))
+    return async_runner() if async_runner else r
+
+
+def instance_per_request(r):
+    """
+    Asynchronous equivalent of ``runner.instance_per_request``.
+    """
+    for sync_runner, async_runner in __ASYNC_RUNNERS.items():
+        if type(r) is async_runner:
+            return async_runner() if runner.is_stateful(sync_runner) else r
+    return runner.instance_per_request(r)
+
+
+class BulkIndex(runner.BulkIndex):
+    """
+    Non-blocking equivalent of ``runner.BulkIndex``.
+    """
+
+    async def __call__(self, es, params):
+        bulk_size = runner.BulkIndex.bulk_size(params)
+        body = params["body"]
+        if not isinstance(body, bytes):
+            body = ("\n".join(line if isinstance(line, str) else json.dumps(line) for line in body) + "\n").encode("utf-8")
+        response = await es.perform_request("POST", runner.BulkIndex.path(params), params=runner.BulkIndex.request_params(params),
+                                            body=body)
+        return self.meta_data(params, bulk_size, response)
+
+
+class ForceMerge(runner.ForceMerge):
+    """
+    Non-blocking equivalent of ``runner.ForceMerge``.
+    """
+
+    async def __call__(self, es, params):
+        logger.info("Force merging all indices.")
+        import elasticsearch
+        try:
+            await es.perform_request("POST", "/_all/_forcemerge")
+        except elasticsearch.TransportError as e:
+            # this is caused by older versions of Elasticsearch (< 2.1), fall back to optimize
+            if e.status_code == 400:
+                await es.perform_request("POST", "/_optimize")
+            else:
+                raise e
+
+
+class IndicesStats(runner.IndicesStats):
+    """
+    Non-blocking equivalent of ``runner.IndicesStats``.
+    """
+
+    async def __call__(self, es, params):
+        await es.perform_request("GET", "/_stats/_all")
+
+
+class NodeStats(runner.NodeStats):
+    """
+    Non-blocking equivalent of ``runner.NodeStats``.
+    """
+
+    async def __call__(self, es, params):
+        await es.perform_request("GET", "/_nodes/stats/_all")
+
+
+class Query(runner.Query):
+    """
+    Non-blocking equivalent of ``runner.Query``. Scroll contexts are cleared as soon as all pages have been retrieved. As in
+    ``runner.Query`` (which clears them when the runner's context is exited), this is included in the service time but not in the request
+    timings.
+    """
+
+    async def __call__(self, es, params):
+        if "pages" in params and "items_per_page" in params:
+            return await self.scroll_query(es, params)
+        else:
+            return await self.request_body_query(es, params)
+
+    async def request_body_query(self, es, params):
+        await es.perform_request("POST", async_client.make_path(params["index"], params["type"], "_search"),
+                                 params={"request_cache": params["use_request_cache"]}, body=params["body"])
+        return 1, "ops"
+
+    async def scroll_query(self, es, params):
+        r = (await es.perform_request("POST", async_client.make_path(params["index"], params["type"], "_search"),
+                                      params={"sort": "_doc", "scroll": "10s", "size": params["items_per_page"],
+                                              "request_cache": params["use_request_cache"]},
+                                      body=params["body"])).json()
+        # This should only happen if we concurrently create an index and start searching
+        scroll_id = r.get("_scroll_id")
+        total_pages = params["pages"]
+        try:
+            # Note that starting with ES 2.0, the initial call to search() returns already the first result page
+            # so we have to retrieve one page less
+            for page in range(total_pages - 1):
+                hit_count = len(r["hits"]["hits"])
+                if hit_count == 0:
+                    # We're done prematurely. Even if we are on page index zero, we still made one call.
+                    return page + 1, "ops"
+                r = (await es.perform_request("POST", "/_search/scroll", body={"scroll_id": scroll_id, "scroll": "10s"})).json()
+            return total_pages, "ops"
+        finally:
+            if scroll_id:
+                await clear_scroll(es.timed(None), [scroll_id])
+
+
+class SlicedScroll(runner.SlicedScroll):
+    """
+    Non-blocking equivalent of ``runner.SlicedScroll``. All slices are scrolled concurrently on the event loop.
+    """
+
+    async def __call__(self, es, params):
+        slices = params["slices"]
+        try:
+            results = await asyncio.gather(*[self.scroll_slice(es, params, slice_id if slices > 1 else None)
+                                             for slice_id in range(slices)])
+        finally:
+            clear_scroll_time = await self.clear_scroll(es)
+        docs = sum(slice_docs for slice_docs, _ in results)
+        page_latencies = [page_latency for _, slice_page_latencies in results for page_latency in slice_page_latencies]
+        return {
+            "weight": docs,
+            "unit": "docs",
+            "slices": slices,
+            "pages": len(page_latencies),
+            "page-latency-mean": sum(page_latencies) / len(page_latencies) if page_latencies else 0,
+            "page-latency-max": max(page_latencies) if page_latencies else 0,
+            "clear-scroll-time": clear_scroll_time
+        }
+
+    async def scroll_slice(self, es, params, slice_id):
+        body = dict(params["body"]) if params["body"] else {}
+        if slice_id is not None:
+            body["slice"] = {"id": slice_id, "max": params["slices"]}
+        max_pages = params.get("pages")
+        docs = 0
+        page_latencies = []
+        start = time.perf_counter()
+        r = (await es.perform_request("POST", async_client.make_path(params["index"], params["type"], "_search"),
+                                      params={"sort": "_doc", "scroll": params["scroll"], "size": params["items_per_page"],
+                                              "request_cache": params["use_request_cache"]},
+                                      body=body)).json()
+        page_latencies.append((time.perf_counter() - start) * 1000)
+        scroll_id = None
+        while True:
+            # the scroll id may change between pages
+            scroll_id = r.get("_scroll_id", scroll_id)
+            if scroll_id:
+                self.scroll_ids[slice_id] = scroll_id
+            hit_count = len(r["hits"]["hits"])
+            docs += hit_count
+            # there is no scroll id if we concurrently create an index and start searching
+            if not scroll_id or hit_count == 0 or (max_pages and len(page_latencies) >= max_pages):
+                break
+            start = time.perf_counter()
+            r = (await es.perform_request("POST", "/_search/scroll", body={"scroll_id": scroll_id, "scroll": params["scroll"]})).json()
+            page_latencies.append((time.perf_counter() - start) * 1000)
+        return docs, page_latencies
+
+    async def clear_scroll(self, es):
+        if not self.scroll_ids:
+            return 0
+        start = time.perf_counter()
+        try:
+            await clear_scroll(es, list(self.scroll_ids.values()))
+        finally:
+            self.scroll_ids = {}
+        return (time.perf_counter() - start) * 1000
+
+
+class MultiSearch(runner.MultiSearch):
+    """
+    Non-blocking equivalent of ``runner.MultiSearch``.
+    """
+
+    async def __call__(self, es, params):
+        queries = params["queries"]
+        response = await es.perform_request("POST", "/_msearch", body=params["body"])
+        error_count = runner.MultiSearch.error_count(response)
+        return {
+            "weight": queries,
+            "unit": "queries",
+            "success": error_count == 0,
+            "success-count": queries - error_count,
+            "error-count": error_count
+        }
+
+
+async def clear_scroll(es, scroll_ids):
+    try:
+        await es.perform_request("DELETE", "/_search/scroll", body={"scroll_id": scroll_ids})
+    except BaseException:
+        logger.exception("Could not clear scroll. This will lead to excessive resource usage in Elasticsearch and "
+                         "will skew your benchmark results.")
+
+
+# Mapping from built-in runner to its non-blocking equivalent
+__ASYNC_RUNNERS = {
+    runner.BulkIndex: BulkIndex,
+    runner.ForceMerge: ForceMerge,
+    runner.IndicesStats: IndicesStats,
+    runner.NodeStats: NodeStats,
+    runner.Query: Query,
+    runner.SlicedScroll: SlicedScroll,
+    runner.MultiSearch: MultiSearch
+}
@@ -1,15 +1,20 @@
+import array
+import bisect
 import concurrent.futures
 import threading
 import datetime
+import itertools
 import json
 import logging
-import queue
+import math
+import operator
+import os
 import socket
 import time
 
 import thespian.actors
 from esrally import actor, exceptions, metrics, track, client, PROGRAM_NAME
-from esrally.driver import runner, scheduler
+from esrally.driver import aggregation, runner, scheduler
 from esrally.utils import convert, console, versions, io
 
 logger = logging.getLogger("rally.driver")
@@ -57,6 +62,49 @@ class StartLoadGenerator:
         self.tasks = tasks
 
 
+class StartLoadGenerators:
+    """
+    Starts a load generator that drives multiple clients.
+    """
+
+    def __init__(self, generator_id, client_ids, config, track, tasks_per_client):
+        """
+        :param generator_id: Id of the load generator. It is used for coordination with the master.
+        :param client_ids: Ids of all clients that are driven by this load generator.
+        :param config: Rally internal configuration object.
+        :param track: The track to use.
+        :param tasks_per_client: Tasks to run. One list of tasks per client in the same order as ``client_ids``.
+        """
+        self.generator_id = generator_id
+        self.client_ids = client_ids
+        self.config = config
+        self.track = track
+        self.tasks_per_client = tasks_per_client
+
+
+class PrepareTrack:
+    """
+    Tells a load driver host to prepare all track data.
+    """
+
+    def __init__(self, config, track, update_repository):
+        """
+        :param config: Rally internal configuration object.
+        :param track: The track to prepare.
+        :param update_repository: Whether the track repository needs to be updated on the target host.
+        """
+        self.config = config
+        self.track = track
+        self.update_repository = update_repository
+
+
+class TrackPrepared:
+    """
+    Indicates that a load driver host has prepared all track data.
+    """
+    pass
+
+
 class Drive:
     """
     Tells a load generator to drive (either after a join point or initially).
@@ -130,15 +178,29 @@ class Driver(actor.RallyActor):
         self.es = None
         self.metrics_store = None
         self.raw_samples = []
+        self.aggregated_samples = None
+        # in streaming mode, throughput of raw samples is aggregated per second as they arrive so raw samples can be dropped
+        self.streamed_throughput = None
+        # if enabled, we post-process samples as they arrive and flush metrics periodically
+        self.stream_metrics = False
+        self.metrics_flush_interval = None
+        self.last_metrics_flush = None
         self.currently_completed = 0
         self.clients_completed_current_step = {}
         self.current_step = -1
         self.number_of_steps = 0
         self.start_sender = None
+        self.metrics_meta_info = None
+        self.lap = None
+        self.load_driver_hosts = None
+        self.track_preparators = []
+        self.prepared_hosts = 0
         self.allocations = None
         self.join_points = None
         self.ops_per_join_point = None
         self.drivers = []
+        # minimum observed difference between the master's clock and the clock of each load generator
+        self.clock_offsets = {}
         self.progress_reporter = console.progress()
         self.progress_counter = 0
         self.quiet = False
@@ -149,6 +211,8 @@ class Driver(actor.RallyActor):
             logger.debug("Driver#receiveMessage(msg = [%s] sender = [%s])" % (str(type(msg)), str(sender)))
             if isinstance(msg, StartBenchmark):
                 self.start_benchmark(msg, sender)
+            elif isinstance(msg, TrackPrepared):
+                self.track_prepared(msg)
             elif isinstance(msg, JoinPointReached):
                 self.joinpoint_reached(msg)
             elif isinstance(msg, UpdateSamples):
@@ -156,10 +220,13 @@ class Driver(actor.RallyActor):
             elif isinstance(msg, thespian.actors.WakeupMessage):
                 if not self.finished():
                     self.update_progress_message()
+                    if self.stream_metrics:
+                        self.flush_metrics()
                     self.wakeupAfter(datetime.timedelta(seconds=Driver.WAKEUP_INTERVAL_SECONDS))
             elif isinstance(msg, BenchmarkFailure):
                 logger.error("Main driver received a fatal exception from a load generator. Shutting down.")
-                self.metrics_store.close()
+                if self.metrics_store:
+                    self.metrics_store.close()
                 self.send(self.start_sender, msg)
                 self.send(self.myAddress, thespian.actors.ActorExitRequest())
             elif isinstance(msg, BenchmarkCancelled):
@@ -170,7 +237,7 @@ class Driver(actor.RallyActor):
                 self.send(self.myAddress, thespian.actors.ActorExitRequest())
             elif isinstance(msg, thespian.actors.ActorExitRequest):
                 logger.info("Main driver received ActorExitRequest and will terminate all load generators.")
-                for driver in self.drivers:
+                for driver in self.track_preparators + self.drivers:
                     self.send(driver, thespian.actors.ActorExitRequest())
             else:
                 logger.info("Main driver received unknown message [%s] (ignoring)." % (str(msg)))
@@ -178,7 +245,7 @@ class Driver(actor.RallyActor):
             logger.exception("Main driver encountered a fatal exception. Shutting down.")
             if self.metrics_store:
                 self.metrics_store.close()
-            for driver in self.drivers:
+            for driver in self.track_preparators + self.drivers:
                 self.send(driver, thespian.actors.ActorExitRequest())
             self.send(self.start_sender, BenchmarkFailure("Could not execute benchmark", e))
             self.send(self.myAddress, thespian.actors.ActorExitRequest())
@@ -187,23 +254,57 @@ class Driver(actor.RallyActor):
         self.start_sender = sender
         self.config = msg.config
         self.track = msg.track
-
+        self.metrics_meta_info = msg.metrics_meta_info
+        self.lap = msg.lap
+
+        self.load_driver_hosts = self.config.opts("driver", "load.driver.hosts", mandatory=False, default_value=["localhost"])
+        logger.info("Preparing track [%s] on load driver hosts %s." % (self.track.name, self.load_driver_hosts))
+        for host in self.load_driver_hosts:
+            if not is_local(host) and not self.config.opts("system", "remote.benchmarking.supported", mandatory=False,
+                                                            default_value=False):
+                raise exceptions.SystemSetupError("To use the remote load driver host [%s] you need to start the Rally daemon on each "
+                                                  "machine including this one." % host)
+            preparator = self.createActor(TrackPreparationActor,
+                                          globalName="/rally/driver/track-preparation/%s" % host,
+                                          targetActorRequirements=load_driver_requirements(host))
+            self.track_preparators.append(preparator)
+            # the track repository is already up to date on the coordinator as the track has been loaded here
+            self.send(preparator, PrepareTrack(self.config, self.track, update_repository=not is_local(host)))
+
+    def track_prepared(self, msg):
+        self.prepared_hosts += 1
+        logger.info("[%d/%d] load driver hosts have prepared track [%s]." %
+                    (self.prepared_hosts, len(self.track_preparators), self.track.name))
+        if self.prepared_hosts == len(self.track_preparators):
+            for preparator in self.track_preparators:
+                self.send(preparator, thespian.actors.ActorExitRequest())
+            self.track_preparators = []
+            self.start_load_generators()
+
+    def start_load_generators(self):
         track_name = self.track.name
         challenge_name = self.track.find_challenge_or_default(self.config.opts("track", "challenge.name")).name
         selected_car_name = self.config.opts("mechanic", "car.name")
 
-        logger.info("Preparing track [%s]" % track_name)
-        # TODO #257: Reconsider this in case we distribute drivers. *For now* the driver will only be on a single machine, so we're safe.
-        track.prepare_track(self.track, self.config)
-
         logger.info("Benchmark for track [%s], challenge [%s] and car [%s] is about to start." %
                     (track_name, challenge_name, selected_car_name))
         self.quiet = self.config.opts("system", "quiet.mode", mandatory=False, default_value=False)
         self.es = client.EsClientFactory(self.config.opts("client", "hosts"), self.config.opts("client", "options")).create()
-        self.metrics_store = metrics.InMemoryMetricsStore(cfg=self.config, meta_info=msg.metrics_meta_info, lap=msg.lap)
-        invocation = self.config.opts("system", "time.start")
+        self.metrics_flush_interval = self.config.opts("driver", "metrics.flush.interval", mandatory=False)
+        if self.metrics_flush_interval is not None and self.config.opts("reporting", "datastore.type") != "elasticsearch":
+            logger.warning("Streaming metrics requires an Elasticsearch metrics store. Storing metrics after the benchmark instead.")
+            self.metrics_flush_interval = None
+        self.stream_metrics = self.metrics_flush_interval is not None
+        if self.stream_metrics:
+            logger.info("Streaming metrics to the metrics store with a flush interval of [%s] seconds." % str(self.metrics_flush_interval))
+            self.metrics_store = metrics.metrics_store(self.config, read_only=False, track=track_name, challenge=challenge_name,
+                                                       car=selected_car_name, meta_info=self.metrics_meta_info, lap=self.lap)
+            self.last_metrics_flush = time.perf_counter()
+        else:
+            self.metrics_store = metrics.InMemoryMetricsStore(cfg=self.config, meta_info=self.metrics_meta_info, lap=self.lap)
+            invocation = self.config.opts("system", "time.start")
+            self.metrics_store.open(invocation, track_name, challenge_name, selected_car_name)
         expected_cluster_health = self.config.opts("benchmarks", "cluster.health")
-        self.metrics_store.open(invocation, track_name, challenge_name, selected_car_name)
 
         self.challenge = select_challenge(self.config, self.track)
         for template in self.track.templates:
@@ -220,21 +321,48 @@ class Driver(actor.RallyActor):
         logger.info("Benchmark consists of [%d] steps executed by (at most) [%d] clients as specified by the allocation matrix:\n%s" %
                     (self.number_of_steps, len(self.allocations), self.allocations))
 
-        for client_id in range(allocator.clients):
+        load_generator_mode = self.config.opts("driver", "load.generator.mode", mandatory=False, default_value="process")
+        if load_generator_mode == "process":
+            # one client per load generator. We order load generators by client id so the client id matches the load generator's index.
+            load_generators = sorted(assign_clients(allocator.clients, self.load_driver_hosts, allocator.clients),
+                                     key=lambda load_generator: load_generator[1][0])
+            load_generator_class = LoadGenerator
+        elif load_generator_mode == "asyncio":
+            # only import the module when needed as it requires a recent Python version
+            from esrally import async_client
+            from esrally.driver import async_driver
+            async_client.check_client_options(self.config.opts("client", "options"))
+            load_generators = assign_clients(allocator.clients, self.load_driver_hosts, os.cpu_count() or 1)
+            load_generator_class = async_driver.AsyncLoadGenerator
+        else:
+            raise exceptions.SystemSetupError("Unknown load generator mode [%s]. Valid modes are [process, asyncio]." %
+                                              load_generator_mode)
+
+        for generator_id, (host, _) in enumerate(load_generators):
             self.drivers.append(
-                self.createActor(LoadGenerator,
-                                 globalName="/rally/driver/worker/%s" % str(client_id),
-                                 targetActorRequirements={"coordinator": True}))
-        for client_id, driver in enumerate(self.drivers):
-            logger.info("Starting load generator [%d]." % client_id)
-            self.send(driver, StartLoadGenerator(client_id, self.config, self.track, self.allocations[client_id]))
+                self.createActor(load_generator_class,
+                                 globalName="/rally/driver/worker/%s" % str(generator_id),
+                                 targetActorRequirements=load_driver_requirements(host)))
+        for generator_id, (driver, (host, client_ids)) in enumerate(zip(self.drivers, load_generators)):
+            if load_generator_mode == "process":
+                client_id = client_ids[0]
+                logger.info("Starting load generator [%d] on [%s]." % (client_id, host))
+                self.send(driver, StartLoadGenerator(client_id, self.config, self.track, self.allocations[client_id]))
+            else:
+                logger.info("Starting load generator [%d] for clients %s on [%s]." % (generator_id, client_ids, host))
+                self.send(driver, StartLoadGenerators(generator_id, client_ids, self.config, self.track,
+                                                      [self.allocations[client_id] for client_id in client_ids]))
 
         self.update_progress_message()
         self.wakeupAfter(datetime.timedelta(seconds=Driver.WAKEUP_INTERVAL_SECONDS))
 
     def joinpoint_reached(self, msg):
         self.currently_completed += 1
-        self.clients_completed_current_step[msg.client_id] = (msg.client_local_timestamp, time.perf_counter())
+        master_received_msg_at = time.perf_counter()
+        self.clients_completed_current_step[msg.client_id] = (msg.client_local_timestamp, master_received_msg_at)
+        # The offset consists of the actual clock difference and the message delay. The smaller the offset, the smaller the message delay.
+        offset = master_received_msg_at - msg.client_local_timestamp
+        self.clock_offsets[msg.client_id] = min(offset, self.clock_offsets.get(msg.client_id, offset))
         logger.info("[%d/%d] drivers reached join point [%d/%d]." %
                     (self.currently_completed, len(self.drivers), self.current_step + 1, self.number_of_steps))
         if self.currently_completed == len(self.drivers):
@@ -242,22 +370,33 @@ class Driver(actor.RallyActor):
                         (self.current_step + 1, self.number_of_steps))
             # we can go on to the next step
             self.currently_completed = 0
-            # make a copy and reset early to avoid any race conditions from clients that reach a join point already while we are sending...
-            clients_curr_step = self.clients_completed_current_step
+            # reset early to avoid any race conditions from clients that reach a join point already while we are sending...
             self.clients_completed_current_step = {}
             self.update_progress_message(task_finished=True)
             # clear per step
             self.most_recent_sample_per_client = {}
             self.current_step += 1
+            if self.stream_metrics:
+                # all load generators have sent their samples for this step so we can calculate throughput and forget these samples
+                logger.info("Postprocessing samples of step [%d/%d]..." % (self.current_step, self.number_of_steps))
+                self.post_process_samples()
+                self.raw_samples = []
+                self.aggregated_samples = None
+                self.streamed_throughput = None
+                self.flush_metrics(force=True)
             if self.finished():
                 logger.info("All steps completed. Shutting down.")
                 # we're done here
                 for driver in self.drivers:
                     self.send(driver, thespian.actors.ActorExitRequest())
-                logger.info("Postprocessing samples...")
-                self.post_process_samples()
-                logger.info("Sending benchmark results...")
-                self.send(self.start_sender, BenchmarkComplete(self.metrics_store.to_externalizable()))
+                if self.stream_metrics:
+                    logger.info("Metrics have already been stored in the metrics store.")
+                    self.send(self.start_sender, BenchmarkComplete(None))
+                else:
+                    logger.info("Postprocessing samples...")
+                    self.post_process_samples()
+                    logger.info("Sending benchmark results...")
+                    self.send(self.start_sender, BenchmarkComplete(self.metrics_store.to_externalizable()))
                 logger.info("Closing metrics store...")
                 self.metrics_store.close()
                 # immediately clear as we don't need it anymore and it can consume a significant amount of memory
@@ -275,8 +414,8 @@ class Driver(actor.RallyActor):
                     #             (it doesn't matter too much if we're a few ms off).
                     start_next_task = time.perf_counter() + 5.0
                 for client_id, driver in enumerate(self.drivers):
-                    client_ended_task_at, master_received_msg_at = clients_curr_step[client_id]
-                    client_start_timestamp = client_ended_task_at + (start_next_task - master_received_msg_at)
+                    # load generators may run on different machines so we convert the master's timestamp to the load generator's clock
+                    client_start_timestamp = start_next_task - self.clock_offsets[client_id]
                     logger.info("Scheduling next task for client id [%d] at their timestamp [%f] (master timestamp [%f])" %
                                 (client_id, client_start_timestamp, start_next_task))
                     self.send(driver, Drive(client_start_timestamp))
@@ -285,20 +424,63 @@ class Driver(actor.RallyActor):
         return self.current_step == self.number_of_steps
 
     def update_samples(self, msg):
-        self.raw_samples += msg.samples
+        if isinstance(msg.samples, aggregation.AggregatedSamples):
+            if self.aggregated_samples is None:
+                self.aggregated_samples = aggregation.AggregatedSamples()
+            self.aggregated_samples.merge(msg.samples)
+            # aggregated samples track the progress of their client
+            self.most_recent_sample_per_client[msg.client_id] = msg.samples
+            return
         if len(msg.samples) > 0:
             most_recent = msg.samples[-1]
             self.most_recent_sample_per_client[most_recent.client_id] = most_recent
+        if self.stream_metrics:
+            self.store_request_metrics(msg.samples)
+            # we only need throughput from now on which is aggregated per second so memory usage does not grow with the number of samples
+            if self.streamed_throughput is None:
+                self.streamed_throughput = aggregation.AggregatedSamples()
+            self.streamed_throughput.add_all(msg.samples, request_metrics=False)
+            self.flush_metrics()
+        else:
+            # keep the compact representation until we post-process samples
+            self.raw_samples.append(msg.samples)
+
+    def flush_metrics(self, force=False):
+        """
+        Flushes all buffered metrics to the metrics store if the flush interval has elapsed (only applicable in streaming mode).
+
+        :param force: True iff metrics should be flushed regardless of the flush interval.
+        """
+        now = time.perf_counter()
+        if force or now - self.last_metrics_flush >= self.metrics_flush_interval:
+            self.metrics_store.flush()
+            self.last_metrics_flush = now
+
+    def all_samples(self):
+        return itertools.chain.from_iterable(self.raw_samples)
 
     def post_process_samples(self):
-        logger.info("Storing latency and service time... ")
-        for sample in self.raw_samples:
+        if self.aggregated_samples is not None:
+            self.post_process_aggregated_samples()
+        if self.streamed_throughput is not None:
+            # we have already stored latency and service time when we have received samples
+            logger.info("Calculating throughput based on streamed samples... ")
+            self.store_global_throughput(aggregation.calculate_global_throughput(self.streamed_throughput))
+        if self.raw_samples:
+            self.store_request_metrics(self.all_samples())
+            logger.info("Calculating throughput... ")
+            self.store_global_throughput(calculate_global_throughput(self.raw_samples))
+
+    def store_request_metrics(self, samples):
+        logger.debug("Storing latency and service time... ")
+        for sample in samples:
             meta_data = self.merge(
                 self.track.meta_data,
                 self.challenge.meta_data,
                 sample.operation.meta_data,
                 sample.task.meta_data,
-                sample.request_meta_data)
+                sample.request_meta_data,
+                {"in-flight-requests": sample.in_flight_requests} if sample.in_flight_requests is not None else None)
 
             self.metrics_store.put_value_cluster_level(name="latency", value=sample.latency_ms, unit="ms", operation=sample.operation.name,
                                                        operation_type=sample.operation.type, sample_type=sample.sample_type,
@@ -310,8 +492,36 @@ class Driver(actor.RallyActor):
                                                        sample_type=sample.sample_type, absolute_time=sample.absolute_time,
                                                        relative_time=sample.relative_time, meta_data=meta_data)
 
-        logger.info("Calculating throughput... ")
-        aggregates = calculate_global_throughput(self.raw_samples)
+            for name, value in [("schedule_lag", sample.schedule_lag_ms)] + sample.request_time_breakdown():
+                if value is not None:
+                    self.metrics_store.put_value_cluster_level(name=name, value=value, unit="ms",
+                                                               operation=sample.operation.name, operation_type=sample.operation.type,
+                                                               sample_type=sample.sample_type, absolute_time=sample.absolute_time,
+                                                               relative_time=sample.relative_time, meta_data=meta_data)
+
+    def post_process_aggregated_samples(self):
+        logger.info("Storing aggregated latency and service time... ")
+        max_values = self.config.opts("driver", "aggregate.max.values.per.second", mandatory=False,
+                                      default_value=aggregation.DEFAULT_MAX_VALUES_PER_SECOND)
+        for task, sample_type, success, absolute_time, relative_time, name, values, summary, request_meta_data in \
+                self.aggregated_samples.request_metrics_values(max_values):
+            op = task.operation
+            meta_data = self.merge(
+                self.track.meta_data,
+                self.challenge.meta_data,
+                op.meta_data,
+                task.meta_data,
+                request_meta_data,
+                {"success": success, "histogram": summary})
+            # one document per histogram: the metrics store treats each representative value like an individual sample
+            self.metrics_store.put_value_cluster_level(name=name, value=values, unit="ms", operation=op.name, operation_type=op.type,
+                                                       sample_type=sample_type, absolute_time=absolute_time,
+                                                       relative_time=relative_time, meta_data=meta_data)
+
+        logger.info("Calculating throughput based on aggregated samples... ")
+        self.store_global_throughput(aggregation.calculate_global_throughput(self.aggregated_samples))
+
+    def store_global_throughput(self, aggregates):
         logger.info("Storing throughput... ")
         for task, samples in aggregates.items():
             meta_data = self.merge(
@@ -347,6 +557,33 @@ class Driver(actor.RallyActor):
                 self.progress_reporter.finish()
 
 
+class TrackPreparationActor(actor.RallyActor):
+    """
+    Prepares track data on a load driver host. There is one instance of this actor per load driver host.
+    """
+
+    def __init__(self):
+        super().__init__()
+        actor.RallyActor.configure_logging(logger)
+
+    def receiveMessage(self, msg, sender):
+        try:
+            logger.debug("TrackPreparationActor#receiveMessage(msg = [%s] sender = [%s])" % (str(type(msg)), str(sender)))
+            if isinstance(msg, PrepareTrack):
+                if msg.update_repository:
+                    track.update_track_repository(msg.config)
+                logger.info("Preparing track [%s]" % msg.track.name)
+                track.prepare_track(msg.track, msg.config)
+                self.send(sender, TrackPrepared())
+            elif isinstance(msg, thespian.actors.ActorExitRequest):
+                pass
+            else:
+                logger.info("TrackPreparationActor received unknown message [%s] (ignoring)." % (str(msg)))
+        except Exception as e:
+            logger.exception("Could not prepare track.")
+            self.send(sender, BenchmarkFailure("Could not prepare track", e))
+
+
 class LoadGenerator(actor.RallyActor):
     """
     The actual driver that applies load against the cluster.
@@ -382,7 +619,8 @@ class LoadGenerator(actor.RallyActor):
                 logger.info("LoadGenerator[%d] is about to start." % msg.client_id)
                 self.master = sender
                 self.client_id = msg.client_id
-                self.es = client.EsClientFactory(msg.config.opts("client", "hosts"), msg.config.opts("client", "options")).create()
+                self.es = client.EsClientFactory(msg.config.opts("client", "hosts"),
+                                                 client_options(msg.config.opts("client", "options"), msg.tasks)).create()
                 self.config = msg.config
                 self.track = msg.track
                 self.tasks = msg.tasks
@@ -398,7 +636,7 @@ class LoadGenerator(actor.RallyActor):
                 logger.debug("LoadGenerator[%d] is continuing its work at task index [%d] on [%f]." %
                              (self.client_id, self.current_task, msg.client_start_timestamp))
                 self.start_driving = True
-                self.wakeupAfter(datetime.timedelta(seconds=time.perf_counter() - msg.client_start_timestamp))
+                self.wakeupAfter(datetime.timedelta(seconds=max(msg.client_start_timestamp - time.perf_counter(), 0)))
             elif isinstance(msg, thespian.actors.WakeupMessage):
                 # it would be better if we could send ourselves a message at a specific time, simulate this with a boolean...
                 if self.start_driving:
@@ -442,6 +680,7 @@ class LoadGenerator(actor.RallyActor):
             if self.executor_future is not None:
                 self.executor_future.result()
             self.send_samples()
+            log_connection_stats(self.client_id, client.connection_stats(self.es))
             self.cancel.clear()
             self.executor_future = None
             self.sampler = None
@@ -452,7 +691,7 @@ class LoadGenerator(actor.RallyActor):
             schedule = schedule_for(self.track, task, self.client_id)
             self.executor_future = self.pool.submit(execute_schedule,
                                                     self.cancel, self.client_id, task.operation, schedule, self.es, self.sampler,
-                                                    profiling_enabled)
+                                                    profiling_enabled, max_in_flight_requests(task))
             self.wakeupAfter(datetime.timedelta(seconds=self.wakeup_interval))
         else:
             raise exceptions.RallyAssertionError("Unknown task type [%s]" % type(task))
@@ -461,7 +700,18 @@ class LoadGenerator(actor.RallyActor):
         if self.sampler:
             samples = self.sampler.samples
             if len(samples) > 0:
-                self.send(self.master, UpdateSamples(self.client_id, samples))
+                self.send(self.master, UpdateSamples(self.client_id, prepare_samples(self.config, self.client_id, samples)))
+
+
+def prepare_samples(cfg, client_id, samples):
+    """
+    Converts samples to the representation that is sent to the master. If sample aggregation is enabled, samples are aggregated into
+    per-second histograms so the message size does not depend on the number of requests.
+    """
+    if cfg.opts("driver", "aggregate.samples", mandatory=False, default_value=False):
+        return aggregation.AggregatedSamples(client_id).add_all(samples)
+    else:
+        return samples
 
 
 class Sampler:
@@ -469,34 +719,173 @@ class Sampler:
     Encapsulates management of gathered samples.
     """
 
-    def __init__(self, client_id, task, start_timestamp):
+    def __init__(self, client_id, task, start_timestamp, chunk_size=None):
         self.client_id = client_id
         self.task = task
         self.start_timestamp = start_timestamp
-        self.q = queue.Queue(maxsize=16384)
-
-    def add(self, sample_type, request_meta_data, latency_ms, service_time_ms, total_ops, total_ops_unit, time_period, percent_completed):
-        try:
-            self.q.put_nowait(Sample(self.client_id, time.time(), time.perf_counter() - self.start_timestamp, self.task,
-                                     sample_type, request_meta_data, latency_ms, service_time_ms, total_ops, total_ops_unit, time_period,
-                                     percent_completed))
-        except queue.Full:
-            logger.warning("Dropping sample for [%s] due to a full sampling queue." % self.task.operation.name)
+        self.chunk_size = chunk_size
+        # samples may be added concurrently (e.g. in open-loop mode) and are drained by the load generator
+        self.lock = threading.Lock()
+        self.buffer = self._new_buffer()
+
+    def _new_buffer(self):
+        return SampleBuffer(self.client_id, self.task, self.chunk_size)
+
+    def add(self, sample_type, request_meta_data, latency_ms, service_time_ms, total_ops, total_ops_unit, time_period, percent_completed,
+            schedule_lag_ms=None, request_timings=None, in_flight_requests=None):
+        with self.lock:
+            # take timestamps while holding the lock so samples of one client are always ordered by time
+            absolute_time = time.time()
+            relative_time = time.perf_counter() - self.start_timestamp
+            self.buffer.add(absolute_time, relative_time, sample_type, request_meta_data, latency_ms, service_time_ms, total_ops,
+                            total_ops_unit, time_period, percent_completed, schedule_lag_ms, request_timings, in_flight_requests)
 
     @property
     def samples(self):
-        samples = []
-        try:
-            while True:
-                samples.append(self.q.get_nowait())
-        except queue.Empty:
-            pass
+        """
+        :return: All samples that have been gathered since the last invocation as a ``SampleBuffer``.
+        """
+        with self.lock:
+            samples = self.buffer
+            self.buffer = self._new_buffer()
+        samples.trim()
         return samples
 
 
+class SampleBuffer:
+    """
+    Stores samples of one client for one task column-wise in typed arrays. Columns grow in fixed-size chunks so adding a sample never
+    copies previously gathered samples. Request meta-data are only stored for samples that deviate from the default meta-data.
+
+    A sample buffer supports ``len()``, indexing and iteration. The latter two provide ``Sample`` objects on demand.
+    """
+    DEFAULT_CHUNK_SIZE = 4096
+    DEFAULT_REQUEST_META_DATA = {"success": True}
+    # column name -> array type code
+    COLUMNS = [
+        ("absolute_time", "d"),
+        ("relative_time", "d"),
+        ("sample_type", "b"),
+        ("latency_ms", "d"),
+        ("service_time_ms", "d"),
+        ("total_ops", "d"),
+        ("total_ops_unit", "B"),
+        ("time_period", "d"),
+        ("percent_completed", "d"),
+        # NaN if undefined
+        ("schedule_lag_ms", "d"),
+        # breakdown of the service time (see ``client.RequestTimings``). NaN if undefined.
+        ("server_time_ms", "d"),
+        ("connection_wait_time_ms", "d"),
+        ("wire_time_ms", "d"),
+        ("deserialization_time_ms", "d"),
+        # number of outstanding requests in open-loop mode. 0 if undefined.
+        ("in_flight_requests", "I")
+    ]
+
+    def __init__(self, client_id, task, chunk_size=None):
+        self.client_id = client_id
+        self.task = task
+        self.chunk_size = chunk_size if chunk_size else SampleBuffer.DEFAULT_CHUNK_SIZE
+        self.size = 0
+        # one list of chunks per column
+        self.chunks = [[] for _ in SampleBuffer.COLUMNS]
+        # index -> request meta-data (only if they deviate from the default)
+        self.request_meta_data = {}
+        # total_ops_unit is stored as an index into this list
+        self.units = []
+
+    def add(self, absolute_time, relative_time, sample_type, request_meta_data, latency_ms, service_time_ms, total_ops, total_ops_unit,
+            time_period, percent_completed, schedule_lag_ms=None, request_timings=None, in_flight_requests=None):
+        pos = self.size % self.chunk_size
+        if pos == 0:
+            for chunks, (_, type_code) in zip(self.chunks, SampleBuffer.COLUMNS):
+                chunks.append(array.array(type_code, [0]) * self.chunk_size)
+        try:
+            unit = self.units.index(total_ops_unit)
+        except ValueError:
+            unit = len(self.units)
+            self.units.append(total_ops_unit)
+        if request_timings is not None and request_timings.requests > 0:
+            time_breakdown = (math.nan if request_timings.server_time is None else convert.seconds_to_ms(request_timings.server_time),
+                              convert.seconds_to_ms(request_timings.connection_wait_time),
+                              convert.seconds_to_ms(request_timings.wire_time),
+                              convert.seconds_to_ms(request_timings.deserialization_time))
+        else:
+            time_breakdown = (math.nan, math.nan, math.nan, math.nan)
+        values = (absolute_time, relative_time, sample_type, latency_ms, service_time_ms, total_ops, unit, time_period, percent_completed,
+                  math.nan if schedule_lag_ms is None else schedule_lag_ms) + time_breakdown + (in_flight_requests or 0,)
+        for chunks, value in zip(self.chunks, values):
+            chunks[-1][pos] = value
+        if request_meta_data != SampleBuffer.DEFAULT_REQUEST_META_DATA:
+            self.request_meta_data[self.size] = request_meta_data
+        self.size += 1
+
+    def trim(self):
+        """
+        Releases unused capacity of the last chunk.
+        """
+        pos = self.size % self.chunk_size
+        if pos > 0:
+            for chunks in self.chunks:
+                del chunks[-1][pos:]
+
+    def column(self, name):
+        """
+        :param name: A column name.
+        :return: An iterator over all values of the provided column.
+        """
+        idx = [column_name for column_name, _ in SampleBuffer.COLUMNS].index(name)
+        return itertools.islice(itertools.chain.from_iterable(self.chunks[idx]), self.size)
+
+    def column_array(self, name):
+        """
+        :param name: A column name.
+        :return: A typed array with all values of the provided column.
+        """
+        idx = [column_name for column_name, _ in SampleBuffer.COLUMNS].index(name)
+        result = array.array(SampleBuffer.COLUMNS[idx][1])
+        for chunk in self.chunks[idx]:
+            result.extend(chunk)
+        del result[self.size:]
+        return result
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("sample index out of range")
+        chunk, pos = divmod(index, self.chunk_size)
+        return self._sample(index, *[chunks[chunk][pos] for chunks in self.chunks])
+
+    def __iter__(self):
+        columns = [itertools.chain.from_iterable(chunks) for chunks in self.chunks]
+        for index, values in zip(range(self.size), zip(*columns)):
+            yield self._sample(index, *values)
+
+    def _sample(self, index, absolute_time, relative_time, sample_type, latency_ms, service_time_ms, total_ops, unit, time_period,
+                percent_completed, schedule_lag_ms, server_time_ms, connection_wait_time_ms, wire_time_ms, deserialization_time_ms,
+                in_flight_requests):
+        request_meta_data = self.request_meta_data.get(index)
+        if request_meta_data is None:
+            request_meta_data = dict(SampleBuffer.DEFAULT_REQUEST_META_DATA)
+        return Sample(self.client_id, absolute_time, relative_time, self.task, metrics.SampleType(sample_type), request_meta_data,
+                      latency_ms, service_time_ms, int(total_ops) if total_ops.is_integer() else total_ops, self.units[unit], time_period,
+                      percent_completed, None if math.isnan(schedule_lag_ms) else schedule_lag_ms,
+                      None if math.isnan(server_time_ms) else server_time_ms,
+                      None if math.isnan(connection_wait_time_ms) else connection_wait_time_ms,
+                      None if math.isnan(wire_time_ms) else wire_time_ms,
+                      None if math.isnan(deserialization_time_ms) else deserialization_time_ms,
+                      in_flight_requests if in_flight_requests > 0 else None)
+
+
 class Sample:
     def __init__(self, client_id, absolute_time, relative_time, task, sample_type, request_meta_data, latency_ms, service_time_ms,
-                 total_ops, total_ops_unit, time_period, percent_completed):
+                 total_ops, total_ops_unit, time_period, percent_completed, schedule_lag_ms=None, server_time_ms=None,
+                 connection_wait_time_ms=None, wire_time_ms=None, deserialization_time_ms=None, in_flight_requests=None):
         self.client_id = client_id
         self.absolute_time = absolute_time
         self.relative_time = relative_time
@@ -509,11 +898,33 @@ class Sample:
         self.total_ops_unit = total_ops_unit
         self.time_period = time_period
         self.percent_completed = percent_completed
+        # time period between the scheduled and the actual start of a request. Only defined for throttled operations.
+        self.schedule_lag_ms = schedule_lag_ms
+        # breakdown of the service time. Only defined if the runner has issued requests with a client that records timings.
+        # time that Elasticsearch has reported to process the requests ("took")
+        self.server_time_ms = server_time_ms
+        # time spent waiting for a connection
+        self.connection_wait_time_ms = connection_wait_time_ms
+        # time between sending the requests and receiving the complete responses (includes the server time)
+        self.wire_time_ms = wire_time_ms
+        # time spent deserializing the responses
+        self.deserialization_time_ms = deserialization_time_ms
+        # number of outstanding requests of this client (including this one). Only defined in open-loop mode.
+        self.in_flight_requests = in_flight_requests
 
     @property
     def operation(self):
         return self.task.operation
 
+    def request_time_breakdown(self):
+        """
+        :return: A list of (metric name, value in ms) for the breakdown of the service time. Values are ``None`` if undefined.
+        """
+        return [("server_time", self.server_time_ms),
+                ("connection_wait_time", self.connection_wait_time_ms),
+                ("wire_time", self.wire_time_ms),
+                ("deserialization_time", self.deserialization_time_ms)]
+
     def __repr__(self, *args, **kwargs):
         return "[%f; %f] [client [%s]] [%s] [%s]: [%f] ms request latency, [%f] ms service time, [%d %s]" % \
                (self.absolute_time, self.relative_time, self.client_id, self.task, self.sample_type, self.latency_ms, self.service_time_ms,
@@ -652,66 +1063,207 @@ def calculate_global_throughput(samples, bucket_interval_secs=1):
     """
     Calculates global throughput based on samples gathered from multiple load generators.
 
-    :param samples: A list containing all samples from all load generators.
+    :param samples: An iterable of ``SampleBuffer`` instances and / or of individual samples from all load generators.
     :param bucket_interval_secs: The bucket interval for aggregations.
     :return: A global view of throughput samples.
     """
-    samples_per_task = {}
-    # first we group all warmup / measurement samples by operation.
-    for sample in samples:
-        k = sample.task
-        if k not in samples_per_task:
-            samples_per_task[k] = []
-        samples_per_task[k].append(sample)
-
     global_throughput = {}
-    # with open("raw_samples.csv", "w") as sample_log:
-    #    print("client_id,absolute_time,relative_time,operation,sample_type,total_ops,time_period", file=sample_log)
-    for k, v in samples_per_task.items():
-        task = k
-        if task not in global_throughput:
-            global_throughput[task] = []
-        # sort all samples by time
-        current_samples = sorted(v, key=lambda s: s.absolute_time)
+    for task, streams in throughput_streams(samples).items():
+        global_throughput[task] = calculate_task_throughput(streams, bucket_interval_secs)
+    return global_throughput
+
+
+class ThroughputStream:
+    """
+    Holds all samples of one client for one task column-wise, ordered by time. Only columns that are relevant for calculating throughput
+    are retained.
+    """
+
+    def __init__(self):
+        self.absolute_time = array.array("d")
+        self.relative_time = array.array("d")
+        self.sample_type = array.array("b")
+        self.total_ops = array.array("d")
+        self.total_ops_unit = array.array("B")
+        self.time_period = array.array("d")
+        self.units = []
+        # number of samples that have been consumed by #advance()
+        self.consumed = 0
+        # sum of total_ops of all consumed samples
+        self.total_count = 0
+        # maximum sample type of all consumed samples
+        self.max_sample_type = None
+
+    def add_buffer(self, buffer):
+        self.absolute_time.extend(buffer.column_array("absolute_time"))
+        self.relative_time.extend(buffer.column_array("relative_time"))
+        self.sample_type.extend(buffer.column_array("sample_type"))
+        self.total_ops.extend(buffer.column_array("total_ops"))
+        self.time_period.extend(buffer.column_array("time_period"))
+        unit_mapping = [self._unit(unit) for unit in buffer.units]
+        if unit_mapping == list(range(len(unit_mapping))):
+            self.total_ops_unit.extend(buffer.column_array("total_ops_unit"))
+        else:
+            self.total_ops_unit.extend(unit_mapping[unit] for unit in buffer.column("total_ops_unit"))
+
+    def add_sample(self, sample):
+        self.absolute_time.append(sample.absolute_time)
+        self.relative_time.append(sample.relative_time)
+        self.sample_type.append(sample.sample_type)
+        self.total_ops.append(sample.total_ops)
+        self.total_ops_unit.append(self._unit(sample.total_ops_unit))
+        self.time_period.append(sample.time_period)
+
+    def _unit(self, unit):
+        try:
+            return self.units.index(unit)
+        except ValueError:
+            self.units.append(unit)
+            return len(self.units) - 1
 
+    def __len__(self):
+        return len(self.absolute_time)
+
+    def seal(self):
+        """
+        Prepares the stream for calculating throughput. No samples must be added afterwards.
+        """
+        # samples of one client are recorded in order but the wall clock might have been adjusted in the meantime
+        if any(map(operator.gt, self.absolute_time, itertools.islice(self.absolute_time, 1, None))):
+            order = sorted(range(len(self)), key=self.absolute_time.__getitem__)
+            for name in ["absolute_time", "relative_time", "sample_type", "total_ops", "total_ops_unit", "time_period"]:
+                column = getattr(self, name)
+                setattr(self, name, array.array(column.typecode, map(column.__getitem__, order)))
+        return self
+
+    def advance(self, n):
+        """
+        Consumes the first ``n`` samples. ``n`` must never decrease between invocations.
+
+        :return: A tuple with the sum of total_ops and the maximum sample type of the first ``n`` samples.
+        """
+        if n > self.consumed:
+            self.total_count += sum(self.total_ops[self.consumed:n])
+            max_sample_type = max(self.sample_type[self.consumed:n])
+            self.max_sample_type = max_sample_type if self.max_sample_type is None else max(self.max_sample_type, max_sample_type)
+            self.consumed = n
+        return self.total_count, self.max_sample_type
+
+    def first_index(self, lo, predicate):
+        """
+        :return: The index of the first sample at or after ``lo`` whose absolute time satisfies the predicate. The predicate needs to be
+                 monotonic in time. If no sample satisfies the predicate, ``len(self)`` is returned.
+        """
+        hi = len(self.absolute_time)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if predicate(self.absolute_time[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+
+def throughput_streams(samples):
+    """
+    Groups samples by task and client. Streams of one task are ordered by client id.
+    """
+    streams = {}
+    for s in samples:
+        if s.task not in streams:
+            streams[s.task] = {}
+        if s.client_id not in streams[s.task]:
+            streams[s.task][s.client_id] = ThroughputStream()
+        if isinstance(s, SampleBuffer):
+            streams[s.task][s.client_id].add_buffer(s)
+        else:
+            streams[s.task][s.client_id].add_sample(s)
+    return {task: [stream.seal() for _, stream in sorted(streams_per_client.items()) if len(stream) > 0]
+            for task, streams_per_client in streams.items()}
+
+
+def calculate_task_throughput(streams, bucket_interval_secs=1):
+    """
+    Calculates throughput for all samples of a single task.
+
+    Each client's stream is ordered by time. Thus, we never need to merge all samples. Instead, we find the next sample at which throughput
+    is reported with a binary search per client and determine the global running sum at this point in time by summing up the running sums
+    of all clients (i.e. we perform a k-way merge only at the reported samples). Running sums are calculated on slices of the typed arrays
+    so the Python-level work is proportional to the number of reported throughput samples times the number of clients and not to the
+    number of samples.
+
+    :param streams: A list of ``ThroughputStream`` instances for a task (one per client).
+    :param bucket_interval_secs: The bucket interval for aggregations.
+    :return: A list of throughput samples.
+    """
+    throughput = []
+    if len(streams) == 0:
+        return throughput
+
+    # global order of samples is by absolute time and, for identical timestamps, by client (i.e. stream)
+    first = min(range(len(streams)), key=lambda r: streams[r].absolute_time[0])
+    start_time = streams[first].absolute_time[0] - streams[first].time_period[0]
+    last = max(range(len(streams)), key=lambda r: (streams[r].absolute_time[-1], r))
+    final_sample_type = max(max(stream.sample_type) for stream in streams)
+
+    def throughput_sample(r, j):
+        absolute_time = streams[r].absolute_time[j]
         total_count = 0
-        interval = 0
-        current_bucket = 0
-        current_sample_type = current_samples[0].sample_type
-        sample_count_for_current_sample_type = 0
-        start_time = current_samples[0].absolute_time - current_samples[0].time_period
-        for sample in current_samples:
-            # print("%d,%f,%f,%s,%s,%d,%f" %
-            # (sample.client_id, sample.absolute_time, sample.relative_time, sample.operation, sample.sample_type,
-            #  sample.total_ops, sample.time_period), file=sample_log)
-
-            # once we have seen a new sample type, we stick to it.
-            if current_sample_type < sample.sample_type:
-                current_sample_type = sample.sample_type
-                sample_count_for_current_sample_type = 0
-
-            total_count += sample.total_ops
-            interval = max(sample.absolute_time - start_time, interval)
-
-            # avoid division by zero
-            if interval > 0 and interval >= current_bucket:
-                sample_count_for_current_sample_type += 1
-                current_bucket = int(interval) + bucket_interval_secs
-                throughput = (total_count / interval)
-                # we calculate throughput per second
-                global_throughput[task].append(
-                    (sample.absolute_time, sample.relative_time, current_sample_type, throughput, "%s/s" % sample.total_ops_unit))
-        # also include the last sample if we don't have one for the current sample type, even if it is below the bucket interval
-        # (mainly needed to ensure we show throughput data in test mode)
-        if interval > 0 and sample_count_for_current_sample_type == 0:
-            throughput = (total_count / interval)
-            global_throughput[task].append(
-                (sample.absolute_time, sample.relative_time, current_sample_type, throughput, "%s/s" % sample.total_ops_unit))
+        sample_type = None
+        for s, stream in enumerate(streams):
+            if s == r:
+                # samples with the same timestamp within a stream are ordered after this one
+                n = j + 1
+            elif s < r:
+                n = bisect.bisect_right(stream.absolute_time, absolute_time)
+            else:
+                n = bisect.bisect_left(stream.absolute_time, absolute_time)
+            if n > 0:
+                stream_total_count, stream_sample_type = stream.advance(n)
+                total_count += stream_total_count
+                # once we have seen a new sample type, we stick to it.
+                sample_type = stream_sample_type if sample_type is None else max(sample_type, stream_sample_type)
+        interval = absolute_time - start_time
+        # we calculate throughput per second
+        return (absolute_time, streams[r].relative_time[j], metrics.SampleType(sample_type), total_count / interval,
+                "%s/s" % streams[r].units[streams[r].total_ops_unit[j]])
+
+    # avoid division by zero
+    predicate = lambda t: t - start_time > 0
+    positions = [0] * len(streams)
+    while True:
+        candidates = []
+        for r, stream in enumerate(streams):
+            positions[r] = stream.first_index(positions[r], predicate)
+            if positions[r] < len(stream):
+                candidates.append((stream.absolute_time[positions[r]], r))
+        if not candidates:
+            break
+        _, r = min(candidates)
+        throughput.append(throughput_sample(r, positions[r]))
+        current_bucket = int(throughput[-1][0] - start_time) + bucket_interval_secs
+        predicate = lambda t, bucket=current_bucket: t - start_time >= bucket
+        positions[r] += 1
+
+    # also include the last sample if we don't have one for the current sample type, even if it is below the bucket interval
+    # (mainly needed to ensure we show throughput data in test mode)
+    if streams[last].absolute_time[-1] - start_time > 0 and (len(throughput) == 0 or throughput[-1][2] != final_sample_type):
+        throughput.append(throughput_sample(last, len(streams[last]) - 1))
+    return throughput
+
+
+def log_connection_stats(generator_id, connection_stats):
+    """
+    Logs how requests of a load generator have been distributed across hosts and how often connections have been reused.
 
-    return global_throughput
+    :param connection_stats: Connection statistics as returned by ``client.connection_stats()``.
+    """
+    for stats in connection_stats:
+        logger.info("LoadGenerator[%d] has sent [%d] requests to [%s] on [%d] connections ([%d] requests reused a connection)." %
+                    (generator_id, stats["requests"], stats["host"], stats["connections"], stats["reused"]))
 
 
-def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profiling=False):
+def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profiling=False, max_in_flight_requests=None):
     """
     Executes tasks according to the schedule for a given operation.
 
@@ -722,6 +1274,8 @@ def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profil
     :param es: Elasticsearch client that will be used to execute the operation.
     :param sampler: A container to store raw samples.
     :param enable_profiling: Enables a Python profiler for this execution (default: False).
+    :param max_in_flight_requests: If set, requests are issued in open-loop mode, i.e. at their scheduled time regardless of outstanding
+                                   responses but with at most this number of outstanding requests (default: None, i.e. closed-loop).
     """
     if enable_profiling:
         logger.debug("Enabling Python profiler for [%s]" % str(op))
@@ -735,6 +1289,9 @@ def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profil
     total_start = time.perf_counter()
     # noinspection PyBroadException
     try:
+        if max_in_flight_requests:
+            execute_open_loop_schedule(cancel, client_id, op, schedule, es, sampler, total_start, max_in_flight_requests)
+            return
         for expected_scheduled_time, sample_type, percent_completed, runner, params in schedule:
             if cancel.is_set():
                 logger.info("User cancelled execution.")
@@ -742,18 +1299,18 @@ def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profil
             absolute_expected_schedule_time = total_start + expected_scheduled_time
             throughput_throttled = expected_scheduled_time > 0
             if throughput_throttled:
-                rest = absolute_expected_schedule_time - time.perf_counter()
-                if rest > 0:
-                    time.sleep(rest)
+                wait_until(absolute_expected_schedule_time)
+            request_timings = client.RequestTimings()
             start = time.perf_counter()
-            total_ops, total_ops_unit, request_meta_data = execute_single(runner, es, params)
+            total_ops, total_ops_unit, request_meta_data = execute_single(runner, es, params, request_timings)
             stop = time.perf_counter()
 
             service_time = stop - start
             # Do not calculate latency separately when we don't throttle throughput. This metric is just confusing then.
             latency = stop - absolute_expected_schedule_time if throughput_throttled else service_time
+            schedule_lag = convert.seconds_to_ms(start - absolute_expected_schedule_time) if throughput_throttled else None
             sampler.add(sample_type, request_meta_data, convert.seconds_to_ms(latency), convert.seconds_to_ms(service_time), total_ops,
-                        total_ops_unit, (stop - total_start), percent_completed)
+                        total_ops_unit, (stop - total_start), percent_completed, schedule_lag, request_timings)
     except BaseException:
         logger.exception("Could not execute schedule")
         raise
@@ -771,47 +1328,277 @@ def execute_schedule(cancel, client_id, op, schedule, es, sampler, enable_profil
             profile_logger.info(profile)
 
 
-def execute_single(runner, es, params):
+def execute_open_loop_schedule(cancel, client_id, op, schedule, es, sampler, total_start, max_in_flight_requests):
+    """
+    Issues requests at their scheduled time regardless whether responses for earlier requests are still outstanding. This avoids that a
+    single slow response delays all subsequent requests (also known as coordinated omission). The number of outstanding requests is
+    bounded by ``max_in_flight_requests``. If this limit is reached, further requests are issued late. Each request gets its own instance
+    of runners with state across requests (e.g. an open scroll) because requests are executed concurrently.
+    """
+    in_flight = InFlightRequests(max_in_flight_requests)
+    pending = set()
+    requests_issued = 0
+    requests_issued_late = 0
+    max_schedule_lag = 0
+
+    def issue(expected_scheduled_time, sample_type, percent_completed, runner_for_op, params, in_flight_requests):
+        absolute_expected_schedule_time = total_start + expected_scheduled_time
+        throughput_throttled = expected_scheduled_time > 0
+        request_timings = client.RequestTimings()
+        try:
+            start = time.perf_counter()
+            schedule_lag = start - absolute_expected_schedule_time
+            total_ops, total_ops_unit, request_meta_data = execute_single(runner_for_op, es, params, request_timings)
+            stop = time.perf_counter()
+        finally:
+            in_flight.release()
+        service_time = stop - start
+        # latency is always measured relative to the scheduled time so it includes the time the request had to wait to be issued
+        latency = stop - absolute_expected_schedule_time if throughput_throttled else service_time
+        sampler.add(sample_type, request_meta_data, convert.seconds_to_ms(latency), convert.seconds_to_ms(service_time), total_ops,
+                    total_ops_unit, (stop - total_start), percent_completed,
+                    convert.seconds_to_ms(schedule_lag) if throughput_throttled else None, request_timings, in_flight_requests)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight_requests) as pool:
+        for expected_scheduled_time, sample_type, percent_completed, runner_for_op, params in schedule:
+            if cancel.is_set():
+                logger.info("User cancelled execution.")
+                break
+            absolute_expected_schedule_time = total_start + expected_scheduled_time
+            wait_until(absolute_expected_schedule_time)
+            # blocks if the maximum number of requests is in flight
+            in_flight_requests = in_flight.acquire()
+            schedule_lag = time.perf_counter() - absolute_expected_schedule_time
+            if schedule_lag > 0.001:
+                requests_issued_late += 1
+            max_schedule_lag = max(max_schedule_lag, schedule_lag)
+            requests_issued += 1
+            pending.add(pool.submit(issue, expected_scheduled_time, sample_type, percent_completed,
+                                    runner.instance_per_request(runner_for_op), params, in_flight_requests))
+            # propagate errors as early as possible
+            done = {f for f in pending if f.done()}
+            pending -= done
+            for f in done:
+                f.result()
+        for f in concurrent.futures.as_completed(pending):
+            f.result()
+
+    logger.info("Client [%s] issued [%d] requests for [%s] in open-loop mode. At most [%d] requests were in flight (limit: [%d]). "
+                "[%d] requests were issued more than 1 ms late (maximum schedule lag: [%.3f] ms)." %
+                (str(client_id), requests_issued, str(op), in_flight.max, max_in_flight_requests, requests_issued_late,
+                 convert.seconds_to_ms(max_schedule_lag)))
+
+
+# time.sleep() may oversleep by several hundred microseconds due to timer slack. Hence, we sleep only until shortly before the deadline
+# and busy-wait for the remaining time.
+SPIN_WAIT_SECONDS = 0.0005
+
+
+def wait_until(deadline, clock=time.perf_counter, sleep=time.sleep):
+    """
+    Waits precisely until the provided deadline.
+
+    :param deadline: The point in time (as returned by ``clock``) until which to wait.
+    :param clock: A function returning the current time in seconds (default: ``time.perf_counter``).
+    :param sleep: A function to sleep for the provided number of seconds (default: ``time.sleep``).
+    """
+    rest = deadline - clock()
+    if rest > SPIN_WAIT_SECONDS:
+        sleep(rest - SPIN_WAIT_SECONDS)
+    while clock() < deadline:
+        pass
+
+
+class InFlightRequests:
+    """
+    Tracks the number of outstanding requests in open-loop mode and bounds it by an upper limit.
+    """
+
+    def __init__(self, limit):
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.current = 0
+        self.max = 0
+
+    def acquire(self):
+        """
+        Waits until another request may be issued.
+
+        :return: The number of outstanding requests including the one that is about to be issued.
+        """
+        self._slots.acquire()
+        with self._lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+            return self.current
+
+    def release(self):
+        with self._lock:
+            self.current -= 1
+        self._slots.release()
+
+
+# the default maximum number of outstanding requests per client in open-loop mode
+DEFAULT_MAX_IN_FLIGHT_REQUESTS = 32
+# the default size of the Elasticsearch client's connection pool (per host)
+DEFAULT_MAX_CONNECTIONS = 10
+
+
+def max_in_flight_requests(task):
+    """
+    :param task: A task.
+    :return: The maximum number of outstanding requests per client if the task should run in open-loop mode, ``None`` otherwise.
+    """
+    if not task.params.get("open-loop", False):
+        return None
+    if task.params.get("target-throughput") is None and task.params.get("target-interval") is None:
+        raise exceptions.SystemSetupError("Task [%s] runs in open-loop mode which requires a target-throughput or a target-interval." %
+                                          str(task))
+    limit = task.params.get("max-in-flight-requests", DEFAULT_MAX_IN_FLIGHT_REQUESTS)
+    if not isinstance(limit, int) or limit <= 0:
+        raise exceptions.SystemSetupError("max-in-flight-requests for task [%s] must be a positive integer but was [%s]." %
+                                          (str(task), str(limit)))
+    return limit
+
+
+def required_connections(tasks):
+    """
+    :param tasks: The tasks of one client. May also contain join points and ``None``.
+    :return: The number of connections (per host) that this client needs so its requests never wait for a connection.
+    """
+    return max([max_in_flight_requests(task) or 1 for task in tasks if isinstance(task, track.Task)] + [1])
+
+
+def client_options(options, tasks):
+    """
+    In open-loop mode, a client has up to ``max-in-flight-requests`` outstanding requests. Unless the user has chosen otherwise, we need to
+    size its connection pool (per host) so these requests don't wait for a connection.
+
+    :param options: The client options that the user has specified (may be ``None``).
+    :param tasks: The tasks of one client.
+    :return: The client options to use.
+    """
+    opts = dict(options) if options else {}
+    connections = required_connections(tasks)
+    if "maxsize" not in opts:
+        if connections > DEFAULT_MAX_CONNECTIONS:
+            opts["maxsize"] = connections
+    elif int(opts["maxsize"]) < connections:
+        logger.warning("The client option maxsize [%s] is lower than the maximum number of in-flight requests [%d]. Requests may "
+                       "wait for a connection which adds to their latency." % (str(opts["maxsize"]), connections))
+    return opts
+
+
+def execute_single(runner, es, params, request_timings=None):
     """
     Invokes the given runner once and provides the runner's return value in a uniform structure.
 
+    :param request_timings: If provided, the ``client.RequestTimings`` that are active while the runner is invoked (default: None).
     :return: a triple of: total number of operations, unit of operations, a dict of request meta data (may be None).
     """
     import elasticsearch
     try:
         with runner:
-            return_value = runner(es, params)
-        if isinstance(return_value, tuple) and len(return_value) == 2:
-            total_ops, total_ops_unit = return_value
-            request_meta_data = {"success": True}
-        elif isinstance(return_value, dict):
-            total_ops = return_value.pop("weight", 1)
-            total_ops_unit = return_value.pop("unit", "ops")
-            request_meta_data = return_value
-            if "success" not in request_meta_data:
-                request_meta_data["success"] = True
-        else:
-            total_ops = 1
-            total_ops_unit = "ops"
-            request_meta_data = {"success": True}
+            if request_timings is None:
+                return_value = runner(es, params)
+            else:
+                with request_timings:
+                    return_value = runner(es, params)
+        return unpack_return_value(return_value)
     except elasticsearch.TransportError as e:
-        total_ops = 0
-        total_ops_unit = "ops"
-        request_meta_data = {
-            "success": False,
-            "error-description": e.error
-        }
-        # The ES client will return N/A for connection errors
-        if e.status_code != "N/A":
-            request_meta_data["http-status"] = e.status_code
+        return transport_error_result(e)
     except KeyError as e:
-        logger.exception("Cannot execute runner [%s]; most likely due to missing parameters." % str(runner))
-        msg = "Cannot execute [%s]. Provided parameters are: %s. Error: [%s]." % (str(runner), list(params.keys()), str(e))
-        raise exceptions.SystemSetupError(msg)
+        raise missing_parameters_error(runner, params, e)
+
 
+def unpack_return_value(return_value):
+    """
+    Converts the return value of a runner to a uniform structure.
+
+    :return: a triple of: total number of operations, unit of operations, a dict of request meta data (may be None).
+    """
+    if isinstance(return_value, tuple) and len(return_value) == 2:
+        total_ops, total_ops_unit = return_value
+        request_meta_data = {"success": True}
+    elif isinstance(return_value, dict):
+        total_ops = return_value.pop("weight", 1)
+        total_ops_unit = return_value.pop("unit", "ops")
+        request_meta_data = return_value
+        if "success" not in request_meta_data:
+            request_meta_data["success"] = True
+    else:
+        total_ops = 1
+        total_ops_unit = "ops"
+        request_meta_data = {"success": True}
     return total_ops, total_ops_unit, request_meta_data
 
 
+def transport_error_result(e):
+    """
+    Converts a transport error that has been raised by a runner to a uniform structure.
+
+    :return: a triple of: total number of operations, unit of operations, a dict of request meta data.
+    """
+    request_meta_data = {
+        "success": False,
+        "error-description": e.error
+    }
+    # The ES client will return N/A for connection errors
+    if e.status_code != "N/A":
+        request_meta_data["http-status"] = e.status_code
+    return 0, "ops", request_meta_data
+
+
+def missing_parameters_error(runner, params, e):
+    logger.exception("Cannot execute runner [%s]; most likely due to missing parameters." % str(runner))
+    msg = "Cannot execute [%s]. Provided parameters are: %s. Error: [%s]." % (str(runner), list(params.keys()), str(e))
+    return exceptions.SystemSetupError(msg)
+
+
+def is_local(host):
+    return host in ["localhost", "127.0.0.1"]
+
+
+def load_driver_requirements(host):
+    # the actor system on the coordinator node registers itself with "ip": "127.0.0.1" so we need to convert this special case.
+    if is_local(host):
+        return {"coordinator": True}
+    else:
+        return {"ip": host}
+
+
+def assign_clients(number_of_clients, hosts, generators_per_host):
+    """
+    Distributes clients round-robin across all load driver hosts and then across (at most) ``generators_per_host`` load generators on
+    each host.
+
+    :param number_of_clients: The total number of clients.
+    :param hosts: A list of load driver hosts.
+    :param generators_per_host: The maximum number of load generators per host.
+    :return: A list of pairs (host, list of client ids). There is one entry per load generator.
+    """
+    load_generators = []
+    for host_index, host in enumerate(hosts):
+        clients_on_host = list(range(host_index, number_of_clients, len(hosts)))
+        for group in group_clients(len(clients_on_host), generators_per_host):
+            load_generators.append((host, [clients_on_host[idx] for idx in group]))
+    return load_generators
+
+
+def group_clients(number_of_clients, number_of_groups):
+    """
+    Distributes client ids round-robin across (at most) the provided number of groups. Empty groups are omitted.
+
+    :param number_of_clients: The total number of clients.
+    :param number_of_groups: The maximum number of groups.
+    :return: A list of lists of client ids.
+    """
+    groups = [[] for _ in range(min(number_of_clients, number_of_groups))]
+    for client_id in range(number_of_clients):
+        groups[client_id % len(groups)].append(client_id)
+    return groups
+
+
 class JoinPoint:
     def __init__(self, id):
         self.id = id
@@ -938,20 +1725,21 @@ class Allocator:
 
 # Runs a concrete schedule on one worker client
 # Needs to determine the runners and concrete iterations per client.
-def schedule_for(current_track, task, client_index):
+def schedule_for(current_track, task, client_index, runner_for=None):
     """
     Calculates a client's schedule for a given task.
 
     :param current_track: The current track.
     :param task: The task that should be executed.
     :param client_index: The current client index.  Must be in the range [0, `task.clients').
+    :param runner_for: A function that returns the runner for an operation type (default: None, i.e. ``runner.runner_for``).
     :return: A generator for the operations the given client needs to perform for this task.
     """
     op = task.operation
     num_clients = task.clients
     sched = scheduler.scheduler_for(task.schedule, task.params)
     logger.info("Choosing [%s] for [%s]." % (sched, task))
-    runner_for_op = runner.runner_for(op.type)
+    runner_for_op = runner_for(op.type) if runner_for else runner.runner_for(op.type)
     params_for_op = track.operation_parameters(current_track, op).partition(client_index, num_clients)
 
     if task.warmup_time_period is not None or task.time_period is not None:
@@ -981,6 +1769,9 @@ def time_period_based(sched, warmup_time_period, time_period, runner, params):
     start = time.perf_counter()
     if time_period is None:
         iterations = params.size()
+        if iterations is None:
+            yield from until_exhausted(sched, warmup_time_period, runner, params)
+            return
         for it in range(0, iterations):
             sample_type = metrics.SampleType.Warmup if time.perf_counter() - start < warmup_time_period else metrics.SampleType.Normal
             percent_completed = (it + 1) / iterations
@@ -999,6 +1790,34 @@ def time_period_based(sched, warmup_time_period, time_period, runner, params):
             it += 1
 
 
+def until_exhausted(sched, warmup_time_period, runner, params):
+    """
+    Calculates the schedule for parameter sources that do not know their size upfront. The operation is executed until the parameter
+    source is exhausted and the progress is based on its estimated size.
+
+    :param sched: The scheduler for this task. Must not be None.
+    :param warmup_time_period: The time period in seconds that is considered for warmup. Must not be None; provide zero instead.
+    :param runner: The runner for a given operation.
+    :param params: The parameter source for a given operation.
+    :return: A generator for the corresponding parameters.
+    """
+    next_scheduled = 0
+    start = time.perf_counter()
+    estimated_iterations = max(params.estimated_size(), 1)
+    it = 0
+    while True:
+        try:
+            current_params = params.params()
+        except StopIteration:
+            return
+        sample_type = metrics.SampleType.Warmup if time.perf_counter() - start < warmup_time_period else metrics.SampleType.Normal
+        # the estimate might be too low
+        percent_completed = min((it + 1) / estimated_iterations, 1.0)
+        yield (next_scheduled, sample_type, percent_completed, runner, current_params)
+        next_scheduled = sched.next(next_scheduled)
+        it += 1
+
+
 def iteration_count_based(sched, warmup_iterations, iterations, runner, params):
     """
     Calculates the necessary schedule based on a given number of iterations.
@@ -1,20 +1,35 @@
+import concurrent.futures
+import json
+import re
+import threading
+import time
 import types
 import logging
 from collections import Counter, OrderedDict
 
-from esrally import exceptions, track
+from esrally import client, exceptions, track
 
 logger = logging.getLogger("rally.driver")
 
+# Elasticsearch renders the top-level "errors" flag of a bulk response before the (potentially large) array of items
+BULK_ERRORS_PATTERN = re.compile(rb'"errors"\s*:\s*(true|false)')
+
 # Mapping from operation type to specific runner
 __RUNNERS = {}
+# Built-in runner classes with state across requests (e.g. an open scroll). Each client gets its own instance of these.
+__STATEFUL_RUNNER_CLASSES = set()
 
 
 def runner_for(operation_type):
+    """
+    :return: The runner for the provided operation type. For built-in runners with state, a new instance is returned on each call (i.e.
+             for each client). All other runners are returned as registered.
+    """
     try:
-        return __RUNNERS[operation_type]
+        runner = __RUNNERS[operation_type]
     except KeyError:
         raise exceptions.RallyError("No runner available for operation type [%s]" % operation_type)
+    return runner() if is_stateful(runner) else runner
 
 
 def register_runner(operation_type, runner):
@@ -27,6 +42,28 @@ def register_runner(operation_type, runner):
         __RUNNERS[operation_type] = runner
 
 
+def _register_stateful_runner(operation_type, runner_class):
+    logger.debug("Registering stateful runner class [%s] for [%s]." % (str(runner_class), str(operation_type)))
+    __STATEFUL_RUNNER_CLASSES.add(runner_class)
+    __RUNNERS[operation_type] = runner_class
+
+
+def is_stateful(runner_class):
+    """
+    :return: ``True`` iff the provided class is a built-in runner class with state across requests.
+    """
+    return isinstance(runner_class, type) and runner_class in __STATEFUL_RUNNER_CLASSES
+
+
+def instance_per_request(runner):
+    """
+    :param runner: A runner as returned by ``runner_for``.
+    :return: A new instance if ``runner`` is a built-in runner with state across requests, otherwise ``runner`` itself. Requests that
+             are issued concurrently (i.e. in open-loop mode) need their own instance of such a runner.
+    """
+    return type(runner)() if is_stateful(type(runner)) else runner
+
+
 class Runner:
     """
     Base class for all operations against Elasticsearch.
@@ -80,7 +117,8 @@ class BulkIndex(Runner):
 
         It expects a parameter dict with the following mandatory keys:
 
-        * ``body``: containing all documents for the current bulk request.
+        * ``body``: containing all documents for the current bulk request. This is either a list of lines or a ready-to-send ``bytes``
+          object which is passed as is to Elasticsearch.
         * ``bulk-size``: the number of documents in this bulk.
         * ``action_metadata_present``: if ``True``, assume that an action and metadata line is present (meaning only half of the lines
         contain actual documents to index)
@@ -97,6 +135,10 @@ class BulkIndex(Runner):
          is enabled; numbers based on a bulk size of 500 elements and no errors). For details please refer to the respective benchmarks
          in ``benchmarks/driver``.
 
+        The response of the client is either a ``dict`` or raw ``bytes``. Raw responses are only deserialized if the items need to be
+        analyzed, i.e. if ``detailed-results`` is ``True`` or if the bulk request has failed partially. Otherwise, the runner only determines
+        the ``errors`` flag of the response.
+
 
         Returned meta data
         `
@@ -216,26 +258,43 @@ class BulkIndex(Runner):
                 ]
             }
         """
-        detailed_results = params.get("detailed-results", False)
-        bulk_params = {}
-        if "pipeline" in params:
-            bulk_params["pipeline"] = params["pipeline"]
-
         with_action_metadata = params["action_metadata_present"]
+        bulk_size = BulkIndex.bulk_size(params)
+        body = params["body"]
+        bulk_params = BulkIndex.request_params(params)
+        if isinstance(body, bytes):
+            # the client would try to serialize the body so we bypass it
+            response = es.transport.perform_request("POST", BulkIndex.path(params), params=bulk_params, body=body)
+        elif with_action_metadata:
+            # only half of the lines are documents
+            response = es.bulk(body=body, params=bulk_params)
+        else:
+            response = es.bulk(body=body, index=params["index"], doc_type=params["type"], params=bulk_params)
+        return self.meta_data(params, bulk_size, response)
+
+    @staticmethod
+    def bulk_size(params):
         try:
-            bulk_size = params["bulk-size"]
+            return params["bulk-size"]
         except KeyError:
             raise exceptions.DataError(
                 "Bulk parameter source did not provide a 'bulk-size' parameter. Please add it to your parameter source.")
 
-        if with_action_metadata:
-            # only half of the lines are documents
-            response = es.bulk(body=params["body"], params=bulk_params)
-        else:
-            response = es.bulk(body=params["body"], index=params["index"], doc_type=params["type"], params=bulk_params)
+    @staticmethod
+    def request_params(params):
+        bulk_params = {}
+        if "pipeline" in params:
+            bulk_params["pipeline"] = params["pipeline"]
+        # we only need the "errors" flag unless we analyze the items so the response is deserialized only on demand
+        return client.raw_response_params(bulk_params)
 
-        stats = self.detailed_stats(bulk_size, response) if detailed_results else self.simple_stats(bulk_size, response)
+    @staticmethod
+    def path(params):
+        return "/_bulk" if params["action_metadata_present"] else "/%s/%s/_bulk" % (params["index"], params["type"])
 
+    def meta_data(self, params, bulk_size, response):
+        detailed_results = params.get("detailed-results", False)
+        stats = self.detailed_stats(bulk_size, response) if detailed_results else self.simple_stats(bulk_size, response)
         meta_data = {
             "weight": bulk_size,
             "unit": "docs",
@@ -245,27 +304,32 @@ class BulkIndex(Runner):
         return meta_data
 
     def detailed_stats(self, bulk_size, response):
+        # Items with the same outcome are counted in one go and each distinct outcome is evaluated only once afterwards. This is much
+        # cheaper than updating all statistics for every item.
+        outcomes = Counter([(op, data.get("result"), BulkIndex._shards_key(data.get("_shards")), data["status"])
+                            for item in BulkIndex.items(response) for op, data in item.items()])
         ops = {}
         shards_histogram = OrderedDict()
         bulk_error_count = 0
-        for idx, item in enumerate(response["items"]):
-            # there is only one (top-level) item
-            op, data = next(iter(item.items()))
+        for (op, result, shards, status), count in outcomes.items():
             if op not in ops:
                 ops[op] = Counter()
-            ops[op]["item-count"] += 1
-            ops[op][data["result"]] += 1
-
-            s = data["_shards"]
-            sk = "%d-%d-%d" % (s["total"], s["successful"], s["failed"])
-            if sk not in shards_histogram:
-                shards_histogram[sk] = {
-                    "item-count": 0,
-                    "shards": s
-                }
-            shards_histogram[sk]["item-count"] += 1
-            if data["status"] > 299 or data["_shards"]["failed"] > 0:
-                bulk_error_count += 1
+            ops[op]["item-count"] += count
+            if result is not None:
+                ops[op][result] += count
+            if shards is not None:
+                if shards not in shards_histogram:
+                    shards_histogram[shards] = {
+                        "item-count": 0,
+                        "shards": {
+                            "total": shards[0],
+                            "successful": shards[1],
+                            "failed": shards[2]
+                        }
+                    }
+                shards_histogram[shards]["item-count"] += count
+            if status > 299 or (shards is not None and shards[2] > 0):
+                bulk_error_count += count
         return {
             "success": bulk_error_count == 0,
             "success-count": bulk_size - bulk_error_count,
@@ -276,8 +340,8 @@ class BulkIndex(Runner):
 
     def simple_stats(self, bulk_size, response):
         bulk_error_count = 0
-        if response["errors"]:
-            for idx, item in enumerate(response["items"]):
+        if BulkIndex.has_errors(response):
+            for item in BulkIndex.items(response):
                 data = next(iter(item.values()))
                 if data["status"] > 299 or data["_shards"]["failed"] > 0:
                     bulk_error_count += 1
@@ -287,6 +351,34 @@ class BulkIndex(Runner):
             "error-count": bulk_error_count
         }
 
+    @staticmethod
+    def has_errors(response):
+        """
+        :param response: A bulk response. Either as a ``dict`` or as raw ``bytes``.
+        :return: The value of the ``errors`` flag. For raw responses it is determined without deserializing the response.
+        """
+        if not isinstance(response, (bytes, bytearray)):
+            return response["errors"]
+        items_start = response.find(b'"items"')
+        match = BULK_ERRORS_PATTERN.search(response, 0, items_start if items_start != -1 else len(response))
+        if match is None:
+            return json.loads(response.decode("utf-8"))["errors"]
+        return match.group(1) == b"true"
+
+    @staticmethod
+    def items(response):
+        """
+        :param response: A bulk response. Either as a ``dict`` or as raw ``bytes`` which are only deserialized now.
+        :return: The items of the bulk response.
+        """
+        if isinstance(response, (bytes, bytearray)):
+            response = json.loads(response.decode("utf-8"))
+        return response["items"]
+
+    @staticmethod
+    def _shards_key(s):
+        return None if s is None else (s["total"], s["successful"], s["failed"])
+
     def __repr__(self, *args, **kwargs):
         return "bulk-index"
 
@@ -367,7 +459,9 @@ class Query(Runner):
             return self.request_body_query(es, params)
 
     def request_body_query(self, es, params):
-        es.search(index=params["index"], doc_type=params["type"], request_cache=params["use_request_cache"], body=params["body"])
+        # we don't need any field of the response so we avoid deserializing it
+        es.search(index=params["index"], doc_type=params["type"], request_cache=params["use_request_cache"], body=params["body"],
+                  params=client.raw_response_params())
         return 1, "ops"
 
     def scroll_query(self, es, params):
@@ -411,8 +505,179 @@ class Query(Runner):
         return "query"
 
 
+class SlicedScroll(Runner):
+    """
+    Retrieves all results of a query with a sliced scroll. All slices are scrolled concurrently.
+
+    It expects at least the following keys in the `params` hash:
+
+    * `index`: The index or indices against which to issue the query.
+    * `type`: See `index`
+    * `use_request_cache`: True iff the request cache should be used.
+    * `body`: Query body
+    * `slices`: Number of slices that are scrolled concurrently.
+    * `items_per_page`: Number of items to retrieve per page and slice.
+    * `scroll`: How long Elasticsearch should keep the search context alive between two pages (e.g. "10s").
+
+    The following keys are optional:
+
+    * `pages`: Number of pages to retrieve at most per slice. By default, all results are retrieved.
+
+    The runner returns the number of retrieved documents as weight (so throughput is reported in docs/s) and the following meta data:
+
+    * ``slices``: The number of slices.
+    * ``pages``: The number of pages that have been retrieved across all slices.
+    * ``page-latency-mean`` and ``page-latency-max``: The mean and maximum time in ms to retrieve a single page.
+    * ``clear-scroll-time``: The time in ms to clear all scroll contexts. It is included in the service time of the operation.
+    """
+
+    def __init__(self):
+        # slice id -> the most recent scroll id of this slice (only while the runner is executed)
+        self.scroll_ids = {}
+        self.es = None
+        # guards the request timings of the caller
+        self.lock = threading.Lock()
+
+    def __call__(self, es, params):
+        self.es = es
+        slices = params["slices"]
+        request_timings = client.current_request_timings()
+        if slices == 1:
+            results = [self.scroll_slice(es, params, None, request_timings)]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=slices) as executor:
+                results = list(executor.map(lambda slice_id: self.scroll_slice(es, params, slice_id, request_timings), range(slices)))
+
+        docs = sum(slice_docs for slice_docs, _ in results)
+        page_latencies = [page_latency for _, slice_page_latencies in results for page_latency in slice_page_latencies]
+        clear_scroll_time = self.clear_scroll()
+        return {
+            "weight": docs,
+            "unit": "docs",
+            "slices": slices,
+            "pages": len(page_latencies),
+            "page-latency-mean": sum(page_latencies) / len(page_latencies) if page_latencies else 0,
+            "page-latency-max": max(page_latencies) if page_latencies else 0,
+            "clear-scroll-time": clear_scroll_time
+        }
+
+    def scroll_slice(self, es, params, slice_id, request_timings):
+        """
+        Retrieves all pages of one slice.
+
+        :return: A pair of the number of retrieved documents and a list with the latency of each page in ms.
+        """
+        body = dict(params["body"]) if params["body"] else {}
+        if slice_id is not None:
+            body["slice"] = {"id": slice_id, "max": params["slices"]}
+        max_pages = params.get("pages")
+        docs = 0
+        page_latencies = []
+        # requests of a slice are issued on the executor's thread so they are timed separately and merged afterwards
+        slice_timings = client.RequestTimings()
+        try:
+            with slice_timings:
+                start = time.perf_counter()
+                r = es.search(index=params["index"], doc_type=params["type"], body=body, sort="_doc", scroll=params["scroll"],
+                              size=params["items_per_page"], request_cache=params["use_request_cache"])
+                page_latencies.append((time.perf_counter() - start) * 1000)
+                scroll_id = None
+                while True:
+                    # the scroll id may change between pages
+                    scroll_id = r.get("_scroll_id", scroll_id)
+                    if scroll_id:
+                        self.scroll_ids[slice_id] = scroll_id
+                    hit_count = len(r["hits"]["hits"])
+                    docs += hit_count
+                    # there is no scroll id if we concurrently create an index and start searching
+                    if not scroll_id or hit_count == 0 or (max_pages and len(page_latencies) >= max_pages):
+                        break
+                    start = time.perf_counter()
+                    r = es.scroll(body={"scroll_id": scroll_id, "scroll": params["scroll"]})
+                    page_latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            if request_timings is not None:
+                with self.lock:
+                    request_timings.merge(slice_timings)
+        return docs, page_latencies
+
+    def clear_scroll(self):
+        """
+        Clears the scroll contexts of all slices.
+
+        :return: The time in ms that it took to clear all scroll contexts.
+        """
+        if not self.scroll_ids or not self.es:
+            return 0
+        start = time.perf_counter()
+        try:
+            self.es.clear_scroll(body={"scroll_id": list(self.scroll_ids.values())})
+        except BaseException:
+            logger.exception("Could not clear scroll. This will lead to excessive resource usage in Elasticsearch and "
+                             "will skew your benchmark results.")
+        finally:
+            self.scroll_ids = {}
+        return (time.perf_counter() - start) * 1000
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # clears scroll contexts that are still open if the runner has failed
+        self.clear_scroll()
+        self.es = None
+        return False
+
+    def __repr__(self, *args, **kwargs):
+        return "sliced-scroll"
+
+
+class MultiSearch(Runner):
+    """
+    Runs multiple request body searches with one multi-search request.
+
+    It expects the following keys in the `params` hash:
+
+    * `body`: A ready-to-send multi-search request body as ``bytes`` (header and query line per query).
+    * `queries`: The number of queries in `body`.
+
+    The runner returns the number of queries as weight and the following meta data:
+
+    * ``success``: A boolean indicating whether all queries have succeeded.
+    * ``success-count``: Number of successful queries.
+    * ``error-count``: Number of failed queries.
+    """
+
+    def __call__(self, es, params):
+        queries = params["queries"]
+        response = es.transport.perform_request("POST", "/_msearch", params=client.raw_response_params(), body=params["body"])
+        error_count = MultiSearch.error_count(response)
+        return {
+            "weight": queries,
+            "unit": "queries",
+            "success": error_count == 0,
+            "success-count": queries - error_count,
+            "error-count": error_count
+        }
+
+    @staticmethod
+    def error_count(response):
+        """
+        :param response: A multi-search response either as raw ``bytes`` (e.g. a ``RawResponse``) or as ``dict``.
+        :return: The number of queries that have failed.
+        """
+        if isinstance(response, bytes):
+            # avoid deserializing the (potentially large) responses if no query has failed
+            if b'"error"' not in response:
+                return 0
+            response = json.loads(response.decode("utf-8"))
+        return sum(1 for r in response["responses"] if "error" in r)
+
+    def __repr__(self, *args, **kwargs):
+        return "msearch"
+
+
 register_runner(track.OperationType.Index.name, BulkIndex())
 register_runner(track.OperationType.ForceMerge.name, ForceMerge())
 register_runner(track.OperationType.IndicesStats.name, IndicesStats())
 register_runner(track.OperationType.NodesStats.name, NodeStats())
-register_runner(track.OperationType.Search.name, Query())
+_register_stateful_runner(track.OperationType.Search.name, Query)
+_register_stateful_runner(track.OperationType.SlicedScroll.name, SlicedScroll)
+register_runner(track.OperationType.MultiSearch.name, MultiSearch())
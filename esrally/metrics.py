@@ -141,20 +141,22 @@ class MetaInfoScope(Enum):
     """
 
 
-def metrics_store(cfg, read_only=True, invocation=None, track=None, challenge=None, car=None):
+def metrics_store(cfg, read_only=True, invocation=None, track=None, challenge=None, car=None, meta_info=None, lap=None):
     """
     Creates a proper metrics store based on the current configuration.
 
     :param cfg: Config object.
     :param read_only: Whether to open the metrics store only for reading (Default: True).
+    :param meta_info: Previously serialized meta-info (optional).
+    :param lap: The current lap (optional).
     :return: A metrics store implementation.
     """
     if cfg.opts("reporting", "datastore.type") == "elasticsearch":
         logger.info("Creating ES metrics store")
-        store = EsMetricsStore(cfg)
+        store = EsMetricsStore(cfg, meta_info=meta_info, lap=lap)
     else:
         logger.info("Creating in-memory metrics store")
-        store = InMemoryMetricsStore(cfg)
+        store = InMemoryMetricsStore(cfg, meta_info=meta_info, lap=lap)
 
     selected_invocation = cfg.opts("system", "time.start") if invocation is None else invocation
     selected_car = cfg.opts("mechanic", "car.name") if car is None else car
@@ -361,7 +363,8 @@ class MetricsStore:
         Adds a new cluster level value metric.
 
         :param name: The name of the metric.
-        :param value: The metric value. It is expected to be of type float (otherwise use put_count_*).
+        :param value: The metric value. It is expected to be of type float (otherwise use put_count_*). It may also be a list of floats
+               (e.g. representative values of a histogram). Each of them is then treated like an individual value.
         :param unit: The unit of this metric value (e.g. ms, docs/s).
         :param operation The operation name to which this value applies. Optional. Defaults to None.
         :param operation_type The operation type to which this value applies. Optional. Defaults to None.
@@ -482,7 +485,14 @@ class MetricsStore:
         :param lap The lap to query. Optional. By default, all laps are considered.
         :return: A list of all values for the given metric.
         """
-        return self._get(name, operation, operation_type, sample_type, lap, lambda doc: doc["value"])
+        values = []
+        for value in self._get(name, operation, operation_type, sample_type, lap, lambda doc: doc["value"]):
+            # one document may contain several values (see #put_value_cluster_level())
+            if isinstance(value, list):
+                values.extend(value)
+            else:
+                values.append(value)
+        return values
 
     def get_unit(self, name, operation=None, operation_type=None):
         """
@@ -648,6 +658,14 @@ class EsMetricsStore(MetricsStore):
                 "error_rate": {
                     "terms": {
                         "field": "meta.success"
+                    },
+                    "aggs": {
+                        # one document may contain several values (see #put_value_cluster_level())
+                        "request_count": {
+                            "value_count": {
+                                "field": "value"
+                            }
+                        }
                     }
                 }
             }
@@ -661,14 +679,14 @@ class EsMetricsStore(MetricsStore):
         count_errors = 0
         for bucket in buckets:
             k = bucket["key_as_string"]
-            doc_count = int(bucket["doc_count"])
-            logger.debug("Processing key [%s] with [%d] docs." % (k, doc_count))
+            request_count = int(bucket["request_count"]["value"])
+            logger.debug("Processing key [%s] with [%d] requests." % (k, request_count))
             if k == "true":
-                count_success = doc_count
+                count_success = request_count
             elif k == "false":
-                count_errors = doc_count
+                count_errors = request_count
             else:
-                logger.warning("Unrecognized bucket key [%s] with [%d] docs." % (k, doc_count))
+                logger.warning("Unrecognized bucket key [%s] with [%d] requests." % (k, request_count))
 
         if count_errors == 0:
             return 0.0
@@ -874,9 +892,11 @@ class InMemoryMetricsStore(MetricsStore):
                     (operation_type is None or doc["operation-type"] == operation_type.name) and \
                     (sample_type is None or doc["sample-type"] == sample_type.name.lower()) and \
                     (lap is None or doc["lap"] == lap):
-                total_count += 1
+                # one document may contain several values (see #put_value_cluster_level())
+                count = len(doc["value"]) if isinstance(doc["value"], list) else 1
+                total_count += count
                 if doc["meta"]["success"] is False:
-                    error += 1
+                    error += count
         if total_count > 0:
             return error / total_count
         else:
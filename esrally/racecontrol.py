@@ -133,8 +133,10 @@ class Benchmark:
 
         if isinstance(result, driver.BenchmarkComplete):
             logger.info("Benchmark is complete.")
-            logger.info("Bulk adding request metrics to metrics store.")
-            self.metrics_store.bulk_add(result.metrics)
+            # in streaming mode the driver has already stored all request metrics
+            if result.metrics is not None:
+                logger.info("Bulk adding request metrics to metrics store.")
+                self.metrics_store.bulk_add(result.metrics)
             stop_result = self.actor_system.ask(self.mechanic, mechanic.OnBenchmarkStop())
             if isinstance(stop_result, mechanic.BenchmarkStopped):
                 logger.info("Bulk adding system metrics to metrics store.")
@@ -82,6 +82,12 @@ def parse_args():
             raise argparse.ArgumentTypeError("must be positive but was %s" % value)
         return value
 
+    def non_negative_number(v):
+        value = float(v)
+        if value < 0:
+            raise argparse.ArgumentTypeError("must not be negative but was %s" % value)
+        return value
+
     # try to preload configurable defaults, but this does not work together with `--configuration-name` (which is undocumented anyway)
     cfg = config.Config()
     if cfg.config_present():
@@ -204,6 +210,10 @@ def parse_args():
             help="define a comma-separated list of host:port pairs which should be targeted iff using the pipeline 'benchmark-only' "
                  "(default: localhost:9200).",
             default="")  # actually the default is pipeline specific and it is set later
+        p.add_argument(
+            "--load-driver-hosts",
+            help="define a comma-separated list of hosts which should generate load (default: localhost).",
+            default="localhost")
         p.add_argument(
             "--client-options",
             help="define a comma-separated list of client options to use. The options will be passed to the Elasticsearch Python client "
@@ -264,6 +274,40 @@ def parse_args():
             help="Enables a profiler for analyzing the performance of calls in Rally's driver (default: false)",
             default=False,
             action="store_true")
+        p.add_argument(
+            "--load-generator-mode",
+            help="define how Rally's driver generates load. 'process' uses one process per client, 'asyncio' runs multiple clients "
+                 "per process on an event loop (default: process).",
+            choices=["process", "asyncio"],
+            default="process")
+        p.add_argument(
+            "--aggregate-samples",
+            help="Aggregate samples into per-second histograms within each load generator (default: false).",
+            default=False,
+            action="store_true")
+        p.add_argument(
+            "--metrics-flush-interval",
+            type=non_negative_number,
+            help="Stream request metrics to the metrics store during the benchmark and flush them at most every N seconds. Use 0 to flush "
+                 "on every batch of samples. Requires an Elasticsearch metrics store (default: store metrics after the benchmark).",
+            default=None)
+        p.add_argument(
+            "--stream-archives",
+            help="Index documents directly from .gz and .bz2 track data archives instead of decompressing them first (default: false).",
+            default=False,
+            action="store_true")
+        p.add_argument(
+            "--offset-table-granularity",
+            type=positive_number,
+            help="Store the file offset after every N-th line of a document file so clients can skip to their start position quickly "
+                 "(default: 50000).",
+            default=50000)
+        p.add_argument(
+            "--verify-track-data",
+            help="Calculate checksums of all track data files again. Otherwise, Rally trusts the checksum of a file as long as its size, "
+                 "modification time and inode are unchanged and does not detect silent data corruption (default: false).",
+            default=False,
+            action="store_true")
 
     ###############################################################################
     #
@@ -567,9 +611,16 @@ def main():
     ################################
     cfg.add(config.Scope.applicationOverride, "benchmarks", "cluster.health", args.cluster_health)
     cfg.add(config.Scope.applicationOverride, "driver", "profiling", args.enable_driver_profiling)
+    cfg.add(config.Scope.applicationOverride, "driver", "load.generator.mode", args.load_generator_mode)
+    cfg.add(config.Scope.applicationOverride, "driver", "aggregate.samples", args.aggregate_samples)
+    cfg.add(config.Scope.applicationOverride, "driver", "metrics.flush.interval", args.metrics_flush_interval)
+    cfg.add(config.Scope.applicationOverride, "track", "offset.table.granularity", args.offset_table_granularity)
+    cfg.add(config.Scope.applicationOverride, "track", "stream.archives", args.stream_archives)
+    cfg.add(config.Scope.applicationOverride, "track", "verify.data", args.verify_track_data)
     if sub_command != "list":
         # Also needed by mechanic (-> telemetry) - duplicate by module?
         cfg.add(config.Scope.applicationOverride, "client", "hosts", convert_hosts(csv_to_list(args.target_hosts)))
+        cfg.add(config.Scope.applicationOverride, "driver", "load.driver.hosts", csv_to_list(args.load_driver_hosts))
         client_options = kv_to_map(csv_to_list(args.client_options))
         cfg.add(config.Scope.applicationOverride, "client", "options", client_options)
         if "timeout" not in client_options:
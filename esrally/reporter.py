@@ -85,6 +85,7 @@ class Stats:
                 self.op_metrics[op]["latency"] = self.single_latency(op)
                 self.op_metrics[op]["service_time"] = self.single_latency(op, metric_name="service_time")
                 self.op_metrics[op]["error_rate"] = self.error_rate(op)
+                self.op_metrics[op]["time_breakdown"] = self.time_breakdown(op)
 
         logger.debug("Gathering indexing metrics.")
         self.total_time = self.sum("indexing_total_time")
@@ -143,6 +144,26 @@ class Stats:
         else:
             return None, None, None, unit
 
+    def mean(self, metric_name, operation_name):
+        stats = self.store.get_stats(metric_name, operation=operation_name, sample_type=metrics.SampleType.Normal, lap=self.lap)
+        return stats["avg"] if stats and stats.get("count") else None
+
+    def time_breakdown(self, operation_name):
+        """
+        :return: A dict with the mean service time and the mean of each metric that breaks it down or an empty dict if no breakdown has
+                 been recorded for this operation.
+        """
+        wire_time = self.mean("wire_time", operation_name)
+        if wire_time is None:
+            return {}
+        return {
+            "service_time": self.mean("service_time", operation_name),
+            "server_time": self.mean("server_time", operation_name),
+            "connection_wait_time": self.mean("connection_wait_time", operation_name),
+            "wire_time": wire_time,
+            "deserialization_time": self.mean("deserialization_time", operation_name)
+        }
+
     def error_rate(self, operation_name):
         return self.store.get_error_rate(operation=operation_name, sample_type=metrics.SampleType.Normal, lap=self.lap)
 
@@ -260,6 +281,7 @@ class SummaryReporter:
                 metrics_table += self.report_throughput(stats, task.operation)
                 metrics_table += self.report_latency(stats, task.operation)
                 metrics_table += self.report_service_time(stats, task.operation)
+                metrics_table += self.report_time_breakdown(stats, task.operation)
                 metrics_table += self.report_error_rate(stats, task.operation)
 
         meta_info_table += self.report_meta_info()
@@ -299,6 +321,32 @@ class SummaryReporter:
                 lines.append([self.lap, "%sth percentile service time" % percentile, operation.name, value, "ms"])
         return lines
 
+    def report_time_breakdown(self, stats, operation):
+        lines = []
+        breakdown = stats.op_metrics[operation.name]["time_breakdown"]
+        if not breakdown:
+            return lines
+        service_time = breakdown["service_time"]
+        server_time = breakdown["server_time"]
+        wire_time = breakdown["wire_time"]
+        connection_wait_time = breakdown["connection_wait_time"] or 0
+        deserialization_time = breakdown["deserialization_time"] or 0
+        lines.append([self.lap, "Mean service time", operation.name, service_time, "ms"])
+        if server_time is not None:
+            lines.append([self.lap, "Mean server-side time (took)", operation.name, server_time, "ms"])
+            lines.append([self.lap, "Mean network time", operation.name, max(wire_time - server_time, 0), "ms"])
+        else:
+            lines.append([self.lap, "Mean wire time", operation.name, wire_time, "ms"])
+        lines.append([self.lap, "Mean connection wait time", operation.name, connection_wait_time, "ms"])
+        lines.append([self.lap, "Mean deserialization time", operation.name, deserialization_time, "ms"])
+        if service_time:
+            client_time = service_time - wire_time - connection_wait_time - deserialization_time
+            lines.append([self.lap, "Mean client-side overhead", operation.name, max(client_time, 0), "ms"])
+            if server_time is not None:
+                lines.append([self.lap, "Server-side share of service time", operation.name,
+                              "%.2f" % (min(server_time / service_time, 1.0) * 100.0), "%"])
+        return lines
+
     def report_error_rate(self, stats, operation):
         lines = []
         error_rate = stats.op_metrics[operation.name]["error_rate"]
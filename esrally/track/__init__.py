@@ -1,4 +1,4 @@
-from .loader import list_tracks, load_track, load_track_plugins, prepare_track, operation_parameters
+from .loader import list_tracks, load_track, load_track_plugins, prepare_track, update_track_repository, operation_parameters
 
 # expose the complete track API
 from .track import *
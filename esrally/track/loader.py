@@ -1,3 +1,4 @@
+import concurrent.futures
 import importlib.machinery
 import json
 import logging
@@ -12,7 +13,7 @@ import jsonschema
 import tabulate
 from esrally import exceptions, time, PROGRAM_NAME
 from esrally.track import params, track
-from esrally.utils import io, convert, net, git, versions, console
+from esrally.utils import io, archive, cache, convert, net, git, versions, console
 
 logger = logging.getLogger("rally.track")
 
@@ -79,9 +80,23 @@ def load_track(cfg):
                                           (track_name, PROGRAM_NAME))
 
 
+def update_track_repository(cfg):
+    """
+    Ensures that the track repository on the current machine is up to date and the branch matching the distribution version is checked out.
+
+    :param cfg: The config object. It contains the name of the track.
+    """
+    track_name = cfg.opts("track", "track.name")
+    distribution_version = cfg.opts("mechanic", "distribution.version", mandatory=False)
+    repo = TrackRepository(cfg)
+    track_file = repo.track_file(distribution_version, track_name)
+    if not os.path.isfile(track_file):
+        raise exceptions.SystemSetupError("Cannot find track [%s] in [%s]." % (track_name, track_file))
+
+
 def load_track_plugins(cfg, register_runner, register_scheduler):
     track_name = cfg.opts("track", "track.name")
-    # TODO #257: If we distribute drivers we need to ensure that the correct branch in the track repo is checked out
+    # the track repository has been updated on all load driver hosts during track preparation so no need to fetch again
     repo = TrackRepository(cfg, fetch=False)
     plugin_reader = TrackPluginReader(register_runner, register_scheduler)
 
@@ -101,6 +116,10 @@ def operation_parameters(t, op):
         return params.param_source_for_operation(op.type, t.indices, op.params)
 
 
+# maximum number of track data archives that are downloaded concurrently
+MAX_CONCURRENT_DOWNLOADS = 4
+
+
 def prepare_track(track, cfg):
     """
     Ensures that all track data are available for running the benchmark.
@@ -109,12 +128,14 @@ def prepare_track(track, cfg):
     :param cfg: The config object.
     """
 
-    def download(cfg, url, local_path, size_in_bytes):
+    def is_available(local_path, size_in_bytes):
+        # ensure we only skip the download if the file size also matches our expectation
+        return os.path.isfile(local_path) and (size_in_bytes is None or os.path.getsize(local_path) == size_in_bytes)
+
+    def download(cfg, url, local_path, size_in_bytes, progress_indicator):
         offline = cfg.opts("system", "offline.mode")
-        file_exists = os.path.isfile(local_path)
 
-        # ensure we only skip the download if the file size also matches our expectation
-        if file_exists and (size_in_bytes is None or os.path.getsize(local_path) == size_in_bytes):
+        if is_available(local_path, size_in_bytes):
             logger.info("[%s] already exists locally. Skipping download." % local_path)
             return False
 
@@ -128,10 +149,7 @@ def prepare_track(track, cfg):
                 else:
                     logger.info("Downloading data from [%s] to [%s]." % (url, local_path))
 
-                # we want to have a bit more accurate download progress as these files are typically very large
-                progress = net.Progress("[INFO] Downloading data for track %s" % track.name, accuracy=1)
-                net.download(url, local_path, size_in_bytes, progress_indicator=progress)
-                progress.finish()
+                net.download(url, local_path, size_in_bytes, progress_indicator=progress_indicator)
                 logger.info("Downloaded data from [%s] to [%s]." % (url, local_path))
             except urllib.error.URLError:
                 logger.exception("Could not download [%s] to [%s]." % (url, local_path))
@@ -153,22 +171,33 @@ def prepare_track(track, cfg):
 
         return True
 
-    def decompress(data_set_path, expected_size_in_bytes):
+    def is_decompressed(data_set_path, expected_size_in_bytes):
+        basename, _ = io.splitext(data_set_path)
+        return os.path.isfile(basename) and os.path.getsize(basename) == expected_size_in_bytes
+
+    def prepare_block_index(data_set_path, expected_size_in_bytes):
+        # documents are read directly from the archive so we only need to know where its blocks start
+        archive.prepare_block_index(data_set_path)
+        uncompressed_bytes = archive.BlockIndex(data_set_path).load().uncompressed_size
+        if expected_size_in_bytes is not None and uncompressed_bytes != expected_size_in_bytes:
+            raise exceptions.DataError("[%s] is corrupt. It contains [%d] uncompressed bytes but [%d] bytes are expected." %
+                                       (data_set_path, uncompressed_bytes, expected_size_in_bytes))
+
+    def decompress(data_set_path, expected_size_in_bytes, force=False):
         # we assume that track data are always compressed and try to decompress them before running the benchmark
         basename, extension = io.splitext(data_set_path)
         decompressed = False
-        if not os.path.isfile(basename) or os.path.getsize(basename) != expected_size_in_bytes:
+        if force or not os.path.isfile(basename) or os.path.getsize(basename) != expected_size_in_bytes:
             decompressed = True
             if type.uncompressed_size_in_bytes:
-                console.info("Decompressing track data from [%s] to [%s] (resulting size: %.2f GB) ... " %
-                             (data_set_path, basename, convert.bytes_to_gb(type.uncompressed_size_in_bytes)),
-                             end='', flush=True, logger=logger)
+                msg = "Decompressing track data from [%s] to [%s] (resulting size: %.2f GB)" % \
+                      (data_set_path, basename, convert.bytes_to_gb(type.uncompressed_size_in_bytes))
             else:
-                console.info("Decompressing track data from [%s] to [%s] ... " % (data_set_path, basename), end='',
-                             flush=True, logger=logger)
-
-            io.decompress(data_set_path, io.dirname(data_set_path))
-            console.println("[OK]")
+                msg = "Decompressing track data from [%s] to [%s]" % (data_set_path, basename)
+            logger.info(msg)
+            progress = net.Progress("[INFO] %s" % msg, accuracy=1)
+            io.decompress(data_set_path, io.dirname(data_set_path), progress_indicator=progress)
+            progress.finish()
             extracted_bytes = os.path.getsize(basename)
             if expected_size_in_bytes is not None and extracted_bytes != expected_size_in_bytes:
                 raise exceptions.DataError("[%s] is corrupt. Extracted [%d] bytes but [%d] bytes are expected." %
@@ -178,12 +207,51 @@ def prepare_track(track, cfg):
     if not track.source_root_url:
         logger.info("Track [%s] does not specify a source root URL. Assuming data are available locally." % track.name)
 
+    stream_archives = cfg.opts("track", "stream.archives", mandatory=False, default_value=False)
+    data_cache = cache.Cache(os.path.join(cfg.opts("benchmarks", "local.dataset.cache"), ".cache"),
+                             verify=cfg.opts("track", "verify.data", mandatory=False, default_value=False))
+    offset_table_granularity = cfg.opts("track", "offset.table.granularity", mandatory=False,
+                                        default_value=io.DEFAULT_OFFSET_TABLE_GRANULARITY)
+
+    def prepare_derived(source_checksum, name, artifact_path, prepare):
+        if data_cache.is_valid(source_checksum, name, artifact_path):
+            logger.info("[%s] matches its cached checksum. Skipping preparation." % artifact_path)
+            return
+        if data_cache.lookup(source_checksum, name) is not None and os.path.isfile(artifact_path):
+            # the artifact is corrupt, ensure it is created from scratch
+            os.remove(artifact_path)
+        prepare()
+        data_cache.record(source_checksum, name, artifact_path)
+
+    def download_all(downloads):
+        if all(is_available(local_path, size) for _, local_path, size in downloads):
+            logger.info("All data for track [%s] are available locally. Skipping download." % track.name)
+            return
+        # we want to have a bit more accurate download progress as these files are typically very large
+        progress = net.Progress("[INFO] Downloading data for track %s" % track.name, accuracy=1)
+        aggregate_progress = net.AggregateProgress(progress, {local_path: size for _, local_path, size in downloads if size})
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(downloads), MAX_CONCURRENT_DOWNLOADS)) as pool:
+            futures = [pool.submit(download, cfg, url, local_path, size, aggregate_progress.for_download(local_path))
+                       for url, local_path, size in downloads]
+            try:
+                for f in futures:
+                    f.result()
+            finally:
+                progress.finish()
+
+    if track.source_root_url:
+        downloads = []
+        for index in track.indices:
+            for type in index.types:
+                if type.document_archive:
+                    data_url = "%s/%s" % (track.source_root_url, os.path.basename(type.document_archive))
+                    downloads.append((data_url, type.document_archive, type.compressed_size_in_bytes))
+        if downloads:
+            download_all(downloads)
+
     for index in track.indices:
         for type in index.types:
             if type.document_archive:
-                if track.source_root_url:
-                    data_url = "%s/%s" % (track.source_root_url, os.path.basename(type.document_archive))
-                    download(cfg, data_url, type.document_archive, type.compressed_size_in_bytes)
                 if not os.path.exists(type.document_archive):
                     if cfg.opts("track", "test.mode.enabled"):
                         logger.error("[%s] does not exist so assuming that track [%s] does not support test mode." %
@@ -193,9 +261,33 @@ def prepare_track(track, cfg):
                     else:
                         logger.error("[%s] does not exist." % type.document_archive)
                         raise exceptions.DataError("Track data file [%s] is missing." % type.document_archive)
-                decompressed_file_path, was_decompressed = decompress(type.document_archive, type.uncompressed_size_in_bytes)
-                # just rebuild the file every time for the time being. Later on, we might check the data file fingerprint to avoid it
-                io.prepare_file_offset_table(decompressed_file_path)
+                archive_checksum = data_cache.checksum(type.document_archive)
+                streamable = stream_archives and archive.supports_block_index(type.document_archive) and \
+                    not is_decompressed(type.document_archive, type.uncompressed_size_in_bytes)
+                if streamable and not archive.has_multiple_blocks(type.document_archive):
+                    # a single block can only be read by one client
+                    console.warn("[%s] consists of a single block and cannot be streamed. Decompressing it instead." %
+                                 type.document_archive, logger=logger)
+                    streamable = False
+                if streamable:
+                    prepare_derived(archive_checksum, "block-index", archive.block_index_path(type.document_archive),
+                                    lambda: prepare_block_index(type.document_archive, type.uncompressed_size_in_bytes))
+                else:
+                    decompressed_file_path, _ = io.splitext(type.document_archive)
+                    # hashing the decompressed file would take longer than decompressing it again. Hence, we only check that it has not
+                    # been modified since it has been decompressed.
+                    if data_cache.is_valid(archive_checksum, "decompressed", decompressed_file_path, by_content=False):
+                        logger.info("[%s] has not been modified since decompression. Skipping decompression." % decompressed_file_path)
+                    else:
+                        # without a cache entry we trust a file with the expected size (as before), otherwise it has been modified
+                        modified = data_cache.lookup(archive_checksum, "decompressed") is not None
+                        decompress(type.document_archive, type.uncompressed_size_in_bytes, force=modified)
+                        data_cache.record(archive_checksum, "decompressed", decompressed_file_path, by_content=False)
+                    # the offset table belongs to exactly this decompressed file
+                    decompressed_file_key = "%s-%s" % (archive_checksum, data_cache.stamp(decompressed_file_path))
+                    prepare_derived(decompressed_file_key, "offset-table-%d" % offset_table_granularity,
+                                    io.offset_index_path(decompressed_file_path),
+                                    lambda: io.prepare_file_offset_table(decompressed_file_path, offset_table_granularity))
             else:
                 logger.info("Type [%s] in index [%s] does not define a document archive. No data are indexed from a file for this type." %
                             (type.name, index.name))
@@ -473,10 +565,12 @@ class TrackSpecificationReader:
 
     def __init__(self, override_auto_manage_indices=None):
         self.name = None
+        self.track_dir = None
         self.override_auto_manage_indices = override_auto_manage_indices
 
     def __call__(self, track_name, track_specification, mapping_dir, data_dir):
         self.name = track_name
+        self.track_dir = mapping_dir
         short_description = self._track_info(track_specification, "short-description")
         description = self._track_info(track_specification, "description")
         source_root_url = self._track_info(track_specification, "data-url", mandatory=False)
@@ -689,6 +783,9 @@ class TrackSpecificationReader:
                 logger.info("Using user-provided operation type [%s] for operation [%s]." % (op_type_name, op_name))
                 op_type = op_type_name
             param_source = self._r(op_spec, "param-source", error_ctx="operations", mandatory=False)
+            if op_type == track.OperationType.MultiSearch.name and "queries" in op_spec and self.track_dir:
+                # query logs are part of the track
+                op_spec = dict(op_spec, queries=os.path.join(self.track_dir, op_spec["queries"]))
             if op_name in ops:
                 self._error("Duplicate operation with name '%s'." % op_name)
             try:
@@ -1,12 +1,21 @@
+import collections
+import concurrent.futures
+import json
 import logging
+import mmap
+import os
+import queue
 import random
+import sys
+import threading
 import time
+import weakref
 import types
 from enum import Enum
 
-from esrally import exceptions
+from esrally import client, exceptions
 from esrally.track import track
-from esrally.utils import io
+from esrally.utils import archive, io
 
 logger = logging.getLogger("rally.track")
 
@@ -88,12 +97,19 @@ class ParamSource:
         * It can run until the parameter source is exhausted.
 
         In the former case, return just 1. In the latter case, you should determine the number of times that `#params()` will be invoked.
-        With that number, Rally can show the progress made so far to the user.
+        With that number, Rally can show the progress made so far to the user. If this number is not known upfront, return ``None``. Rally
+        will then invoke `#params()` until it raises ``StopIteration`` and use `#estimated_size()` to show progress.
 
         :return:  The "size" of this parameter source.
         """
         return 1
 
+    def estimated_size(self):
+        """
+        :return: An estimate of the number of times that `#params()` will be invoked. It is only used if `#size()` returns ``None``.
+        """
+        return self.size()
+
     def params(self):
         """
         :return: A hash containing the parameters that will be provided to the corresponding operation runner (key: parameter name,
@@ -147,6 +163,121 @@ class SearchParamSource(ParamSource):
         return self.query_params
 
 
+class SlicedScrollParamSource(SearchParamSource):
+    def __init__(self, indices, params):
+        super().__init__(indices, params)
+        try:
+            slices = int(params.get("slices", DEFAULT_SCROLL_SLICES))
+        except ValueError:
+            raise exceptions.InvalidSyntax("'slices' must be numeric")
+        if slices < 1:
+            raise exceptions.InvalidSyntax("'slices' must be positive but was %d" % slices)
+        try:
+            items_per_page = int(params.get("results-per-page", DEFAULT_SCROLL_RESULTS_PER_PAGE))
+        except ValueError:
+            raise exceptions.InvalidSyntax("'results-per-page' must be numeric")
+        if items_per_page < 1:
+            raise exceptions.InvalidSyntax("'results-per-page' must be positive but was %d" % items_per_page)
+        self.query_params["slices"] = slices
+        self.query_params["items_per_page"] = items_per_page
+        self.query_params["scroll"] = params.get("scroll", DEFAULT_SCROLL_KEEP_ALIVE)
+
+
+class QueryLogParamSource(SearchParamSource):
+    """
+    Replays the queries of a query log with multi-search requests. The query log contains one query body per line. Like document files,
+    it is split in byte ranges across clients. Each client serializes its queries into multi-search request bodies once when it is
+    partitioned and then cycles through them.
+    """
+    def __init__(self, indices, params):
+        super().__init__(indices, params)
+        self.query_log = params.get("queries")
+        if not self.query_log:
+            raise exceptions.InvalidSyntax("'queries' is mandatory")
+        try:
+            self.queries_per_request = int(params.get("queries-per-request", DEFAULT_QUERIES_PER_REQUEST))
+        except ValueError:
+            raise exceptions.InvalidSyntax("'queries-per-request' must be numeric")
+        if self.queries_per_request < 1:
+            raise exceptions.InvalidSyntax("'queries-per-request' must be positive but was %d" % self.queries_per_request)
+        self.requests = None
+        self.current_request = 0
+
+    def partition(self, partition_index, total_partitions):
+        partition = QueryLogParamSource(self.indices, self._params)
+        partition.requests = self._read_requests(partition_index, total_partitions)
+        return partition
+
+    def _read_requests(self, partition_index, total_partitions):
+        header = {"index": self.query_params["index"]}
+        if self.query_params["type"]:
+            header["type"] = self.query_params["type"]
+        header["request_cache"] = self.query_params["use_request_cache"]
+        requests = multi_search_requests(self.query_log, json.dumps(header).encode("utf-8"), partition_index, total_partitions,
+                                         self.queries_per_request)
+        if not requests:
+            raise exceptions.DataError("The query log [%s] does not contain any queries for client [%d] of [%d]. Use fewer clients or "
+                                       "provide more queries." % (self.query_log, partition_index, total_partitions))
+        return requests
+
+    def params(self):
+        if self.requests is None:
+            self.requests = self._read_requests(0, 1)
+        body, queries = self.requests[self.current_request]
+        self.current_request = (self.current_request + 1) % len(self.requests)
+        return {
+            "body": body,
+            "queries": queries
+        }
+
+
+def multi_search_requests(query_log, header, client_index, num_clients, queries_per_request):
+    """
+    Reads the queries of one client from a query log and serializes them into multi-search request bodies.
+
+    :param query_log: The path to a file that contains one query body per line.
+    :param header: The serialized header line of each query.
+    :param client_index: The current client index.  Must be in the range [0, `num_clients').
+    :param num_clients: The total number of clients that read this query log.
+    :param queries_per_request: The maximum number of queries per multi-search request.
+    :return: A list of pairs of a request body as ``bytes`` and the number of queries that it contains.
+    """
+    try:
+        start, end = byte_range_bounds(query_log, client_index, num_clients, lines_per_doc=1)
+        with open(query_log, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+    except FileNotFoundError:
+        raise exceptions.DataError("The query log [%s] does not exist." % query_log)
+
+    queries = []
+    for line in data.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            query = json.loads(line.decode("utf-8"))
+        except ValueError:
+            raise exceptions.DataError("The query log [%s] contains an invalid query [%s]." %
+                                       (query_log, line[:100].decode("utf-8", "replace")))
+        queries.append(header + b"\n" + json.dumps(query, separators=(",", ":")).encode("utf-8") + b"\n")
+    return [(b"".join(queries[i:i + queries_per_request]), len(queries[i:i + queries_per_request]))
+            for i in range(0, len(queries), queries_per_request)]
+
+
+# number of queries per multi-search request by default
+DEFAULT_QUERIES_PER_REQUEST = 10
+# number of slices that are scrolled concurrently by default
+DEFAULT_SCROLL_SLICES = 2
+# number of documents per page and slice by default
+DEFAULT_SCROLL_RESULTS_PER_PAGE = 1000
+# how long a scroll context is kept alive between two pages by default
+DEFAULT_SCROLL_KEEP_ALIVE = "10s"
+
+# number of bulks that are prepared ahead of time per client by default
+DEFAULT_PREFETCH_BULKS = 2
+
+
 class IndexIdConflict(Enum):
     """
     Determines which id conflicts to simulate during indexing.
@@ -168,6 +299,17 @@ class ActionMetaData(Enum):
     SourceFile = 2
 
 
+class Partitioning(Enum):
+    """
+    Determines how the document files are split across clients.
+
+    * Documents: Each client indexes the same number of documents (based on the document count in the track metadata).
+    * Bytes: Each client indexes the documents in a byte range of the same size. Byte ranges are aligned to document boundaries.
+    """
+    Documents = 0,
+    Bytes = 1
+
+
 class BulkIndexParamSource(ParamSource):
     def __init__(self, indices, params):
         super().__init__(indices, params)
@@ -196,6 +338,14 @@ class BulkIndexParamSource(ParamSource):
             raise exceptions.InvalidSyntax("Cannot generate id conflicts [%s] when 'action-and-meta-data' is [%s]." %
                                            (id_conflicts, action_metadata))
 
+        partitioning = params.get("partitioning", "docs")
+        if partitioning == "docs":
+            self.partitioning = Partitioning.Documents
+        elif partitioning == "bytes":
+            self.partitioning = Partitioning.Bytes
+        else:
+            raise exceptions.InvalidSyntax("Unknown 'partitioning' setting [%s]" % partitioning)
+
         self.pipeline = params.get("pipeline", None)
         try:
             self.bulk_size = int(params["bulk-size"])
@@ -216,6 +366,20 @@ class BulkIndexParamSource(ParamSource):
                 raise exceptions.InvalidSyntax("'batch-size' must be a multiple of 'bulk-size'")
         except ValueError:
             raise exceptions.InvalidSyntax("'batch-size' must be numeric")
+        try:
+            self.prefetch_bulks = int(params.get("prefetch-bulks", DEFAULT_PREFETCH_BULKS))
+            if self.prefetch_bulks < 0:
+                raise exceptions.InvalidSyntax("'prefetch-bulks' must be non-negative but was %d" % self.prefetch_bulks)
+        except ValueError:
+            raise exceptions.InvalidSyntax("'prefetch-bulks' must be numeric")
+        try:
+            self.compression_level = params.get("compression-level", None)
+            if self.compression_level is not None:
+                self.compression_level = int(self.compression_level)
+                if not 0 <= self.compression_level <= 9:
+                    raise exceptions.InvalidSyntax("'compression-level' must be between 0 and 9 but was %d" % self.compression_level)
+        except ValueError:
+            raise exceptions.InvalidSyntax("'compression-level' must be numeric")
         if len(indices) == 1 and len(indices[0].types) == 1:
             default_index = indices[0].name
         else:
@@ -231,7 +395,8 @@ class BulkIndexParamSource(ParamSource):
         logger.info("Choosing indices [%s] for partition [%d] of [%d]." %
                     (",".join([str(i) for i in chosen_indices]), partition_index, total_partitions))
         return PartitionBulkIndexParamSource(chosen_indices, partition_index, total_partitions, self.action_metadata,
-                                             self.batch_size, self.bulk_size, self.id_conflicts, self.pipeline)
+                                             self.batch_size, self.bulk_size, self.id_conflicts, self.pipeline, self.prefetch_bulks,
+                                             self.partitioning, self.compression_level)
 
     def params(self):
         raise exceptions.RallyError("Do not use a BulkIndexParamSource without partitioning")
@@ -242,7 +407,7 @@ class BulkIndexParamSource(ParamSource):
 
 class PartitionBulkIndexParamSource(ParamSource):
     def __init__(self, indices, partition_index, total_partitions, action_metadata, batch_size, bulk_size, id_conflicts=None,
-                 pipeline=None):
+                 pipeline=None, prefetch_bulks=DEFAULT_PREFETCH_BULKS, partitioning=Partitioning.Documents, compression_level=None):
         """
 
         :param indices: Specification of affected indices.
@@ -253,6 +418,10 @@ class PartitionBulkIndexParamSource(ParamSource):
         :param bulk_size: The size of bulk index operations (number of documents per bulk).
         :param id_conflicts: The type of id conflicts.
         :param pipeline: The name of the ingest pipeline to run.
+        :param prefetch_bulks: The number of bulks that are prepared ahead of time in a background thread. 0 disables prefetching.
+        :param partitioning: Specifies how document files are split across partitions.
+        :param compression_level: If set, bulk bodies are compressed with gzip at this level when they are prepared. ``None`` disables
+                                  compression.
         """
         super().__init__(indices, {})
         self.partition_index = partition_index
@@ -262,8 +431,13 @@ class PartitionBulkIndexParamSource(ParamSource):
         self.id_conflicts = id_conflicts
         self.pipeline = pipeline
         self.action_metadata = action_metadata
+        self.partitioning = partitioning
+        self.compression_level = compression_level
         self.internal_params = bulk_data_based(total_partitions, partition_index, indices, action_metadata, batch_size,
-                                               bulk_size, id_conflicts, pipeline)
+                                               bulk_size, id_conflicts, pipeline, partitioning=partitioning,
+                                               compression_level=compression_level)
+        if prefetch_bulks > 0:
+            self.internal_params = Prefetcher(self.internal_params, prefetch_bulks, name="client %d" % partition_index)
 
     def partition(self, partition_index, total_partitions):
         raise exceptions.RallyError("Cannot partition a PartitionBulkIndexParamSource further")
@@ -272,11 +446,18 @@ class PartitionBulkIndexParamSource(ParamSource):
         return next(self.internal_params)
 
     def size(self):
+        if self.partitioning == Partitioning.Bytes or any(reads_from_archive(t) for index in self.indices for t in index.types):
+            # the number of documents in a byte range is unknown upfront
+            return None
+        return self.number_of_bulks()
+
+    def estimated_size(self):
         return self.number_of_bulks()
 
     def number_of_bulks(self):
         """
-        :return: The number of bulk operations that the given client will issue.
+        :return: The number of bulk operations that the given client will issue. This is only an estimate if the document files are
+                 partitioned by byte range.
         """
         bulks = 0
         for index in self.indices:
@@ -289,18 +470,127 @@ class PartitionBulkIndexParamSource(ParamSource):
         return bulks
 
 
-def build_conflicting_ids(conflicts, docs_to_index, offset, rand=random.randint):
+class Prefetcher:
+    """
+    Consumes an iterator in a background thread and provides its items via a bounded queue. This moves the work of producing items (e.g.
+    file I/O and bulk assembly) out of the thread that consumes them.
+
+    The background thread starts on the first call to ``next()`` and terminates when the source is exhausted or when this prefetcher is
+    garbage-collected.
+    """
+    # marks the end of the source
+    END = object()
+
+    def __init__(self, source, queue_size, name=None):
+        self.source = source
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.name = name
+        self.stop = threading.Event()
+        self.thread = None
+        self.done = False
+        # number of items that were consumed
+        self.consumed = 0
+        # number of times the consumer had to wait for the next item
+        self.starved = 0
+        # sum of queue depths observed by the consumer (to calculate the average queue depth)
+        self.total_queue_depth = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.done:
+            raise StopIteration()
+        if self.thread is None:
+            self.thread = threading.Thread(target=Prefetcher._produce, args=(self.source, self.queue, self.stop, self.name),
+                                           name="prefetcher-%s" % self.name, daemon=True)
+            self.thread.start()
+            # don't keep the producer running if nobody consumes its items anymore
+            weakref.finalize(self, self.stop.set)
+        depth = self.queue.qsize()
+        item, error = self.queue.get()
+        if item is Prefetcher.END:
+            self.done = True
+            logger.info("Prefetcher for [%s] has provided [%d] items. The consumer had to wait [%d] times, average queue depth was [%.2f]." %
+                        (self.name, self.consumed, self.starved, self.average_queue_depth))
+            if error:
+                raise error
+            raise StopIteration()
+        self.consumed += 1
+        self.total_queue_depth += depth
+        if depth == 0:
+            self.starved += 1
+        return item
+
+    @property
+    def average_queue_depth(self):
+        return self.total_queue_depth / max(self.consumed, 1)
+
+    @staticmethod
+    def _produce(source, q, stop, name):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for item in source:
+                if not put((item, None)):
+                    return
+            put((Prefetcher.END, None))
+        except BaseException as e:
+            logger.exception("Could not prefetch items for [%s]." % name)
+            put((Prefetcher.END, e))
+
+
+def build_conflicting_ids(conflicts, docs_to_index, offset, seed=None):
     if conflicts is None or conflicts == IndexIdConflict.NoConflicts:
         return None
     logger.info("building ids with id conflicts of type [%s]" % conflicts)
-    all_ids = [0] * docs_to_index
-    for i in range(docs_to_index):
+    return ConflictingIds(conflicts, docs_to_index, offset, seed)
+
+
+class ConflictingIds:
+    """
+    Provides the (formatted) ids of ``docs_to_index`` documents with id conflicts. Ids are calculated from their position when they are
+    accessed so the memory usage does not depend on the size of the corpus:
+
+    * Sequential ids are the position plus the offset.
+    * Random ids are derived from a seed and the position with a counter-based pseudo-random number generator (SplitMix64). Hence, the
+      same position always returns the same id without storing it.
+    """
+    _MASK = (1 << 64) - 1
+    _GAMMA = 0x9E3779B97F4A7C15
+
+    def __init__(self, conflicts, docs_to_index, offset, seed=None):
+        self.conflicts = conflicts
+        self.docs_to_index = docs_to_index
         # always consider the offset as each client will index its own range and we don't want uncontrolled conflicts across clients
-        if conflicts == IndexIdConflict.SequentialConflicts:
-            all_ids[i] = "%10d" % (offset + i)
-        else:  # RandomConflicts
-            all_ids[i] = "%10d" % rand(offset, offset + docs_to_index)
-    return all_ids
+        self.offset = offset
+        self.seed = random.getrandbits(64) if seed is None else seed
+
+    def __len__(self):
+        return self.docs_to_index
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.docs_to_index:
+            raise IndexError("id index [%d] out of range [0, %d)" % (i, self.docs_to_index))
+        if self.conflicts == IndexIdConflict.RandomConflicts:
+            # same (inclusive) range as random.randint(offset, offset + docs_to_index)
+            doc_id = self.offset + self._random(i) % (self.docs_to_index + 1)
+        else:
+            doc_id = self.offset + i
+        return "%10d" % doc_id
+
+    def _random(self, i):
+        z = (self.seed + (i + 1) * ConflictingIds._GAMMA) & ConflictingIds._MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & ConflictingIds._MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & ConflictingIds._MASK
+        return z ^ (z >> 31)
 
 
 def chain(*iterables):
@@ -318,18 +608,126 @@ def chain(*iterables):
 
 
 def create_default_reader(index, type, offset, num_lines, num_docs, action_metadata, batch_size, bulk_size, id_conflicts):
-    source = Slice(io.FileSource, offset, num_lines)
-
     if action_metadata == ActionMetaData.Generate:
         am_handler = GenerateActionMetaData(index, type, build_conflicting_ids(id_conflicts, num_docs, offset))
+        lines_per_doc = 1
     elif action_metadata == ActionMetaData.NoMetaData:
-        am_handler = NoneActionMetaData()
+        am_handler = None
+        lines_per_doc = 1
     elif action_metadata == ActionMetaData.SourceFile:
-        am_handler = SourceActionMetaData(source)
+        # action and meta-data lines are already contained in the source file
+        am_handler = None
+        lines_per_doc = 2
     else:
         raise RuntimeError("Missing action-meta-data handler implementation for %s" % action_metadata)
 
-    return IndexDataReader(type.document_file, batch_size, bulk_size, source, am_handler, index, type)
+    return MmapIndexDataReader(type.document_file, batch_size, bulk_size, offset, num_lines, lines_per_doc, am_handler, index, type)
+
+
+def create_byte_range_reader(index, type, client_index, num_clients, action_metadata, batch_size, bulk_size, id_conflicts):
+    """
+    Creates a reader for the byte range of the document file that belongs to the provided client. The document count in the track
+    metadata is not considered so it may be approximate.
+    """
+    lines_per_doc = 2 if action_metadata == ActionMetaData.SourceFile else 1
+    start, end = byte_range_bounds(type.document_file, client_index, num_clients, lines_per_doc)
+    if action_metadata == ActionMetaData.Generate:
+        conflicting_ids = None
+        if id_conflicts is not None and id_conflicts != IndexIdConflict.NoConflicts and end > start:
+            # we need the exact number of documents and a client-specific id range only in this case
+            with open(type.document_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                first_line = io.line_number_at(type.document_file, mm, start)
+                num_docs = io.count_newlines(mm, start, end)
+                # the last line might not be terminated
+                if mm[end - 1:end] != b"\n":
+                    num_docs += 1
+            conflicting_ids = build_conflicting_ids(id_conflicts, num_docs, first_line)
+        am_handler = GenerateActionMetaData(index, type, conflicting_ids)
+    else:
+        am_handler = None
+    logger.info("Client [%d] will index documents in byte range [%d, %d) for [%s/%s]" % (client_index, start, end, index, type))
+    return MmapIndexDataReader(type.document_file, batch_size, bulk_size, 0, sys.maxsize, lines_per_doc, am_handler, index, type,
+                               start=start, end=end)
+
+
+def reads_from_archive(type):
+    """
+    :return: True iff documents of this type are read directly from its compressed archive instead of a decompressed document file.
+    """
+    return type.document_archive is not None and not os.path.isfile(type.document_file) and \
+           archive.BlockIndex.exists(type.document_archive)
+
+
+def create_archive_reader(index, type, client_index, num_clients, action_metadata, batch_size, bulk_size, id_conflicts):
+    """
+    Creates a reader for the blocks of the compressed archive that belong to the provided client. Each client reads a consecutive range of
+    blocks of (roughly) equal uncompressed size, starting at the first document in its first block.
+    """
+    lines_per_doc = 2 if action_metadata == ActionMetaData.SourceFile else 1
+    block_index = archive.BlockIndex(type.document_archive).load()
+    if len(block_index) < num_clients:
+        raise exceptions.SystemSetupError("[%s] contains only [%d] independently decompressible blocks but there are [%d] clients so some "
+                                          "clients would not index any documents. Please run without --stream-archives or recreate the "
+                                          "archive with more blocks (e.g. with bgzip or pbzip2)." %
+                                          (type.document_archive, len(block_index), num_clients))
+    size = block_index.uncompressed_size
+    start_block, start_offset, start_line = block_index.document_boundary(block_index.block_at(size * client_index // num_clients),
+                                                                         lines_per_doc)
+    end_block, end_offset, end_line = block_index.document_boundary(block_index.block_at(size * (client_index + 1) // num_clients),
+                                                                   lines_per_doc)
+    if action_metadata == ActionMetaData.Generate:
+        am_handler = GenerateActionMetaData(index, type, build_conflicting_ids(id_conflicts, end_line - start_line, start_line))
+    else:
+        am_handler = None
+    # each client is a separate process so we share all cores among them
+    parallelism = max((os.cpu_count() or 1) // num_clients, 1)
+    logger.info("Client [%d] will index [%d] docs in blocks [%d, %d] of [%s] with a parallelism of [%d] for [%s/%s]" %
+                (client_index, (end_line - start_line) // lines_per_doc, start_block, end_block, type.document_archive, parallelism,
+                 index, type))
+    return ArchiveIndexDataReader(type.document_archive, block_index, (start_block, start_offset), (end_block, end_offset), batch_size,
+                                  bulk_size, lines_per_doc, am_handler, index, type, parallelism)
+
+
+def byte_range_bounds(data_file, client_index, num_clients, lines_per_doc):
+    """
+    Splits the provided file in byte ranges of (roughly) equal size and calculates the range for one client. Each range starts at a
+    document boundary. A document belongs to the range in which it starts. Hence, ranges of consecutive clients are adjacent and no
+    document is read twice.
+
+    :param data_file: The path to the data file.
+    :param client_index: The current client index.  Must be in the range [0, `num_clients').
+    :param num_clients: The total number of clients that will run bulk index operations.
+    :param lines_per_doc: The number of lines that make up one document in the data file.
+    :return: A tuple containing the start (inclusive) and end (exclusive) file offset for this client.
+    """
+    with open(data_file, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        # empty files cannot be mapped
+        if size == 0:
+            return 0, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = _document_boundary(data_file, mm, size * client_index // num_clients, lines_per_doc)
+            end = _document_boundary(data_file, mm, size * (client_index + 1) // num_clients, lines_per_doc)
+    return start, end
+
+
+def _document_boundary(data_file, mm, position, lines_per_doc):
+    """
+    :return: The offset of the first document that starts at or after ``position``.
+    """
+    size = len(mm)
+    if position <= 0 or position >= size:
+        return min(max(position, 0), size)
+    # a line starts at position if the previous character is a line break
+    line_end = mm.find(b"\n", position - 1)
+    position = size if line_end == -1 else line_end + 1
+    if lines_per_doc > 1 and position < size:
+        # we need the line number to determine whether we are at a document boundary
+        line_number = io.line_number_at(data_file, mm, position)
+        for _ in range((lines_per_doc - line_number % lines_per_doc) % lines_per_doc):
+            line_end = mm.find(b"\n", position)
+            position = size if line_end == -1 else line_end + 1
+    return position
 
 
 def bounds(total_docs, client_index, num_clients, action_metadata):
@@ -359,7 +757,7 @@ def bounds(total_docs, client_index, num_clients, action_metadata):
 
 
 def bulk_data_based(num_clients, client_index, indices, action_metadata, batch_size, bulk_size, id_conflicts, pipeline,
-                    create_reader=create_default_reader):
+                    create_reader=create_default_reader, partitioning=Partitioning.Documents, compression_level=None):
     """
     Calculates the necessary schedule for bulk operations.
 
@@ -373,11 +771,22 @@ def bulk_data_based(num_clients, client_index, indices, action_metadata, batch_s
     :param pipeline: Name of the ingest pipeline to use. May be None.
     :param create_reader: A function to create the index reader. By default a file based index reader will be created. This parameter is
                           intended for testing only.
+    :param partitioning: Specifies how document files are split across clients.
+    :param compression_level: If set, bulk bodies are compressed with gzip at this level. As this happens while bulks are prepared (i.e.
+                              in the background thread if bulks are prefetched), it does not add to the measured request latency.
     :return: A generator for the bulk operations of the given client.
     """
     readers = []
     for index in indices:
         for type in index.types:
+            if reads_from_archive(type):
+                readers.append(create_archive_reader(index, type, client_index, num_clients, action_metadata, batch_size, bulk_size,
+                                                     id_conflicts))
+                continue
+            if partitioning == Partitioning.Bytes:
+                readers.append(create_byte_range_reader(index, type, client_index, num_clients, action_metadata, batch_size, bulk_size,
+                                                        id_conflicts))
+                continue
             offset, num_docs, num_lines = bounds(type.number_of_documents, client_index, num_clients, action_metadata)
             if num_docs > 0:
                 logger.info("Client [%d] will index [%d] docs starting from line offset [%d] for [%s/%s]" %
@@ -391,6 +800,8 @@ def bulk_data_based(num_clients, client_index, indices, action_metadata, batch_s
         # each batch can contain of one or more bulks
         for docs_in_bulk, bulk in batch:
             bulk_id += 1
+            if compression_level is not None:
+                bulk = client.gzip_compressed(bulk, compression_level)
             params = {
                 "index": index,
                 "type": type,
@@ -406,14 +817,6 @@ def bulk_data_based(num_clients, client_index, indices, action_metadata, batch_s
             yield params
 
 
-class NoneActionMetaData:
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        return None
-
-
 class GenerateActionMetaData:
     def __init__(self, index_name, type_name, conflicting_ids, rand=random.randint):
         self.index_name = index_name
@@ -421,137 +824,294 @@ class GenerateActionMetaData:
         self.conflicting_ids = conflicting_ids
         self.rand = rand
         self.id_up_to = 0
+        # pre-encoded action and meta-data line (including the line break) with a placeholder for the document id
+        self.line_template = ('{"index": {"_index": "%s", "_type": "%s", "_id": "%%s"}}\n' %
+                              (str(index_name).replace("%", "%%"), str(type_name).replace("%", "%%"))).encode("utf-8")
 
     def __iter__(self):
         return self
 
+    def static_line(self):
+        """
+        :return: The action and meta-data line if it is identical for all documents, otherwise ``None``.
+        """
+        if self.conflicting_ids is None:
+            return next(self)
+        else:
+            return None
+
     def __next__(self):
         if self.conflicting_ids is not None:
-            # 25% of the time we replace a doc:
-            if self.id_up_to > 0 and self.rand(0, 3) == 3:
-                doc_id = self.conflicting_ids[self.rand(0, self.id_up_to - 1)]
-            else:
-                doc_id = self.conflicting_ids[self.id_up_to]
-                self.id_up_to += 1
-            return '{"index": {"_index": "%s", "_type": "%s", "_id": "%s"}}' % (self.index_name, self.type_name, doc_id)
+            return '{"index": {"_index": "%s", "_type": "%s", "_id": "%s"}}' % (self.index_name, self.type_name, self._next_id())
         else:
             return '{"index": {"_index": "%s", "_type": "%s"}}' % (self.index_name, self.type_name)
 
+    def next_encoded_ids(self, n):
+        """
+        :param n: The number of documents.
+        :return: A tuple with the ids of the next ``n`` documents as ``bytes`` that can be used to format ``line_template``. Only
+                 applicable if there are conflicting ids.
+        """
+        next_id = self._next_id
+        return tuple([str(next_id()).encode("utf-8") for _ in range(n)])
 
-class SourceActionMetaData:
-    def __init__(self, source):
-        self.source = source
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        return next(self.source)
-
-
-class Slice:
-    def __init__(self, source_class, offset, number_of_lines):
-        self.source_class = source_class
-        self.source = None
-        self.offset = offset
-        self.number_of_lines = number_of_lines
-        self.current_line = 0
-
-    def open(self, file_name, mode):
-        self.source = self.source_class(file_name, mode).open()
-        # skip offset number of lines
-        logger.info("Skipping %d lines in [%s]." % (self.offset, file_name))
-        start = time.perf_counter()
-        io.skip_lines(file_name, self.source, self.offset)
-        end = time.perf_counter()
-        logger.info("Skipping %d lines took %f s." % (self.offset, end - start))
-        return self
-
-    def close(self):
-        self.source.close()
-        self.source = None
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if self.current_line >= self.number_of_lines:
-            raise StopIteration()
+    def _next_id(self):
+        # 25% of the time we replace a doc:
+        if self.id_up_to > 0 and self.rand(0, 3) == 3:
+            return self.conflicting_ids[self.rand(0, self.id_up_to - 1)]
         else:
-            self.current_line += 1
-            line = self.source.readline()
-            if len(line) == 0:
-                raise StopIteration()
-            return line.strip()
-
-    def __str__(self):
-        return "%s[%d;%d]" % (self.source, self.offset, self.offset + self.number_of_lines)
+            doc_id = self.conflicting_ids[self.id_up_to]
+            self.id_up_to += 1
+            return doc_id
 
 
-class IndexDataReader:
+class MmapIndexDataReader:
     """
-    Reads a file in bulks into an array and also adds a meta-data line before each document if necessary.
+    Reads a file in bulks via a memory-mapped file. Instead of reading the file line by line, it determines line boundaries within the
+    mapped file and provides each bulk as a ready-to-send ``bytes`` object. Action and meta-data lines are spliced in while the bulk is
+    assembled.
 
-    This implementation also supports batching. This means that you can specify batch_size = N * bulk_size, where N is any natural
-    number >= 1. This makes file reading more efficient for small bulk sizes.
+    The file is expected to be UTF-8 encoded with one document per line. Lines are sent as is, i.e. contrary to line-based reading they
+    are not stripped: whitespace around a JSON document (including the ``\r`` of Windows line endings) is insignificant to Elasticsearch
+    and stripping would require copying every line.
     """
+    # we determine line boundaries for this number of lines one by one instead of estimating them
+    MIN_LINES_TO_ESTIMATE = 64
 
-    def __init__(self, data_file, batch_size, bulk_size, file_source, action_metadata, index_name, type_name):
+    def __init__(self, data_file, batch_size, bulk_size, offset, number_of_lines, lines_per_doc, action_metadata, index_name, type_name,
+                 start=None, end=None):
+        """
+        :param data_file: The path to the data file.
+        :param batch_size: The number of documents to read in one go.
+        :param bulk_size: The number of documents per bulk.
+        :param offset: The number of lines to skip at the beginning of the file.
+        :param number_of_lines: The number of lines to read.
+        :param lines_per_doc: The number of lines that make up one document in the data file (2 if the data file contains action and
+                              meta-data lines, 1 otherwise).
+        :param action_metadata: A ``GenerateActionMetaData`` instance if action and meta-data lines should be generated, ``None``
+                                otherwise.
+        :param index_name: The name of the index.
+        :param type_name: The name of the type.
+        :param start: If set, reading starts at this file offset instead of skipping ``offset`` lines.
+        :param end: If set, reading stops at this file offset (exclusive). It must be a line boundary.
+        """
         self.data_file = data_file
         self.batch_size = batch_size
         self.bulk_size = bulk_size
-        self.file_source = file_source
+        self.offset = offset
+        self.remaining_lines = number_of_lines
+        self.lines_per_doc = lines_per_doc
         self.action_metadata = action_metadata
+        self.static_action_metadata = None
         self.index_name = index_name
         self.type_name = type_name
+        self.f = None
+        self.mm = None
+        self.position = 0
+        self.start = start
+        self.end = end
+        self.average_line_length = None
 
     def __enter__(self):
-        self.file_source.open(self.data_file, 'rt')
+        self.f = open(self.data_file, "rb")
+        # empty files cannot be mapped
+        if os.fstat(self.f.fileno()).st_size > 0:
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.start is not None:
+                self.position = self.start
+            else:
+                logger.info("Skipping %d lines in [%s]." % (self.offset, self.data_file))
+                start = time.perf_counter()
+                io.skip_lines(self.data_file, self.mm, self.offset)
+                end = time.perf_counter()
+                logger.info("Skipping %d lines took %f s." % (self.offset, end - start))
+                self.position = self.mm.tell()
+        else:
+            self.remaining_lines = 0
+        self._prepare_action_metadata()
         return self
 
+    def _prepare_action_metadata(self):
+        if self.action_metadata is not None:
+            static_line = self.action_metadata.static_line()
+            if static_line is not None:
+                self.static_action_metadata = ("%s\n" % static_line).encode("utf-8")
+
     def __iter__(self):
         return self
 
     def __next__(self):
         """
-        Returns lines for N bulk requests (where N is bulk_size / batch_size)
+        Returns N bulk requests (where N is bulk_size / batch_size)
         """
         batch = []
-        try:
-            docs_in_batch = 0
-            while docs_in_batch < self.batch_size:
-                docs_in_bulk, bulk = self.read_bulk()
-                if docs_in_bulk == 0:
-                    break
-                docs_in_batch += docs_in_bulk
-                batch.append((docs_in_bulk, bulk))
-            if docs_in_batch == 0:
-                raise StopIteration()
-            logger.debug("Returning a batch with %d bulks." % len(batch))
-            return self.index_name, self.type_name, batch
-        except IOError:
-            logger.exception("Could not read [%s]" % self.data_file)
+        docs_in_batch = 0
+        while docs_in_batch < self.batch_size:
+            docs_in_bulk, bulk = self.read_bulk()
+            if docs_in_bulk == 0:
+                break
+            docs_in_batch += docs_in_bulk
+            batch.append((docs_in_bulk, bulk))
+        if docs_in_batch == 0:
+            raise StopIteration()
+        logger.debug("Returning a batch with %d bulks." % len(batch))
+        return self.index_name, self.type_name, batch
 
     def read_bulk(self):
-        docs_in_bulk = 0
-        current_bulk = []
-
-        for action_metadata_line, document in zip(self.action_metadata, self.file_source):
-            if action_metadata_line:
-                current_bulk.append(action_metadata_line)
-            current_bulk.append(document)
-            docs_in_bulk += 1
-            if docs_in_bulk == self.bulk_size:
-                break
-        return docs_in_bulk, current_bulk
+        start = self.position
+        end, lines = self._skip_lines(start, min(self.bulk_size * self.lines_per_doc, self.remaining_lines))
+        self.position = end
+        self.remaining_lines -= lines
+        docs_in_bulk = lines // self.lines_per_doc
+        if docs_in_bulk == 0:
+            return 0, None
+        self.average_line_length = (end - start) / lines
+        data = self.mm[start:end]
+        # bulk bodies must end with a newline
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        if self.action_metadata is None:
+            return docs_in_bulk, data
+        elif self.static_action_metadata is not None:
+            # splice the action and meta-data line in before every document in one go
+            meta = self.static_action_metadata
+            return docs_in_bulk, meta + data[:-1].replace(b"\n", b"\n" + meta) + b"\n"
+        else:
+            # splice in the pre-encoded action and meta-data line with a placeholder before every document (escaping any "%" in the
+            # documents) and fill in all ids in one go
+            template = self.action_metadata.line_template
+            bulk = template + data[:-1].replace(b"%", b"%%").replace(b"\n", b"\n" + template) + b"\n"
+            return docs_in_bulk, bulk % self.action_metadata.next_encoded_ids(docs_in_bulk)
+
+    def _skip_lines(self, start, number_of_lines):
+        """
+        Determines the position after the next ``number_of_lines`` lines starting from ``start``.
+
+        :return: A tuple of the position after the last line and the number of lines (which is less than ``number_of_lines`` at the end of
+                 the file).
+        """
+        if self.mm is None:
+            size = 0
+        elif self.end is not None:
+            size = min(self.end, len(self.mm))
+        else:
+            size = len(self.mm)
+        pos = start
+        remaining = number_of_lines
+        estimate_factor = 0.9
+        while remaining > 0 and pos < size:
+            if remaining > MmapIndexDataReader.MIN_LINES_TO_ESTIMATE and self.average_line_length and estimate_factor > 0.1:
+                # count lines in a range that most likely contains slightly fewer lines than we need
+                end = min(pos + int(remaining * self.average_line_length * estimate_factor), size)
+                chunk = self.mm[pos:end]
+                lines = chunk.count(b"\n")
+                if 0 < lines <= remaining:
+                    pos += chunk.rfind(b"\n") + 1
+                    remaining -= lines
+                    continue
+                estimate_factor /= 2
+            else:
+                line_end = self.mm.find(b"\n", pos, size)
+                # the last line in the file might not be terminated
+                pos = size if line_end == -1 else line_end + 1
+                remaining -= 1
+        return pos, number_of_lines - remaining
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.f.close()
+        self.f = None
+        return False
+
+
+class ArchiveIndexDataReader(MmapIndexDataReader):
+    """
+    Reads documents directly from a range of blocks in a compressed archive (see ``archive.BlockIndex``). Blocks are decompressed in
+    parallel threads ahead of time (the decompressors release the GIL) and decompressed data are buffered only until they are sent.
+    """
+
+    def __init__(self, archive_file, block_index, start, end, batch_size, bulk_size, lines_per_doc, action_metadata, index_name,
+                 type_name, parallelism=1):
+        """
+        :param archive_file: The path to the archive.
+        :param block_index: A loaded ``archive.BlockIndex`` for this archive.
+        :param start: A tuple (block number, offset within this block) of the first document to read.
+        :param end: A tuple (block number, offset within this block) of the first document that should not be read anymore.
+        :param parallelism: The maximum number of blocks that are decompressed concurrently.
+
+        See ``MmapIndexDataReader`` for all other parameters.
+        """
+        super().__init__(archive_file, batch_size, bulk_size, 0, sys.maxsize, lines_per_doc, action_metadata, index_name, type_name)
+        self.block_index = block_index
+        self.start_block, self.start_offset = start
+        self.end_block, self.end_offset = end
+        self.parallelism = max(parallelism, 1)
+        self.executor = None
+        self.chunks = None
+        self.exhausted = False
+
+    def __enter__(self):
+        self.mm = b""
+        self.position = 0
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.parallelism)
+        self.chunks = self._decompressed_chunks()
+        self._prepare_action_metadata()
+        return self
+
+    def _decompressed_chunks(self):
+        last_block = self.end_block if self.end_offset == 0 else self.end_block + 1
+        blocks = iter(range(self.start_block, min(last_block, len(self.block_index))))
+
+        def submit_next():
+            block_number = next(blocks, None)
+            if block_number is not None:
+                pending.append((block_number, self.executor.submit(archive.decompress_block, self.data_file,
+                                                                   self.block_index.blocks[block_number])))
+
+        # decompress up to `parallelism` blocks ahead of time
+        pending = collections.deque()
+        for _ in range(self.parallelism):
+            submit_next()
+        while pending:
+            block_number, future = pending.popleft()
+            submit_next()
+            data = future.result()
+            lo = self.start_offset if block_number == self.start_block else 0
+            hi = self.end_offset if block_number == self.end_block else len(data)
+            if hi > lo:
+                yield data[lo:hi]
+
+    def read_bulk(self):
+        # ensure that the buffer contains all lines of the next bulk so lines are not split at block boundaries
+        lines_needed = self.bulk_size * self.lines_per_doc
+        available = self.mm.count(b"\n", self.position)
+        while available < lines_needed and not self.exhausted:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.exhausted = True
+            else:
+                self.mm = self.mm[self.position:] + chunk
+                self.position = 0
+                available += chunk.count(b"\n")
+        return super().read_bulk()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.file_source.close()
+        if self.chunks is not None:
+            self.chunks.close()
+            self.chunks = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.mm = None
         return False
 
 
 register_param_source_for_operation(track.OperationType.Index, BulkIndexParamSource)
 register_param_source_for_operation(track.OperationType.Search, SearchParamSource)
+register_param_source_for_operation(track.OperationType.SlicedScroll, SlicedScrollParamSource)
+register_param_source_for_operation(track.OperationType.MultiSearch, QueryLogParamSource)
 
 # Also register by name, so users can use it too
 register_param_source_for_name("file-reader", BulkIndexParamSource)
@@ -268,7 +268,9 @@ class OperationType(Enum):
     ForceMerge = 1,
     IndicesStats = 2,
     NodesStats = 3,
-    Search = 4
+    Search = 4,
+    SlicedScroll = 5,
+    MultiSearch = 6
 
     @classmethod
     def from_hyphenated_string(cls, v):
@@ -282,6 +284,10 @@ class OperationType(Enum):
             return OperationType.NodesStats
         elif v == "search":
             return OperationType.Search
+        elif v == "sliced-scroll":
+            return OperationType.SlicedScroll
+        elif v == "msearch":
+            return OperationType.MultiSearch
         else:
             raise KeyError("No enum value for [%s]" % v)
 
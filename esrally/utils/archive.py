@@ -0,0 +1,514 @@
+import bz2
+import collections
+import concurrent.futures
+import logging
+import os
+import struct
+import zlib
+
+from esrally.utils import console
+
+logger = logging.getLogger("rally.archive")
+
+# header of the block index: magic bytes, format version, size of the archive in bytes, number of blocks
+BLOCK_INDEX_HEADER = struct.Struct("<8sQQQ")
+# compressed offset, compressed size, uncompressed offset, uncompressed size, number of line breaks, whether the block ends with a line break
+BLOCK_INDEX_ENTRY = struct.Struct("<QQQQQ?")
+BLOCK_INDEX_MAGIC = b"RALLYBLK"
+BLOCK_INDEX_VERSION = 1
+# archives smaller than this are indexed in the current process
+BLOCK_INDEX_PARALLEL_THRESHOLD = 64 * 1024 * 1024
+# number of compressed bytes that are read at once
+_READ_BLOCK_SIZE = 1024 * 1024
+
+# every gzip member starts with the magic bytes 0x1f8b followed by the compression method (8: deflate)
+_GZIP_MAGIC = b"\x1f\x8b\x08"
+# every bzip2 stream starts with "BZh", the block size (1 - 9) and the magic number of the first compressed block (an approximation of pi)
+_BZ2_STREAM_MAGIC = b"BZh"
+_BZ2_BLOCK_MAGIC = b"\x31\x41\x59\x26\x53\x59"
+
+Block = collections.namedtuple("Block", ["compressed_offset", "compressed_size", "uncompressed_offset", "uncompressed_size",
+                                         "line_breaks", "ends_with_line_break"])
+
+
+def supports_block_index(archive_path):
+    """
+    :return: True iff the provided archive consists of independently decompressible blocks that Rally can index, i.e. gzip members or
+             bzip2 streams. Note that archives which have been created by ``gzip`` or ``bzip2`` contain only one block. Tools like ``bgzip``
+             or ``pbzip2`` create archives with many blocks.
+    """
+    return _format(archive_path) is not None
+
+
+def has_multiple_blocks(archive_path, parallelism=None, parallel_threshold=BLOCK_INDEX_PARALLEL_THRESHOLD):
+    """
+    Checks quickly whether the provided archive might consist of multiple blocks. Contrary to ``find_blocks()``, it only scans the archive
+    for block starts but does not decompress it.
+
+    :return: False if the archive consists of at most one block. True if it likely consists of multiple blocks.
+    """
+    fmt = _format(archive_path)
+    if fmt is None:
+        return False
+    size = os.path.getsize(archive_path)
+    if parallelism is None:
+        parallelism = os.cpu_count() or 1
+    if size < parallel_threshold or parallelism == 1:
+        candidates = _find_candidates(archive_path, fmt, 0, size)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=parallelism) as pool:
+            candidates = _find_candidates_in_parallel(pool, archive_path, fmt, size, parallelism)
+    return len(candidates) > 1
+
+
+def _format(archive_path):
+    if archive_path.endswith(".tar.gz") or archive_path.endswith(".tar.bz2"):
+        return None
+    elif archive_path.endswith(".gz"):
+        return "gz"
+    elif archive_path.endswith(".bz2"):
+        return "bz2"
+    else:
+        return None
+
+
+def _decompressor(fmt):
+    if fmt == "gz":
+        # accept only a gzip header and stop at the end of the member
+        return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    else:
+        return bz2.BZ2Decompressor()
+
+
+def block_index_path(archive_path):
+    return "%s.blocks" % archive_path
+
+
+def prepare_block_index(archive_path, parallelism=None, parallel_threshold=BLOCK_INDEX_PARALLEL_THRESHOLD):
+    """
+    Creates a block index for the provided archive unless a valid one exists already. The block index contains the position and size of
+    all independently decompressible blocks in the archive along with the number of lines in each block.
+
+    The archive is scanned in parallel for the magic bytes that start a block. As these bytes might also occur within compressed data, each
+    candidate is verified by decompressing it. Valid blocks are then chained starting at the beginning of the archive.
+
+    :param archive_path: The path to a ``.gz`` or ``.bz2`` archive.
+    :param parallelism: The number of processes that scan the archive. Defaults to the number of CPU cores.
+    :param parallel_threshold: Archives smaller than this number of bytes are scanned in the current process.
+    """
+    index_path = block_index_path(archive_path)
+    if _is_block_index_valid(index_path, archive_path):
+        logger.info("Skipping creation of block index at [%s] as it is still valid." % index_path)
+        return
+    console.info("Preparing block index for [%s] ... " % archive_path, end="", flush=True, logger=logger)
+    blocks = find_blocks(archive_path, parallelism, parallel_threshold)
+    tmp_path = "%s.tmp" % index_path
+    with open(tmp_path, mode="wb") as f:
+        f.write(BLOCK_INDEX_HEADER.pack(BLOCK_INDEX_MAGIC, BLOCK_INDEX_VERSION, os.path.getsize(archive_path), len(blocks)))
+        for block in blocks:
+            f.write(BLOCK_INDEX_ENTRY.pack(*block))
+    os.replace(tmp_path, index_path)
+    console.println("[OK]")
+    logger.info("Archive [%s] contains [%d] independently decompressible blocks." % (archive_path, len(blocks)))
+
+
+def _is_block_index_valid(index_path, archive_path):
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(archive_path):
+        return False
+    with open(index_path, mode="rb") as f:
+        header = f.read(BLOCK_INDEX_HEADER.size)
+    if len(header) != BLOCK_INDEX_HEADER.size:
+        return False
+    magic, version, archive_size, _ = BLOCK_INDEX_HEADER.unpack(header)
+    return magic == BLOCK_INDEX_MAGIC and version == BLOCK_INDEX_VERSION and archive_size == os.path.getsize(archive_path)
+
+
+def find_blocks(archive_path, parallelism=None, parallel_threshold=BLOCK_INDEX_PARALLEL_THRESHOLD):
+    """
+    :return: A list of all ``Block``s in the provided archive.
+    """
+    fmt = _format(archive_path)
+    if fmt is None:
+        raise RuntimeError("Cannot determine blocks of [%s]. Only .gz and .bz2 archives are supported." % archive_path)
+    size = os.path.getsize(archive_path)
+    if size == 0:
+        return []
+    if parallelism is None:
+        parallelism = os.cpu_count() or 1
+    if size < parallel_threshold or parallelism == 1:
+        candidates = _find_candidates(archive_path, fmt, 0, size)
+        verified = [_verify_candidate(archive_path, fmt, c) for c in candidates]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=parallelism) as pool:
+            candidates = _find_candidates_in_parallel(pool, archive_path, fmt, size, parallelism)
+            verified = list(pool.map(_verify_candidate, [archive_path] * len(candidates), [fmt] * len(candidates), candidates))
+    return _chain(archive_path, size, verified)
+
+
+def _find_candidates_in_parallel(pool, archive_path, fmt, size, parallelism):
+    number_of_ranges = parallelism * 4
+    range_size = -(-size // number_of_ranges)
+    starts = list(range(0, size, range_size))
+    ends = [min(start + range_size, size) for start in starts]
+    candidates = []
+    for c in pool.map(_find_candidates, [archive_path] * len(starts), [fmt] * len(starts), starts, ends):
+        candidates.extend(c)
+    return candidates
+
+
+def _chain(archive_path, archive_size, verified):
+    blocks_by_offset = {v[0]: v for v in verified if v is not None}
+    blocks = []
+    compressed_offset = 0
+    uncompressed_offset = 0
+    while compressed_offset < archive_size:
+        candidate = blocks_by_offset.get(compressed_offset)
+        if candidate is None:
+            raise RuntimeError("[%s] is corrupt or contains trailing data at offset [%d]." % (archive_path, compressed_offset))
+        _, compressed_size, uncompressed_size, line_breaks, ends_with_line_break = candidate
+        blocks.append(Block(compressed_offset, compressed_size, uncompressed_offset, uncompressed_size, line_breaks, ends_with_line_break))
+        compressed_offset += compressed_size
+        uncompressed_offset += uncompressed_size
+    return blocks
+
+
+def _find_candidates(archive_path, fmt, start, end):
+    """
+    :return: The offsets of all potential block starts within the byte range [start, end) of the archive.
+    """
+    magic = _GZIP_MAGIC if fmt == "gz" else _BZ2_STREAM_MAGIC
+    # a bzip2 stream header is followed by the block size and the block magic
+    overlap = len(magic) - 1 if fmt == "gz" else len(_BZ2_STREAM_MAGIC) + 1 + len(_BZ2_BLOCK_MAGIC) - 1
+    candidates = []
+    with open(archive_path, mode="rb") as f:
+        pos = start
+        while pos < end:
+            f.seek(pos)
+            data = f.read(min(_READ_BLOCK_SIZE, end - pos) + overlap)
+            limit = min(_READ_BLOCK_SIZE, end - pos)
+            i = data.find(magic)
+            while i != -1 and i < limit:
+                if fmt == "gz" or _is_bz2_stream_header(data, i):
+                    candidates.append(pos + i)
+                i = data.find(magic, i + 1)
+            pos += limit
+    return candidates
+
+
+def _is_bz2_stream_header(data, i):
+    block_size = data[i + 3:i + 4]
+    return b"1" <= block_size <= b"9" and len(block_size) == 1 and data[i + 4:i + 10] == _BZ2_BLOCK_MAGIC
+
+
+def _verify_candidate(archive_path, fmt, offset, output_path=None):
+    """
+    Tries to decompress a block that starts at the provided offset.
+
+    :param output_path: An optional path of a file to which the uncompressed contents of the block are written. It is removed if there
+                        is no valid block at this offset.
+    :return: A tuple (compressed offset, compressed size, uncompressed size, number of line breaks, whether the block ends with a line
+             break) or ``None`` if there is no valid block at this offset.
+    """
+    decompressor = _decompressor(fmt)
+    uncompressed_size = 0
+    line_breaks = 0
+    last_byte = b""
+    compressed_size = 0
+    output = open(output_path, mode="wb") if output_path else None
+    valid = False
+    try:
+        with open(archive_path, mode="rb") as f:
+            f.seek(offset)
+            while not decompressor.eof:
+                data = f.read(_READ_BLOCK_SIZE)
+                if not data:
+                    # truncated block
+                    return None
+                compressed_size += len(data)
+                chunk = decompressor.decompress(data)
+                if chunk:
+                    if output:
+                        output.write(chunk)
+                    uncompressed_size += len(chunk)
+                    line_breaks += chunk.count(b"\n")
+                    last_byte = chunk[-1:]
+        valid = True
+    except (OSError, EOFError, zlib.error):
+        return None
+    finally:
+        if output:
+            output.close()
+            if not valid:
+                os.remove(output_path)
+    compressed_size -= len(decompressor.unused_data)
+    return offset, compressed_size, uncompressed_size, line_breaks, last_byte == b"\n"
+
+
+def decompress_block(archive_path, block, f=None):
+    """
+    :param archive_path: The path to the archive.
+    :param block: A ``Block`` of this archive.
+    :param f: An optional file object of the archive that is opened in binary mode. It is not thread-safe to share it.
+    :return: The uncompressed contents of the block as ``bytes``.
+    """
+    if f is None:
+        with open(archive_path, mode="rb") as archive:
+            return decompress_block(archive_path, block, archive)
+    f.seek(block.compressed_offset)
+    data = _decompressor(_format(archive_path)).decompress(f.read(block.compressed_size))
+    if len(data) != block.uncompressed_size:
+        raise RuntimeError("Block at offset [%d] of [%s] is corrupt. Expected [%d] bytes but got [%d] bytes." %
+                           (block.compressed_offset, archive_path, block.uncompressed_size, len(data)))
+    return data
+
+
+class BlockIndex:
+    """
+    Provides access to the block index that has been created with #prepare_block_index().
+    """
+
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self.blocks = []
+        # number of line breaks before each block
+        self.line_breaks_before = []
+
+    @staticmethod
+    def exists(archive_path):
+        return os.path.exists(block_index_path(archive_path))
+
+    def load(self):
+        path = block_index_path(self.archive_path)
+        with open(path, mode="rb") as f:
+            magic, version, _, number_of_blocks = BLOCK_INDEX_HEADER.unpack(f.read(BLOCK_INDEX_HEADER.size))
+            if magic != BLOCK_INDEX_MAGIC or version != BLOCK_INDEX_VERSION:
+                raise IOError("[%s] is not a valid block index." % path)
+            self.blocks = [Block(*entry) for entry in BLOCK_INDEX_ENTRY.iter_unpack(f.read(number_of_blocks * BLOCK_INDEX_ENTRY.size))]
+        line_breaks = 0
+        self.line_breaks_before = []
+        for block in self.blocks:
+            self.line_breaks_before.append(line_breaks)
+            line_breaks += block.line_breaks
+        return self
+
+    def __len__(self):
+        return len(self.blocks)
+
+    @property
+    def uncompressed_size(self):
+        return self.blocks[-1].uncompressed_offset + self.blocks[-1].uncompressed_size if self.blocks else 0
+
+    def block_at(self, uncompressed_offset):
+        """
+        :return: The number of the first block that starts at or after the provided uncompressed offset.
+        """
+        lo, hi = 0, len(self.blocks)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.blocks[mid].uncompressed_offset < uncompressed_offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def document_boundary(self, block_number, lines_per_doc, decompress=None):
+        """
+        Determines the first document that starts at or after the beginning of the provided block. A document is considered to belong to
+        the block in which it starts.
+
+        :param block_number: A block number. It may be equal to the number of blocks.
+        :param lines_per_doc: The number of lines per document.
+        :param decompress: A function that decompresses a block. Intended for testing.
+        :return: A tuple (block number, offset within this block, line number) of the first document. If there is no such document, the
+                 block number is equal to the number of blocks.
+        """
+        if decompress is None:
+            decompress = lambda b: decompress_block(self.archive_path, b)
+        if block_number >= len(self.blocks):
+            return len(self.blocks), 0, self._total_lines()
+        line_number = self.line_breaks_before[block_number]
+        at_line_start = block_number == 0 or self.blocks[block_number - 1].ends_with_line_break
+        for b in range(block_number, len(self.blocks)):
+            data = None
+            pos = 0
+            while True:
+                if at_line_start and line_number % lines_per_doc == 0:
+                    return b, pos, line_number
+                if data is None:
+                    data = decompress(self.blocks[b])
+                line_end = data.find(b"\n", pos)
+                if line_end == -1:
+                    break
+                pos = line_end + 1
+                line_number += 1
+                at_line_start = True
+                if pos == len(data):
+                    break
+            if pos == len(data) and at_line_start:
+                # the next block starts with a new line
+                continue
+            at_line_start = False
+        return len(self.blocks), 0, self._total_lines()
+
+    def _total_lines(self):
+        if not self.blocks:
+            return 0
+        # the last line might not be terminated
+        return self.line_breaks_before[-1] + self.blocks[-1].line_breaks + (0 if self.blocks[-1].ends_with_line_break else 1)
+
+
+def decompress(archive_path, target_path, parallelism=None, progress_indicator=None, parallel_threshold=BLOCK_INDEX_PARALLEL_THRESHOLD):
+    """
+    Decompresses a ``.gz`` or ``.bz2`` archive. If the archive consists of multiple blocks (gzip members or bzip2 streams), blocks are
+    decompressed in parallel on a process pool and written directly to their position in the target file.
+
+    :param archive_path: The path to the archive.
+    :param target_path: The path to the decompressed file. It is overwritten if it exists.
+    :param parallelism: The number of processes that decompress the archive. Defaults to the number of CPU cores.
+    :param progress_indicator: A callable that is called with the number of processed and the total number of compressed bytes.
+    :param parallel_threshold: Archives smaller than this number of bytes are decompressed in the current process.
+    :return: The number of decompressed bytes.
+    """
+    if parallelism is None:
+        parallelism = os.cpu_count() or 1
+    archive_size = os.path.getsize(archive_path)
+    if archive_size < parallel_threshold or parallelism == 1:
+        return _decompress_sequentially(archive_path, target_path, progress_indicator)
+
+    if not _is_block_index_valid(block_index_path(archive_path), archive_path):
+        return _decompress_unindexed(archive_path, target_path, archive_size, parallelism, progress_indicator)
+    blocks = BlockIndex(archive_path).load().blocks
+    if len(blocks) < 2:
+        logger.info("[%s] consists of a single block and cannot be decompressed in parallel." % archive_path)
+        return _decompress_sequentially(archive_path, target_path, progress_indicator)
+
+    uncompressed_size = blocks[-1].uncompressed_offset + blocks[-1].uncompressed_size
+    with open(target_path, mode="wb") as f:
+        f.truncate(uncompressed_size)
+    # group consecutive blocks so each task is large enough to amortize its overhead but there are still enough tasks to balance load
+    min_task_size = archive_size // (parallelism * 16)
+    tasks = [[]]
+    task_size = 0
+    for block in blocks:
+        if task_size >= min_task_size and tasks[-1]:
+            tasks.append([])
+            task_size = 0
+        tasks[-1].append(block)
+        task_size += block.compressed_size
+
+    processed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=parallelism) as pool:
+        futures = [pool.submit(_decompress_blocks, archive_path, target_path, task) for task in tasks]
+        for f in concurrent.futures.as_completed(futures):
+            processed += f.result()
+            if progress_indicator:
+                progress_indicator(processed, archive_size)
+    logger.info("Decompressed [%d] blocks of [%s] with a parallelism of [%d]." % (len(blocks), archive_path, parallelism))
+    return uncompressed_size
+
+
+def _decompress_unindexed(archive_path, target_path, archive_size, parallelism, progress_indicator=None):
+    """
+    Decompresses an archive without a block index. Candidate blocks are verified in parallel and their uncompressed contents are kept in
+    temporary files next to the target file so no block needs to be decompressed twice.
+    """
+    fmt = _format(archive_path)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=parallelism) as pool:
+        candidates = _find_candidates_in_parallel(pool, archive_path, fmt, archive_size, parallelism)
+        if len(candidates) < 2:
+            # the only candidate is the whole archive (e.g. created by ``gzip`` or ``bzip2``) so there is nothing to verify upfront
+            logger.info("[%s] consists of a single block and cannot be decompressed in parallel." % archive_path)
+            single_block = True
+        else:
+            single_block = False
+            output_paths = {c: "%s.%d.part" % (target_path, c) for c in candidates}
+            try:
+                verified = []
+                processed = 0
+                for v in pool.map(_verify_candidate, [archive_path] * len(candidates), [fmt] * len(candidates), candidates,
+                                  [output_paths[c] for c in candidates]):
+                    verified.append(v)
+                    if v is not None and progress_indicator:
+                        processed = min(processed + v[1], archive_size)
+                        progress_indicator(processed, archive_size)
+                blocks = _chain(archive_path, archive_size, verified)
+                if len(blocks) == 1:
+                    logger.info("[%s] consists of a single block and cannot be decompressed in parallel." % archive_path)
+                    os.replace(output_paths[0], target_path)
+                else:
+                    with open(target_path, mode="wb") as f:
+                        f.truncate(blocks[-1].uncompressed_offset + blocks[-1].uncompressed_size)
+                    futures = [pool.submit(_copy_block_output, output_paths[b.compressed_offset], target_path, b.uncompressed_offset)
+                               for b in blocks]
+                    for f in concurrent.futures.as_completed(futures):
+                        f.result()
+                    logger.info("Decompressed [%d] blocks of [%s] with a parallelism of [%d]." % (len(blocks), archive_path, parallelism))
+            finally:
+                for output_path in output_paths.values():
+                    if os.path.exists(output_path):
+                        os.remove(output_path)
+    if single_block:
+        return _decompress_sequentially(archive_path, target_path, progress_indicator)
+    if progress_indicator:
+        progress_indicator(archive_size, archive_size)
+    return blocks[-1].uncompressed_offset + blocks[-1].uncompressed_size
+
+
+def _copy_block_output(output_path, target_path, uncompressed_offset):
+    with open(output_path, mode="rb") as source, open(target_path, mode="r+b") as target:
+        target.seek(uncompressed_offset)
+        for data in iter(lambda: source.read(_READ_BLOCK_SIZE), b""):
+            target.write(data)
+    os.remove(output_path)
+
+
+def _decompress_sequentially(archive_path, target_path, progress_indicator=None):
+    fmt = _format(archive_path)
+    archive_size = os.path.getsize(archive_path)
+    processed = 0
+    uncompressed_size = 0
+    decompressor = _decompressor(fmt)
+    with open(archive_path, mode="rb") as archive, open(target_path, mode="wb") as target:
+        for data in iter(lambda: archive.read(_READ_BLOCK_SIZE), b""):
+            processed += len(data)
+            while data:
+                chunk = decompressor.decompress(data)
+                target.write(chunk)
+                uncompressed_size += len(chunk)
+                if decompressor.eof:
+                    # the next block starts
+                    data = decompressor.unused_data
+                    decompressor = _decompressor(fmt)
+                else:
+                    data = b""
+            if progress_indicator:
+                progress_indicator(processed, archive_size)
+    return uncompressed_size
+
+
+def _decompress_blocks(archive_path, target_path, blocks):
+    """
+    Decompresses the provided blocks and writes them to their position in the target file.
+
+    :return: The number of processed compressed bytes.
+    """
+    fmt = _format(archive_path)
+    processed = 0
+    with open(archive_path, mode="rb") as archive, open(target_path, mode="r+b") as target:
+        for block in blocks:
+            archive.seek(block.compressed_offset)
+            target.seek(block.uncompressed_offset)
+            decompressor = _decompressor(fmt)
+            remaining = block.compressed_size
+            written = 0
+            while remaining > 0:
+                data = archive.read(min(_READ_BLOCK_SIZE, remaining))
+                remaining -= len(data)
+                chunk = decompressor.decompress(data)
+                target.write(chunk)
+                written += len(chunk)
+            if written != block.uncompressed_size:
+                raise RuntimeError("Block at offset [%d] of [%s] is corrupt. Expected [%d] bytes but got [%d] bytes." %
+                                   (block.compressed_offset, archive_path, block.uncompressed_size, written))
+            processed += block.compressed_size
+    return processed
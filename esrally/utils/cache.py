@@ -0,0 +1,186 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from esrally.utils import io
+
+logger = logging.getLogger("rally.cache")
+
+# files are hashed in independent segments of this size so they can be hashed in parallel
+SEGMENT_SIZE = 64 * 1024 * 1024
+# number of bytes that are read at once
+_READ_BLOCK_SIZE = 4 * 1024 * 1024
+CHECKSUM_PREFIX = "sha256t:"
+STAMP_PREFIX = "stat:"
+
+
+def fingerprint(path, parallelism=None, segment_size=SEGMENT_SIZE):
+    """
+    Calculates a checksum of the provided file. The file is split into segments that are hashed with SHA-256 in parallel threads (hashlib
+    releases the GIL). The checksum is the SHA-256 hash of all segment hashes.
+
+    :param path: The path to a file.
+    :param parallelism: The number of threads that hash the file. Defaults to the number of CPU cores.
+    :param segment_size: The size of a segment in bytes. Checksums are only comparable if they use the same segment size.
+    :return: The checksum as a string.
+    """
+    size = os.path.getsize(path)
+    if parallelism is None:
+        parallelism = os.cpu_count() or 1
+    segments = range(0, max(size, 1), segment_size)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        def hash_segment(start):
+            h = hashlib.sha256()
+            end = min(start + segment_size, size)
+            while start < end:
+                data = os.pread(fd, min(_READ_BLOCK_SIZE, end - start), start)
+                if not data:
+                    raise IOError("[%s] has been truncated while calculating its checksum." % path)
+                h.update(data)
+                start += len(data)
+            return h.digest()
+
+        if len(segments) == 1 or parallelism == 1:
+            digests = [hash_segment(start) for start in segments]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as pool:
+                digests = list(pool.map(hash_segment, segments))
+    finally:
+        os.close(fd)
+    return "%s%s" % (CHECKSUM_PREFIX, hashlib.sha256(b"".join(digests)).hexdigest())
+
+
+class Cache:
+    """
+    A content-addressed cache for track data. Each entry is keyed by the checksum of a source file (e.g. a track data archive) and records
+    the checksums of all artifacts that have been derived from it (e.g. the decompressed document file or its offset table). If the
+    checksums of the source and of an artifact match the recorded ones, the artifact does not need to be prepared again.
+
+    Calculating checksums of large files is expensive. Hence, the cache remembers the checksum of each file along with its size,
+    modification time and inode and only hashes it again if any of these have changed (or if verification is enforced). Consequently,
+    changes that keep all of them intact (e.g. silent data corruption on disk) are only detected with verification. Artifacts that can
+    be recreated from their source (e.g. a decompressed document file) can also be recorded by their size and modification time only so
+    they are never hashed at all.
+    """
+
+    def __init__(self, root, verify=False, parallelism=None):
+        """
+        :param root: The directory in which the cache stores its data.
+        :param verify: If ``True``, checksums of all files are calculated again even if a file seems to be unchanged.
+        :param parallelism: The number of threads that hash a file. Defaults to the number of CPU cores.
+        """
+        self.root = root
+        self.verify = verify
+        self.parallelism = parallelism
+        self.checksums_path = os.path.join(root, "checksums.json")
+        self.entries_path = os.path.join(root, "entries")
+        # reentrant as recording an artifact also updates its checksum
+        self.lock = threading.RLock()
+        self._checksums = None
+        # files that have been hashed by this instance (they are not verified again)
+        self._verified = set()
+
+    def checksum(self, path):
+        """
+        :return: The checksum of the provided file or ``None`` if it does not exist. Unless verification is enforced, this is the
+                 remembered checksum if the size, modification time and inode of the file are unchanged, i.e. it does not reflect changes
+                 to the file's content that have kept all of them intact.
+        """
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        known = self._load_checksums().get(path)
+        if known is not None and known[:3] == key and (not self.verify or path in self._verified):
+            return known[3]
+        logger.info("Calculating checksum of [%s]." % path)
+        checksum = fingerprint(path, self.parallelism)
+        if known is not None and known[:3] == key and known[3] != checksum:
+            logger.warning("Checksum of [%s] has changed from [%s] to [%s] although it has not been modified. The file is corrupt." %
+                           (path, known[3], checksum))
+        with self.lock:
+            self._verified.add(path)
+            self._checksums[path] = key + [checksum]
+            self._persist(self.checksums_path, self._checksums)
+        return checksum
+
+    @staticmethod
+    def stamp(path):
+        """
+        :return: An identifier of the provided file that is based on its size and modification time instead of its content or ``None`` if
+                 it does not exist.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return "%s%d-%d" % (STAMP_PREFIX, stat.st_size, stat.st_mtime_ns)
+
+    def lookup(self, key, name):
+        """
+        :param key: The checksum of the source file.
+        :param name: The name of the derived artifact.
+        :return: The recorded checksum of the derived artifact or ``None``.
+        """
+        path = self._entry_path(key)
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rt") as f:
+            return json.load(f).get(name)
+
+    def is_valid(self, key, name, artifact_path, by_content=True):
+        """
+        :param by_content: If ``False``, the artifact is identified by its size and modification time (see ``stamp()``) instead of its
+                           checksum. It must have been recorded in the same way.
+        :return: ``True`` iff the provided artifact exists and matches the recorded checksum for the source file.
+        """
+        expected = self.lookup(key, name)
+        if expected is None:
+            return False
+        actual = self.checksum(artifact_path) if by_content else self.stamp(artifact_path)
+        if actual is not None and actual != expected:
+            logger.warning("[%s] does not match the cached checksum [%s] for [%s]." % (artifact_path, expected, key))
+        return actual == expected
+
+    def record(self, key, name, artifact_path, by_content=True):
+        """
+        Records the current checksum of the provided artifact for the source file.
+
+        :param by_content: If ``False``, the artifact is recorded by its size and modification time (see ``stamp()``) instead of its
+                           checksum.
+        """
+        path = self._entry_path(key)
+        with self.lock:
+            entry = {}
+            if os.path.isfile(path):
+                with open(path, "rt") as f:
+                    entry = json.load(f)
+            entry[name] = self.checksum(artifact_path) if by_content else self.stamp(artifact_path)
+            self._persist(path, entry)
+
+    def _entry_path(self, key):
+        return os.path.join(self.entries_path, "%s.json" % key.replace(":", "-"))
+
+    def _load_checksums(self):
+        with self.lock:
+            if self._checksums is None:
+                try:
+                    with open(self.checksums_path, "rt") as f:
+                        self._checksums = json.load(f)
+                except (OSError, ValueError):
+                    self._checksums = {}
+            return self._checksums
+
+    @staticmethod
+    def _persist(path, content):
+        io.ensure_dir(os.path.dirname(path))
+        tmp_path = "%s.tmp" % path
+        with open(tmp_path, "wt") as f:
+            json.dump(content, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
@@ -20,7 +20,7 @@ def bytes_to_human_string(b):
     kb = bytes_to_kb(b)
     if kb > 1.0:
         return "%.1f kB" % kb
-    return "%d bytes"
+    return "%d bytes" % b
 
 
 def mb_to_bytes(mb):
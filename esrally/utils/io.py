@@ -1,14 +1,17 @@
+import array
+import bisect
+import mmap
 import os
 import errno
 import re
+import struct
 import subprocess
-import bz2
-import gzip
+import sys
 import zipfile
 import tarfile
 import logging
 
-from esrally.utils import console
+from esrally.utils import archive, console
 
 logger = logging.getLogger("rally.utils.io")
 
@@ -142,7 +145,7 @@ def compress(source_directory, archive_name):
     _zipdir(source_directory, archive)
 
 
-def decompress(zip_name, target_directory):
+def decompress(zip_name, target_directory, progress_indicator=None):
     """
     Decompresses the provided archive to the target directory. The following file extensions are supported:
 
@@ -154,36 +157,28 @@ def decompress(zip_name, target_directory):
     * tgz
     * tar.bz2
 
-    The decompression method is chosen based on the file extension.
+    The decompression method is chosen based on the file extension. bz2 and gz archives are decompressed in parallel if they consist of
+    multiple independent blocks.
 
     :param zip_name: The full path name to the file that should be decompressed.
     :param target_directory: The directory to which files should be decompressed. May or may not exist prior to calling
     this function.
+    :param progress_indicator: A callable that can be used to report progress for bz2 and gz archives. It is expected to take two
+    parameters ``bytes_processed`` and ``total_bytes`` (in compressed bytes). If not provided, no progress is shown.
     """
     path_without_extension, extension = splitext(zip_name)
     filename = basename(path_without_extension)
     if extension == ".zip":
         _do_decompress(target_directory, zipfile.ZipFile(zip_name))
-    elif extension == ".bz2":
-        _do_decompress_manually(target_directory, filename, bz2.open(zip_name))
-    elif extension == ".gz":
-        _do_decompress_manually(target_directory, filename, gzip.open(zip_name))
+    elif extension in [".bz2", ".gz"]:
+        ensure_dir(target_directory)
+        archive.decompress(zip_name, "%s/%s" % (target_directory, filename), progress_indicator=progress_indicator)
     elif extension in [".tar", ".tar.gz", ".tgz", ".tar.bz2"]:
         _do_decompress(target_directory, tarfile.open(zip_name))
     else:
         raise RuntimeError("Unsupported file extension [%s]. Cannot decompress [%s]" % (extension, zip_name))
 
 
-def _do_decompress_manually(target_directory, filename, compressed_file):
-    ensure_dir(target_directory)
-    try:
-        with open("%s/%s" % (target_directory, filename), 'wb') as new_file:
-            for data in iter(lambda: compressed_file.read(100 * 1024), b''):
-                new_file.write(data)
-    finally:
-        compressed_file.close()
-
-
 def _do_decompress(target_directory, compressed_file):
     try:
         compressed_file.extractall(path=target_directory)
@@ -226,32 +221,251 @@ def splitext(file_name):
         return os.path.splitext(file_name)
 
 
-def prepare_file_offset_table(data_file_path):
+# the offset index stores the file offset after every N-th line
+DEFAULT_OFFSET_TABLE_GRANULARITY = 50000
+# header of the offset index: magic bytes, format version, granularity, size of the data file in bytes, number of entries
+OFFSET_INDEX_HEADER = struct.Struct("<8sQQQQ")
+OFFSET_INDEX_MAGIC = b"RALLYOFF"
+OFFSET_INDEX_VERSION = 1
+# files smaller than this are indexed in the current process
+OFFSET_INDEX_PARALLEL_THRESHOLD = 64 * 1024 * 1024
+# number of bytes that are read at once when counting lines
+_LINE_SCAN_BLOCK_SIZE = 1024 * 1024
+
+
+def offset_index_path(data_file_path):
+    return "%s.offsets" % data_file_path
+
+
+def _legacy_offset_table_path(data_file_path):
+    # the text-based offset table of earlier versions (one line per entry with the line number and the file offset)
+    return "%s.offset" % data_file_path
+
+
+def prepare_file_offset_table(data_file_path, granularity=DEFAULT_OFFSET_TABLE_GRANULARITY, parallelism=None,
+                              parallel_threshold=OFFSET_INDEX_PARALLEL_THRESHOLD):
     """
-    Creates a file that contains a mapping from line numbers to file offsets for the provided path. This file is used internally by
-    #skip_lines(data_file_path, data_file) to speed up line skipping.
+    Creates a binary file that contains the file offset after every ``granularity``-th line of the provided file. This file is used
+    internally by #skip_lines(data_file_path, data_file) to speed up line skipping.
 
     :param data_file_path: The path to a text file that is readable by this process.
+    :param granularity: The number of lines between two entries in the offset table.
+    :param parallelism: The number of processes that scan the file. Defaults to the number of CPU cores.
+    :param parallel_threshold: Files smaller than this number of bytes are scanned in the current process.
     """
-    offset_file_path = "%s.offset" % data_file_path
+    offset_file_path = offset_index_path(data_file_path)
+    legacy_offset_file_path = _legacy_offset_table_path(data_file_path)
+    if os.path.exists(legacy_offset_file_path):
+        logger.info("Removing outdated file offset table at [%s]." % legacy_offset_file_path)
+        os.remove(legacy_offset_file_path)
     # recreate only if necessary as this can be time-consuming
-    if not os.path.exists(offset_file_path) or os.path.getmtime(offset_file_path) < os.path.getmtime(data_file_path):
+    if not _is_offset_index_valid(offset_file_path, data_file_path, granularity):
         console.info("Preparing file offset table for [%s] ... " % data_file_path, end="", flush=True, logger=logger)
-        line_number = 0
-        with open(offset_file_path, mode="w") as offset_file:
-            with open(data_file_path, mode="rt") as data_file:
-                while True:
-                    line = data_file.readline()
-                    if len(line) == 0:
-                        break
-                    line_number += 1
-                    if line_number % 50000 == 0:
-                        print("%d;%d" % (line_number, data_file.tell()), file=offset_file)
+        offsets = line_offsets(data_file_path, granularity, parallelism, parallel_threshold)
+        tmp_path = "%s.tmp" % offset_file_path
+        with open(tmp_path, mode="wb") as offset_file:
+            offset_file.write(OFFSET_INDEX_HEADER.pack(OFFSET_INDEX_MAGIC, OFFSET_INDEX_VERSION, granularity,
+                                                       os.path.getsize(data_file_path), len(offsets)))
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            offsets.tofile(offset_file)
+        os.replace(tmp_path, offset_file_path)
         console.println("[OK]")
     else:
         logger.info("Skipping creation of file offset table at [%s] as it is still valid." % offset_file_path)
 
 
+def _is_offset_index_valid(offset_file_path, data_file_path, granularity):
+    if not os.path.exists(offset_file_path) or os.path.getmtime(offset_file_path) < os.path.getmtime(data_file_path):
+        return False
+    with open(offset_file_path, mode="rb") as offset_file:
+        header = offset_file.read(OFFSET_INDEX_HEADER.size)
+    if len(header) != OFFSET_INDEX_HEADER.size:
+        return False
+    magic, version, index_granularity, data_size, _ = OFFSET_INDEX_HEADER.unpack(header)
+    return magic == OFFSET_INDEX_MAGIC and version == OFFSET_INDEX_VERSION and index_granularity == granularity and \
+           data_size == os.path.getsize(data_file_path)
+
+
+def line_offsets(data_file_path, granularity, parallelism=None, parallel_threshold=OFFSET_INDEX_PARALLEL_THRESHOLD):
+    """
+    Determines the file offset after every ``granularity``-th line. Large files are split into byte ranges which are scanned in parallel:
+    First, we count the lines in each range. Based on these counts, we know which line numbers start in each range and determine their
+    offsets in a second parallel pass.
+
+    :return: An ``array`` of file offsets.
+    """
+    size = os.path.getsize(data_file_path)
+    if parallelism is None:
+        parallelism = os.cpu_count() or 1
+    offsets = array.array("Q")
+    if size == 0:
+        return offsets
+    if size < parallel_threshold or parallelism == 1:
+        offsets.extend(_offsets_in_range(data_file_path, 0, size, granularity, granularity))
+        return offsets
+
+    # use more ranges than processes to balance load
+    number_of_ranges = parallelism * 4
+    range_size = -(-size // number_of_ranges)
+    ranges = [(start, min(start + range_size, size)) for start in range(0, size, range_size)]
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=parallelism) as pool:
+        line_counts = list(pool.map(_count_lines_in_range, [data_file_path] * len(ranges), *zip(*ranges)))
+        futures = []
+        lines_before = 0
+        for (start, end), line_count in zip(ranges, line_counts):
+            # the next line number in this range which is a multiple of the granularity (relative to the start of the range)
+            first = granularity - (lines_before % granularity)
+            if first <= line_count:
+                futures.append(pool.submit(_offsets_in_range, data_file_path, start, end, first, granularity))
+            lines_before += line_count
+        for f in futures:
+            offsets.extend(f.result())
+    return offsets
+
+
+def _count_lines_in_range(data_file_path, start, end):
+    lines = 0
+    with open(data_file_path, mode="rb") as f:
+        f.seek(start)
+        while start < end:
+            block = f.read(min(_LINE_SCAN_BLOCK_SIZE, end - start))
+            lines += block.count(b"\n")
+            start += len(block)
+    return lines
+
+
+def _offsets_in_range(data_file_path, start, end, first, granularity):
+    """
+    :return: The file offsets after the ``first``, ``first + granularity``, ... line within the byte range [start, end).
+    """
+    offsets = []
+    # number of lines to skip until we reach the next offset
+    remaining = first
+    with open(data_file_path, mode="rb") as f:
+        f.seek(start)
+        while start < end:
+            block = f.read(min(_LINE_SCAN_BLOCK_SIZE, end - start))
+            lines = block.count(b"\n")
+            pos = 0
+            while remaining <= lines:
+                pos = _after_nth_newline(block, pos, remaining)
+                offsets.append(start + pos)
+                lines -= remaining
+                remaining = granularity
+            remaining -= lines
+            start += len(block)
+    return offsets
+
+
+def _after_nth_newline(block, pos, n):
+    """
+    :return: The position after the ``n``-th line break in ``block`` at or after ``pos``. There must be at least ``n`` line breaks.
+    """
+    lo = pos
+    hi = len(block)
+    # bisect so we only count line breaks in C: block[lo:hi] always contains at least n line breaks
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        lines = block.count(b"\n", lo, mid)
+        if lines < n:
+            n -= lines
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+class OffsetIndex:
+    """
+    Provides access to an offset table that has been created with #prepare_file_offset_table(). The table is memory-mapped and entries
+    are accessed without parsing the file.
+    """
+
+    def __init__(self, data_file_path):
+        self.path = offset_index_path(data_file_path)
+        self.f = None
+        self.mm = None
+        self.offsets = None
+        self.granularity = None
+
+    def __enter__(self):
+        self.f = open(self.path, mode="rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.granularity, _, entries = OFFSET_INDEX_HEADER.unpack_from(self.mm)
+        if magic != OFFSET_INDEX_MAGIC or version != OFFSET_INDEX_VERSION:
+            self.__exit__(None, None, None)
+            raise IOError("[%s] is not a valid offset table." % self.path)
+        entry_data = memoryview(self.mm)[OFFSET_INDEX_HEADER.size:OFFSET_INDEX_HEADER.size + entries * 8]
+        if sys.byteorder == "little":
+            self.offsets = entry_data.cast("Q")
+        else:
+            self.offsets = array.array("Q", entry_data)
+            self.offsets.byteswap()
+            entry_data.release()
+        return self
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def offset_before_line(self, line_number):
+        """
+        :return: A tuple of the largest line number in the table that is less than or equal to ``line_number`` and its file offset.
+        """
+        entry = min(line_number // self.granularity, len(self.offsets))
+        if entry == 0:
+            return 0, 0
+        return entry * self.granularity, self.offsets[entry - 1]
+
+    def line_before_offset(self, offset):
+        """
+        :return: A tuple of the largest file offset in the table that is less than or equal to ``offset`` and its line number.
+        """
+        entry = bisect.bisect_right(self.offsets, offset)
+        if entry == 0:
+            return 0, 0
+        return entry * self.granularity, self.offsets[entry - 1]
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if isinstance(self.offsets, memoryview):
+            self.offsets.release()
+        self.offsets = None
+        self.mm.close()
+        self.f.close()
+        return False
+
+
+def line_number_at(data_file_path, data, offset):
+    """
+    Determines the line number at the provided file offset. The offset table is used if it exists so only the lines after the closest
+    entry in the table are counted.
+
+    :param data_file_path: The full path to the data file.
+    :param data: The contents of the data file, e.g. a memory-mapped file.
+    :param offset: A file offset at a line boundary.
+    :return: The number of lines before ``offset``.
+    """
+    line_number = 0
+    known_offset = 0
+    if os.path.exists(offset_index_path(data_file_path)):
+        with OffsetIndex(data_file_path) as offset_index:
+            line_number, known_offset = offset_index.line_before_offset(offset)
+    return line_number + count_newlines(data, known_offset, offset)
+
+
+def count_newlines(data, start, end):
+    """
+    :return: The number of line breaks in ``data[start:end]``. Large ranges are counted block-wise to bound memory usage.
+    """
+    count = 0
+    while start < end:
+        block_end = min(start + _LINE_SCAN_BLOCK_SIZE, end)
+        count += data[start:block_end].count(b"\n")
+        start = block_end
+    return count
+
+
 def skip_lines(data_file_path, data_file, number_of_lines_to_skip):
     """
     Skips the first `number_of_lines_to_skip` lines in `data_file` as a side effect.
@@ -263,19 +477,13 @@ def skip_lines(data_file_path, data_file, number_of_lines_to_skip):
     if number_of_lines_to_skip == 0:
         return
 
-    offset_file_path = "%s.offset" % data_file_path
     offset = 0
     remaining_lines = number_of_lines_to_skip
     # can we fast forward?
-    if os.path.exists(offset_file_path):
-        with open(offset_file_path) as offsets:
-            for line in offsets:
-                line_number, offset_in_bytes = [int(i) for i in line.strip().split(";")]
-                if line_number <= number_of_lines_to_skip:
-                    offset = offset_in_bytes
-                    remaining_lines = number_of_lines_to_skip - line_number
-                else:
-                    break
+    if os.path.exists(offset_index_path(data_file_path)):
+        with OffsetIndex(data_file_path) as offset_index:
+            line_number, offset = offset_index.offset_before_line(number_of_lines_to_skip)
+            remaining_lines = number_of_lines_to_skip - line_number
     # fast forward to the last known file offset
     data_file.seek(offset)
     # forward the last remaining lines if needed
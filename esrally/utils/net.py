@@ -1,5 +1,9 @@
+import concurrent.futures
+import json
 import logging
 import os
+import threading
+import time
 
 import certifi
 import urllib3
@@ -31,42 +35,133 @@ class Progress:
         # sample formatting string: [%5.1f%%] for an accuracy of 1
         self.percent_format = "[%%%d.%df%%%%]" % (total_width, accuracy)
         self.msg = msg
+        self.start = time.perf_counter()
+        self.first_bytes_read = None
+        # progress may be reported from multiple threads
+        self.lock = threading.Lock()
 
     def __call__(self, bytes_read, bytes_total):
         from esrally.utils import convert
-        completed = bytes_read / bytes_total
-        total_as_mb = convert.bytes_to_human_string(bytes_total)
-        self.p.print("%s (%s total size)" % (self.msg, total_as_mb), self.percent_format % (completed * 100))
+        with self.lock:
+            # do not count bytes that have been read before (e.g. by a previous, interrupted download) in the throughput
+            if self.first_bytes_read is None:
+                self.first_bytes_read = bytes_read
+            completed = bytes_read / bytes_total
+            total_as_mb = convert.bytes_to_human_string(bytes_total)
+            elapsed = time.perf_counter() - self.start
+            if elapsed > 0 and bytes_read > self.first_bytes_read:
+                throughput = "%s/s" % convert.bytes_to_human_string((bytes_read - self.first_bytes_read) / elapsed)
+                self.p.print("%s (%s total size, %s)" % (self.msg, total_as_mb, throughput), self.percent_format % (completed * 100))
+            else:
+                self.p.print("%s (%s total size)" % (self.msg, total_as_mb), self.percent_format % (completed * 100))
 
     def finish(self):
         self.p.finish()
 
 
-def download(url, local_path, expected_size_in_bytes=None, progress_indicator=None):
+class AggregateProgress:
+    """
+    Combines the progress of multiple concurrent downloads into a single progress indicator.
+    """
+
+    def __init__(self, progress_indicator, expected_sizes=None):
+        """
+        :param progress_indicator: The progress indicator that shows the combined progress.
+        :param expected_sizes: A dict of download name to its expected size in bytes (if known upfront).
+        """
+        self.progress_indicator = progress_indicator
+        self.bytes_read = {}
+        self.bytes_total = dict(expected_sizes) if expected_sizes else {}
+        self.lock = threading.Lock()
+
+    def for_download(self, name):
+        """
+        :return: A progress indicator for the provided download.
+        """
+        def update(bytes_read, bytes_total):
+            with self.lock:
+                self.bytes_read[name] = bytes_read
+                self.bytes_total[name] = bytes_total
+                read, total = sum(self.bytes_read.values()), sum(self.bytes_total.values())
+            self.progress_indicator(read, total)
+        return update
+
+
+# number of concurrent range requests per download
+DEFAULT_DOWNLOAD_SEGMENTS = 8
+# downloads are split in segments of at least this size
+MIN_SEGMENT_SIZE = 16 * 1024 * 1024
+# number of attempts for each segment
+SEGMENT_ATTEMPTS = 5
+# size of a chunk that is read from the network at once
+CHUNK_SIZE = 64 * 1024
+
+
+def download(url, local_path, expected_size_in_bytes=None, progress_indicator=None, segments=DEFAULT_DOWNLOAD_SEGMENTS,
+             min_segment_size=MIN_SEGMENT_SIZE):
     """
     Downloads a single file from a URL to the provided local path.
 
+    If the server supports HTTP range requests, the file is split in segments that are downloaded in parallel. The progress of each segment
+    is recorded next to the partially downloaded file so an interrupted download is resumed where it has stopped.
+
     :param url: The remote URL specifying one file that should be downloaded. May be either a HTTP or HTTPS URL.
     :param local_path: The local file name of the file that should be downloaded.
     :param expected_size_in_bytes: The expected file size in bytes if known. It will be used to verify that all data have been downloaded.
     :param progress_indicator A callable that can be use to report progress to the user. It is expected to take two parameters 
     ``bytes_read`` and ``total_bytes``. If not provided, no progress is shown. Note that ``total_bytes`` is derived from 
     the ``Content-Length`` header and not from the parameter ``expected_size_in_bytes``.
+    :param segments: The maximum number of concurrent range requests.
+    :param min_segment_size: The minimum size of a segment in bytes.
     """
     tmp_data_set_path = local_path + ".tmp"
+    size, supports_ranges = _probe(url)
+    if supports_ranges and size:
+        _download_segmented(url, tmp_data_set_path, size, progress_indicator, segments, min_segment_size)
+    else:
+        logger.info("[%s] does not support range requests. Downloading it in one request." % url)
+        _download_at_once(url, tmp_data_set_path, progress_indicator)
+
+    download_size = os.path.getsize(tmp_data_set_path)
+    if expected_size_in_bytes is not None and download_size != expected_size_in_bytes:
+        _remove(tmp_data_set_path, _state_path(tmp_data_set_path))
+        raise exceptions.DataError("Download of [%s] is corrupt. Downloaded [%d] bytes but [%d] bytes are expected. Please retry." %
+                                   (local_path, download_size, expected_size_in_bytes))
+    os.rename(tmp_data_set_path, local_path)
+    _remove(_state_path(tmp_data_set_path))
+
+
+def _probe(url):
+    """
+    :return: A tuple of the size of the remote file (``None`` if unknown) and whether the server supports range requests.
+    """
+    try:
+        r = __http().request("HEAD", url, retries=10, timeout=urllib3.Timeout(connect=45, read=240))
+    except urllib3.exceptions.HTTPError:
+        logger.exception("Could not determine whether [%s] supports range requests." % url)
+        return None, False
+    if r.status != 200:
+        return None, False
+    try:
+        size = int(r.headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        size = None
+    return size, r.headers.get("Accept-Ranges") == "bytes"
+
+
+def _download_at_once(url, tmp_data_set_path, progress_indicator):
     try:
         with __http().request("GET", url, preload_content=False, retries=10,
                               timeout=urllib3.Timeout(connect=45, read=240)) as r, open(tmp_data_set_path, "wb") as out_file:
             # noinspection PyBroadException
             try:
-                size_from_content_header = int(r.getheader("Content-Length"))
+                size_from_content_header = int(r.headers.get("Content-Length"))
             except BaseException:
                 size_from_content_header = None
 
-            chunk_size = 16 * 1014
             bytes_read = 0
             while True:
-                chunk = r.read(chunk_size)
+                chunk = r.read(CHUNK_SIZE)
                 if not chunk:
                     break
                 out_file.write(chunk)
@@ -74,17 +169,132 @@ def download(url, local_path, expected_size_in_bytes=None, progress_indicator=No
                 if progress_indicator and size_from_content_header:
                     progress_indicator(bytes_read, size_from_content_header)
     except:
-        if os.path.isfile(tmp_data_set_path):
-            os.remove(tmp_data_set_path)
+        _remove(tmp_data_set_path)
         raise
+
+
+def _state_path(tmp_data_set_path):
+    return tmp_data_set_path + ".state"
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+class _DownloadState:
+    """
+    Tracks the number of bytes that have been downloaded for each segment and persists them so downloads can be resumed.
+    """
+
+    def __init__(self, path, url, size, segments):
+        self.path = path
+        self.url = url
+        self.size = size
+        # list of [start, end (exclusive), bytes downloaded]
+        self.segments = segments
+        self.lock = threading.Lock()
+        self.last_persisted = 0
+
+    @staticmethod
+    def load(path, url, size):
+        try:
+            with open(path, "rt") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("url") != url or state.get("size") != size:
+            return None
+        return _DownloadState(path, url, size, state["segments"])
+
+    @property
+    def bytes_read(self):
+        return sum(done for _, _, done in self.segments)
+
+    def update(self, segment, bytes_read):
+        with self.lock:
+            self.segments[segment][2] += bytes_read
+            # persisting on every chunk would be too expensive
+            now = time.perf_counter()
+            if now - self.last_persisted > 1:
+                self._persist()
+                self.last_persisted = now
+            return self.bytes_read
+
+    def persist(self):
+        with self.lock:
+            self._persist()
+
+    def _persist(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wt") as f:
+            json.dump({"url": self.url, "size": self.size, "segments": self.segments}, f)
+        os.replace(tmp_path, self.path)
+
+
+def _download_range(url, offset, end, out_file, on_read, progress_indicator, size):
+    with __http().request("GET", url, headers={"Range": "bytes=%d-%d" % (offset, end - 1)}, preload_content=False,
+                          retries=10, timeout=urllib3.Timeout(connect=45, read=240)) as r:
+        if r.status != 206:
+            raise exceptions.DataError("Expected a partial response for [%s] but got HTTP status [%d]." % (url, r.status))
+        out_file.seek(offset)
+        while offset < end:
+            chunk = r.read(min(CHUNK_SIZE, end - offset))
+            if not chunk:
+                raise exceptions.DataError("Connection to [%s] was closed after [%d] of [%d] bytes." % (url, offset, end))
+            out_file.write(chunk)
+            offset += len(chunk)
+            # data must be written before we record them as downloaded
+            out_file.flush()
+            bytes_read = on_read(len(chunk))
+            if progress_indicator:
+                progress_indicator(bytes_read, size)
+
+
+def _download_segmented(url, tmp_data_set_path, size, progress_indicator, segments, min_segment_size):
+    state_path = _state_path(tmp_data_set_path)
+    state = None
+    if os.path.isfile(tmp_data_set_path) and os.path.getsize(tmp_data_set_path) == size:
+        state = _DownloadState.load(state_path, url, size)
+    if state:
+        logger.info("Resuming download of [%s]. [%d] of [%d] bytes have been downloaded already." % (url, state.bytes_read, size))
     else:
-        download_size = os.path.getsize(tmp_data_set_path)
-        if expected_size_in_bytes is not None and download_size != expected_size_in_bytes:
-            if os.path.isfile(tmp_data_set_path):
-                os.remove(tmp_data_set_path)
-            raise exceptions.DataError("Download of [%s] is corrupt. Downloaded [%d] bytes but [%d] bytes are expected. Please retry." %
-                                       (local_path, download_size, expected_size_in_bytes))
-        os.rename(tmp_data_set_path, local_path)
+        number_of_segments = max(min(segments, size // min_segment_size), 1)
+        segment_size = -(-size // number_of_segments)
+        state = _DownloadState(state_path, url, size, [[start, min(start + segment_size, size), 0]
+                                                       for start in range(0, size, segment_size)])
+        with open(tmp_data_set_path, "wb") as f:
+            f.truncate(size)
+        state.persist()
+    if progress_indicator:
+        progress_indicator(state.bytes_read, size)
+
+    def download_segment(segment):
+        start, end, _ = state.segments[segment]
+        attempt = 0
+        with open(tmp_data_set_path, "r+b") as out_file:
+            while start + state.segments[segment][2] < end:
+                offset = start + state.segments[segment][2]
+                try:
+                    _download_range(url, offset, end, out_file, lambda bytes_read: state.update(segment, bytes_read), progress_indicator,
+                                    size)
+                except (urllib3.exceptions.HTTPError, OSError, exceptions.DataError):
+                    attempt += 1
+                    if attempt >= SEGMENT_ATTEMPTS:
+                        raise
+                    logger.exception("Could not download bytes [%d-%d] of [%s]. Retrying." % (offset, end - 1, url))
+                    time.sleep(min(2 ** attempt * 0.1, 5))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(state.segments)) as pool:
+        try:
+            for f in [pool.submit(download_segment, segment) for segment in range(len(state.segments))]:
+                f.result()
+        finally:
+            state.persist()
+    if state.bytes_read != size:
+        raise exceptions.DataError("Download of [%s] is incomplete. Downloaded [%d] bytes but [%d] bytes are expected. Please retry." %
+                                   (url, state.bytes_read, size))
 
 
 def retrieve_content_as_string(url):
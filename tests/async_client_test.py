@@ -0,0 +1,173 @@
+import asyncio
+from unittest import TestCase
+
+import elasticsearch
+
+from esrally import async_client, client, exceptions
+
+
+class HttpServer:
+    """
+    Answers requests with canned responses and records all requests. A response of ``None`` closes the connection without answering.
+    """
+
+    def __init__(self, responses, close_after_response=False):
+        self.responses = list(responses)
+        self.close_after_response = close_after_response
+        self.requests = []
+        self.connections = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        while self.responses:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line == b"\r\n":
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", "0")))
+            self.requests.append((request_line.decode("latin-1").strip(), headers, body))
+            r = self.responses.pop(0)
+            if r is None:
+                break
+            writer.write(r)
+            await writer.drain()
+            if self.close_after_response:
+                break
+        writer.close()
+
+    def stop(self):
+        self.server.close()
+
+
+def response(status, body, headers=None):
+    head = "HTTP/1.1 %d X\r\nContent-Type: application/json\r\n" % status
+    if headers is None:
+        head += "Content-Length: %d\r\n" % len(body)
+    else:
+        head += "".join("%s: %s\r\n" % (k, v) for k, v in headers.items())
+    return (head + "\r\n").encode("latin-1") + body
+
+
+class AsyncEsClientTests(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_requests(self, server, requests, client_options=None):
+        async def run():
+            port = await server.start()
+            es = async_client.AsyncEsClient([{"host": "127.0.0.1", "port": port}], client_options)
+            try:
+                return [await request(es) for request in requests], es.connection_stats()
+            finally:
+                es.close()
+                server.stop()
+
+        return self.loop.run_until_complete(run())
+
+    def test_returns_raw_responses_on_keep_alive_connection(self):
+        server = HttpServer([response(200, b'{"took": 7, "errors": false}'), response(200, b'{"took": 3}')])
+        (bulk, search), stats = self.run_requests(server, [
+            lambda es: es.perform_request("POST", "/_bulk", params=client.raw_response_params({"refresh": True}), body=b"{}\n"),
+            lambda es: es.perform_request("GET", "/test/_search", body={"query": {"match_all": {}}})
+        ])
+
+        self.assertIsInstance(bulk, client.RawResponse)
+        self.assertEqual(200, bulk.status)
+        self.assertEqual(7, bulk.took)
+        self.assertEqual({"took": 3}, search.json())
+        # the raw response parameter is not sent to Elasticsearch
+        self.assertEqual("POST /_bulk?refresh=true HTTP/1.1", server.requests[0][0])
+        self.assertEqual(b"{}\n", server.requests[0][2])
+        self.assertEqual(b'{"query": {"match_all": {}}}', server.requests[1][2])
+        self.assertEqual(1, server.connections)
+        self.assertEqual(1, stats[0]["reused"])
+
+    def test_reads_chunked_responses(self):
+        server = HttpServer([response(200, b'5\r\n{"tok\r\n5\r\nen": \r\n2\r\n1}\r\n0\r\n\r\n', {"Transfer-Encoding": "chunked"})])
+        (r,), _ = self.run_requests(server, [lambda es: es.perform_request("GET", "/")])
+        self.assertEqual({"token": 1}, r.json())
+
+    def test_raises_transport_error_on_unsuccessful_response(self):
+        server = HttpServer([response(404, b'{"error": {"type": "index_not_found_exception"}, "status": 404}')])
+        with self.assertRaises(elasticsearch.NotFoundError) as ctx:
+            self.run_requests(server, [lambda es: es.perform_request("GET", "/unknown/_search")])
+        self.assertEqual(404, ctx.exception.status_code)
+        self.assertEqual("index_not_found_exception", ctx.exception.error)
+
+    def test_retries_on_connection_that_has_been_closed_by_server(self):
+        server = HttpServer([response(200, b'{"took": 1}'), response(200, b'{"took": 2}')], close_after_response=True)
+        (first, second), stats = self.run_requests(server, [
+            lambda es: es.perform_request("GET", "/"),
+            # the connection is still considered open until the client notices that the server has closed it
+            lambda es: es.perform_request("GET", "/")
+        ])
+        self.assertEqual(1, first.took)
+        self.assertEqual(2, second.took)
+        self.assertEqual(2, server.connections)
+
+    def test_retries_idempotent_request_on_reused_connection(self):
+        server = HttpServer([response(200, b'{"took": 1}'), None, response(200, b'{"took": 2}')])
+        (_, second), _ = self.run_requests(server, [
+            lambda es: es.perform_request("GET", "/"),
+            lambda es: es.perform_request("GET", "/")
+        ])
+        self.assertEqual(2, second.took)
+        self.assertEqual(3, len(server.requests))
+        self.assertEqual(2, server.connections)
+
+    def test_does_not_retry_requests_that_change_state(self):
+        server = HttpServer([response(200, b'{"took": 1}'), None, response(200, b'{"took": 2}')])
+        with self.assertRaises(elasticsearch.ConnectionError):
+            self.run_requests(server, [
+                lambda es: es.perform_request("POST", "/_bulk", body=b"{}\n"),
+                # Elasticsearch may have processed the request before the connection has been closed
+                lambda es: es.perform_request("POST", "/_bulk", body=b"{}\n")
+            ])
+        self.assertEqual(2, len(server.requests))
+        self.assertEqual(1, server.connections)
+
+    def test_rejects_unsupported_client_options(self):
+        with self.assertRaisesRegex(exceptions.SystemSetupError, "sniff_on_start"):
+            async_client.AsyncEsClient([{"host": "127.0.0.1", "port": 9200}], {"sniff_on_start": True, "timeout": 60})
+        with self.assertRaisesRegex(exceptions.SystemSetupError, "host_selector"):
+            async_client.check_client_options({"host_selector": "least-loaded"})
+        async_client.check_client_options({"sniff_on_start": False, "timeout": 60})
+        async_client.check_client_options(None)
+
+    def test_records_request_timings(self):
+        server = HttpServer([response(200, b'{"took": 12}')])
+        timings = client.RequestTimings()
+        self.run_requests(server, [lambda es: es.timed(timings).perform_request("GET", "/_search")])
+        self.assertEqual(1, timings.requests)
+        self.assertAlmostEqual(0.012, timings.server_time)
+        self.assertGreater(timings.wire_time, 0)
+        self.assertGreater(timings.connection_wait_time, 0)
+
+    def test_compresses_request_bodies(self):
+        import gzip
+        server = HttpServer([response(200, b"{}"), response(200, b"{}")])
+        self.run_requests(server, [
+            lambda es: es.perform_request("POST", "/_bulk", body=b"{}\n"),
+            lambda es: es.perform_request("POST", "/_bulk", body=client.gzip_compressed(b"{}\n"))
+        ], client_options={"compressed": True})
+        for _, headers, body in server.requests:
+            self.assertEqual("gzip", headers["content-encoding"])
+            self.assertEqual(b"{}\n", gzip.decompress(body))
+
+    def test_makes_paths(self):
+        self.assertEqual("/logs-1,logs-2/_search", async_client.make_path(["logs-1", "logs-2"], None, "_search"))
+        self.assertEqual("/logs/type/_search", async_client.make_path("logs", "type", "_search"))
@@ -0,0 +1,208 @@
+import gzip
+import socket
+from unittest import TestCase, mock
+
+from esrally import client, exceptions
+
+
+class EsClientFactoryTests(TestCase):
+    @staticmethod
+    def pool(client_options):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options=client_options).create()
+        connection = es.transport.connection_pool.connections[0]
+        connection.pool.pool = mock.Mock()
+        return connection, connection.pool
+
+    def test_compresses_request_bodies(self):
+        connection, pool = self.pool({"compressed": True, "compression_level": 1})
+        pool.urlopen("POST", "/_bulk", b'{"key": "value"}\n', retries=False, headers=connection.headers)
+
+        body = pool.pool.urlopen.call_args[1]["body"]
+        self.assertEqual(b'{"key": "value"}\n', gzip.decompress(body))
+        self.assertEqual("gzip", pool.pool.urlopen.call_args[1]["headers"]["Content-Encoding"])
+
+    def test_passes_precompressed_bodies_unchanged(self):
+        body = client.gzip_compressed(b'{"key": "value"}\n', compression_level=1)
+        connection, pool = self.pool({"compressed": True})
+        pool.urlopen("POST", "/_bulk", body, retries=False, headers=connection.headers)
+
+        self.assertIs(body, pool.pool.urlopen.call_args[1]["body"])
+
+    def test_sets_content_encoding_for_precompressed_bodies(self):
+        body = client.gzip_compressed(b'{"key": "value"}\n')
+        connection, pool = self.pool({})
+        pool.urlopen("POST", "/_bulk", body, retries=False, headers=connection.headers)
+
+        self.assertIs(body, pool.pool.urlopen.call_args[1]["body"])
+        self.assertEqual("gzip", pool.pool.urlopen.call_args[1]["headers"]["Content-Encoding"])
+        # the headers of the connection are not modified
+        self.assertNotIn("Content-Encoding", connection.headers)
+
+    def test_does_not_compress_without_compression(self):
+        connection, pool = self.pool({})
+        pool.urlopen("POST", "/_bulk", b'{"key": "value"}\n', retries=False, headers=connection.headers)
+
+        self.assertEqual(b'{"key": "value"}\n', pool.pool.urlopen.call_args[1]["body"])
+
+    def test_sets_socket_options(self):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options={"tcp_keepalive": True}).create()
+        socket_options = es.transport.connection_pool.connections[0].pool.conn_kw["socket_options"]
+        self.assertIn((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1), socket_options)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), socket_options)
+
+    def test_selects_hosts(self):
+        hosts = [{"host": "127.0.0.1", "port": 9200}, {"host": "127.0.0.1", "port": 9201}]
+        client_options = {"host_selector": "least-loaded"}
+        es = client.EsClientFactory(hosts=hosts, client_options=client_options).create()
+        self.assertIsInstance(es.transport.connection_pool.selector, client.LeastLoadedSelector)
+        # the provided options are not modified
+        self.assertEqual({"host_selector": "least-loaded"}, client_options)
+
+        with self.assertRaisesRegex(exceptions.SystemSetupError, r"Unknown host selector \[fastest\]"):
+            client.EsClientFactory(hosts=hosts, client_options={"host_selector": "fastest"}).create()
+
+    def test_opens_connections_in_advance(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(8)
+        try:
+            es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": server.getsockname()[1]}],
+                                        client_options={"maxsize": 4, "pre_connect": 2}).create()
+            self.assertEqual([{"host": "http://127.0.0.1:%d" % server.getsockname()[1], "requests": 0, "connections": 2, "reused": 0}],
+                             client.connection_stats(es))
+        finally:
+            server.close()
+
+
+class LeastLoadedSelectorTests(TestCase):
+    def test_selects_connection_with_fewest_outstanding_requests(self):
+        connections = [mock.Mock(in_flight=2), mock.Mock(in_flight=0), mock.Mock(in_flight=1)]
+        selector = client.LeastLoadedSelector({})
+        self.assertIs(connections[1], selector.select(connections))
+
+    def test_distributes_ties_evenly(self):
+        connections = [mock.Mock(in_flight=0), mock.Mock(in_flight=0), mock.Mock(in_flight=0)]
+        selector = client.LeastLoadedSelector({})
+        self.assertEqual(connections, [selector.select(connections) for _ in range(3)])
+
+
+class RawResponseTests(TestCase):
+    @staticmethod
+    def client(response_body):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options={}).create()
+        pool = es.transport.connection_pool.connections[0].pool
+        pool.pool = mock.Mock()
+        response = mock.Mock(status=200, data=response_body)
+        response.getheaders.return_value = {"content-type": "application/json"}
+        pool.pool.urlopen.return_value = response
+        return es, pool.pool
+
+    def test_returns_raw_response_on_request(self):
+        es, pool = self.client(b'{"took": 12, "timed_out": false, "hits": {"total": 0, "hits": []}}')
+        response = es.search(index="test", body={"query": {"match_all": {}}}, request_cache=False,
+                             params=client.raw_response_params())
+
+        self.assertIsInstance(response, client.RawResponse)
+        self.assertEqual(200, response.status)
+        self.assertEqual(12, response.took)
+        self.assertEqual({"took": 12, "timed_out": False, "hits": {"total": 0, "hits": []}}, response.json())
+        # the parameter is not sent to Elasticsearch
+        self.assertEqual("/test/_search?request_cache=false", pool.urlopen.call_args[0][1])
+
+    def test_does_not_decode_raw_response(self):
+        es, _ = self.client(b'{"took": 12, "errors": false}')
+        connection = es.transport.connection_pool.connections[0]
+        loads = client.RawResponseDeserializer._loads
+        with mock.patch.object(client.RawResponseDeserializer, "_loads", autospec=True, side_effect=loads) as deserializer:
+            es.transport.perform_request("POST", "/_bulk", body=b"{}\n", params=client.raw_response_params())
+        # the connection has passed the response body through without decoding it
+        self.assertIsInstance(deserializer.call_args[0][1], bytes)
+        self.assertEqual(b'{"took": 12, "errors": false}',
+                         connection.perform_raw_request("POST", "/_bulk", body=b"{}\n")[2])
+
+    def test_raises_errors_of_raw_requests_like_the_standard_client(self):
+        import elasticsearch
+        es, pool = self.client(b'{"error": {"type": "index_not_found_exception"}, "status": 404}')
+        pool.urlopen.return_value.status = 404
+
+        with self.assertRaises(elasticsearch.NotFoundError) as ctx:
+            es.search(index="test", params=client.raw_response_params())
+        self.assertEqual("index_not_found_exception", ctx.exception.error)
+
+    def test_deserializes_response_by_default(self):
+        es, _ = self.client(b'{"took": 12, "errors": false}')
+        self.assertEqual({"took": 12, "errors": False}, es.transport.perform_request("POST", "/_bulk", body=b"{}\n"))
+
+    def test_sniffs_during_raw_request(self):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options={"sniffer_timeout": 60}).create()
+        es.transport.last_sniff = 0
+        pool = es.transport.connection_pool.connections[0].pool
+        pool.pool = mock.Mock()
+        sniff_response = mock.Mock(status=200, data=b'{"nodes": {"node-1": {"http": {"publish_address": "127.0.0.1:9200"}}}}')
+        sniff_response.getheaders.return_value = {"content-type": "application/json"}
+        search_response = mock.Mock(status=200, data=b'{"took": 3, "timed_out": false}')
+        search_response.getheaders.return_value = {"content-type": "application/json"}
+        pool.pool.urlopen.side_effect = [sniff_response, search_response]
+
+        response = es.search(index="test", body={"query": {"match_all": {}}}, params=client.raw_response_params())
+
+        self.assertIsInstance(response, client.RawResponse)
+        self.assertEqual(3, response.took)
+        self.assertEqual("/_nodes/_all/http", pool.pool.urlopen.call_args_list[0][0][1])
+
+    def test_took_is_only_read_at_the_beginning_of_the_response(self):
+        self.assertIsNone(client.RawResponse(b'{"responses": [{"took": 5}]}').took)
+        self.assertEqual(5, client.RawResponse(b'{\n  "took" : 5,\n  "errors" : false\n}').took)
+
+
+class RequestTimingsTests(TestCase):
+    @staticmethod
+    def client(response_body):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options={}).create()
+        pool = es.transport.connection_pool.connections[0].pool
+        pool.pool = mock.Mock()
+        response = mock.Mock(status=200, data=response_body)
+        response.getheaders.return_value = {"content-type": "application/json"}
+        pool.pool.urlopen.return_value = response
+        return es
+
+    def test_records_time_breakdown_of_all_requests(self):
+        es = self.client(b'{"took": 12, "errors": false}')
+        with client.RequestTimings() as timings:
+            es.transport.perform_request("POST", "/_bulk", body=b"{}\n")
+            es.transport.perform_request("POST", "/_bulk", body=b"{}\n", params=client.raw_response_params())
+
+        self.assertEqual(2, timings.requests)
+        self.assertAlmostEqual(0.024, timings.server_time)
+        self.assertGreater(timings.wire_time, 0)
+        self.assertGreater(timings.deserialization_time, 0)
+
+    def test_server_time_is_undefined_without_took(self):
+        es = self.client(b'{"acknowledged": true}')
+        with client.RequestTimings() as timings:
+            es.transport.perform_request("PUT", "/test")
+
+        self.assertEqual(1, timings.requests)
+        self.assertIsNone(timings.server_time)
+
+    def test_records_only_while_active(self):
+        es = self.client(b'{"took": 12, "errors": false}')
+        outer = client.RequestTimings()
+        inner = client.RequestTimings()
+        with outer:
+            with inner:
+                es.transport.perform_request("POST", "/_bulk", body=b"{}\n")
+            es.transport.perform_request("POST", "/_bulk", body=b"{}\n")
+        es.transport.perform_request("POST", "/_bulk", body=b"{}\n")
+
+        self.assertEqual(1, inner.requests)
+        self.assertEqual(1, outer.requests)
+
+    def test_records_connection_wait_time(self):
+        es = client.EsClientFactory(hosts=[{"host": "127.0.0.1", "port": 9200}], client_options={}).create()
+        pool = es.transport.connection_pool.connections[0].pool
+        with client.RequestTimings() as timings:
+            pool.pool._put_conn(pool.pool._get_conn())
+
+        self.assertGreater(timings.connection_wait_time, 0)
+        self.assertEqual(0, timings.requests)
@@ -0,0 +1,179 @@
+from unittest import TestCase
+
+from esrally import metrics, track
+from esrally.driver import aggregation, driver
+
+
+class HistogramTests(TestCase):
+    def test_bounded_relative_error(self):
+        h = aggregation.Histogram(precision=0.01)
+        recorded = [0.5, 1, 7.3, 42, 99.9, 1000, 123456]
+        for v in recorded:
+            h.record(v)
+        self.assertEqual(len(recorded), h.count)
+        for expected, actual in zip(recorded, h.values()):
+            self.assertAlmostEqual(expected, actual, delta=expected * 0.01)
+        self.assertEqual(0.5, h.min)
+        self.assertEqual(123456, h.max)
+        self.assertEqual({"count": 7, "min": 0.5, "max": 123456, "mean": sum(recorded) / 7}, h.summary())
+
+    def test_records_non_positive_values_in_zero_bucket(self):
+        h = aggregation.Histogram()
+        h.record(0)
+        h.record(-1)
+        h.record(3)
+        self.assertEqual([0.0, 0.0], h.values()[:2])
+
+    def test_merge(self):
+        h1 = aggregation.Histogram()
+        h2 = aggregation.Histogram()
+        for i in range(1, 51):
+            h1.record(i)
+        for i in range(51, 101):
+            h2.record(i)
+        h1.merge(h2)
+        self.assertEqual(100, h1.count)
+        self.assertEqual(1, h1.min)
+        self.assertEqual(100, h1.max)
+        self.assertEqual(100, len(h1.values()))
+
+    def test_cannot_merge_different_precision(self):
+        with self.assertRaises(ValueError):
+            aggregation.Histogram(precision=0.01).merge(aggregation.Histogram(precision=0.1))
+
+    def test_limits_values_to_quantiles(self):
+        h = aggregation.Histogram()
+        for i in range(1, 10001):
+            h.record(i)
+        values = h.values(limit=100)
+        self.assertEqual(100, len(values))
+        self.assertEqual(sorted(values), values)
+        # median
+        self.assertAlmostEqual(5000, values[49], delta=5000 * 0.02)
+        self.assertAlmostEqual(10000, values[-1], delta=10000 * 0.01)
+
+
+class AggregatedSamplesTests(TestCase):
+    def setUp(self):
+        self.op = track.Operation("index", track.OperationType.Index)
+        self.task = track.Task(self.op)
+
+    def sample(self, client_id, absolute_time, relative_time, sample_type, request_meta_data, latency, total_ops, time_period):
+        return driver.Sample(client_id, absolute_time, relative_time, self.task, sample_type, request_meta_data, latency, latency,
+                             total_ops, "docs", time_period, 0.5)
+
+    def test_aggregates_per_second_and_success(self):
+        samples = aggregation.AggregatedSamples(client_id=0)
+        samples.add(self.sample(0, 1000.1, 1.1, metrics.SampleType.Normal, {"success": True}, 10, 5000, 1.1))
+        samples.add(self.sample(0, 1000.7, 1.7, metrics.SampleType.Normal, {"success": False, "http-status": 500}, 20, 5000, 1.7))
+        samples.add(self.sample(0, 1001.2, 2.2, metrics.SampleType.Normal, None, 30, 5000, 2.2))
+
+        self.assertEqual(3, len(samples))
+        self.assertEqual(3, len(samples.request_metrics))
+        self.assertEqual(2, len(samples.throughput))
+        self.assertEqual(10000, samples.throughput[(self.task, 1000, metrics.SampleType.Normal)].total_ops)
+        self.assertAlmostEqual(999.0, samples.start_time(self.task))
+
+        values = {}
+        summaries = {}
+        for _, _, success, _, _, name, v, summary, _ in samples.request_metrics_values(1000):
+            values.setdefault((success, name), []).extend(v)
+            summaries.setdefault((success, name), []).append(summary)
+        self.assertEqual(2, len(values[(True, "latency")]))
+        self.assertEqual(1, len(values[(False, "service_time")]))
+        self.assertNotIn((True, "schedule_lag"), values)
+        # one summary per second
+        self.assertEqual(2, len(summaries[(True, "latency")]))
+        self.assertEqual([{"count": 1, "min": 20, "max": 20, "mean": 20}], summaries[(False, "service_time")])
+
+    def test_aggregates_request_meta_data(self):
+        samples = aggregation.AggregatedSamples(client_id=0)
+        samples.add(self.sample(0, 1000.1, 1.1, metrics.SampleType.Normal, {"success": True, "success-count": 100, "took": 10}, 10, 100, 1))
+        samples.add(self.sample(0, 1000.2, 1.2, metrics.SampleType.Normal, {"success": False, "error-type": "bulk", "error-count": 3,
+                                                                            "success-count": 97}, 10, 100, 1))
+        for i in range(2):
+            samples.add(self.sample(0, 1000.3, 1.3, metrics.SampleType.Normal, {"success": False, "error-type": "transport",
+                                                                                "http-status": 500, "error-description": "boom"}, 10, 0, 1))
+        other = aggregation.AggregatedSamples(client_id=1)
+        other.add(self.sample(1, 1000.4, 1.4, metrics.SampleType.Normal, {"success": True, "success-count": 100, "took": 20}, 10, 100, 1))
+        samples.merge(other)
+
+        meta_data = {(success, name): m for _, _, success, _, _, name, _, _, m in samples.request_metrics_values(1000)}
+        self.assertEqual({"totals": {"success-count": 200, "took": 30}}, meta_data[(True, "latency")])
+        self.assertEqual({
+            "errors": [
+                {"error-type": "transport", "http-status": 500, "error-description": "boom", "count": 2},
+                {"error-type": "bulk", "count": 1}
+            ],
+            "totals": {"error-count": 3, "success-count": 97}
+        }, meta_data[(False, "service_time")])
+
+    def test_provides_error_meta_data_of_single_error_as_top_level_keys(self):
+        samples = aggregation.AggregatedSamples(client_id=0)
+        samples.add(self.sample(0, 1000.3, 1.3, metrics.SampleType.Normal, {"success": False, "error-type": "transport",
+                                                                            "http-status": 404}, 10, 0, 1))
+        meta_data = [m for _, _, _, _, _, _, _, _, m in samples.request_metrics_values(1000)][0]
+        self.assertEqual("transport", meta_data["error-type"])
+        self.assertEqual(404, meta_data["http-status"])
+        self.assertEqual([{"error-type": "transport", "http-status": 404, "count": 1}], meta_data["errors"])
+
+    def test_aggregates_request_time_breakdown(self):
+        samples = aggregation.AggregatedSamples(client_id=0)
+        for server_time in [None, 5, 6]:
+            samples.add(driver.Sample(0, 1000.5, 1, self.task, metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "docs", 1, 0.5,
+                                      server_time_ms=server_time, wire_time_ms=8))
+        other = aggregation.AggregatedSamples(client_id=1)
+        other.add(driver.Sample(1, 1000.5, 1, self.task, metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "docs", 1, 0.5,
+                                server_time_ms=7))
+        samples.merge(other)
+
+        values = {name: v for _, _, _, _, _, name, v, _, _ in samples.request_metrics_values(1000)}
+        self.assertEqual(3, len(values["server_time"]))
+        self.assertEqual(3, len(values["wire_time"]))
+        self.assertNotIn("connection_wait_time", values)
+
+    def test_merge_retains_all_counts(self):
+        merged = aggregation.AggregatedSamples()
+        for client_id in range(3):
+            samples = aggregation.AggregatedSamples(client_id)
+            for i in range(10):
+                samples.add(self.sample(client_id, 1000 + i, i, metrics.SampleType.Normal, {"success": True}, i + 1, 100, i + 1))
+            merged.merge(samples)
+        self.assertEqual(30, len(merged))
+        self.assertEqual(10, len(merged.throughput))
+        self.assertEqual(300, merged.throughput[(self.task, 1005, metrics.SampleType.Normal)].total_ops)
+        self.assertAlmostEqual(999, merged.start_time(self.task))
+
+    def test_caps_values_and_retains_error_ratio(self):
+        samples = aggregation.AggregatedSamples()
+        for i in range(900):
+            samples.add(self.sample(0, 1000.5, 1, metrics.SampleType.Normal, {"success": True}, i + 1, 1, 1))
+        for i in range(100):
+            samples.add(self.sample(0, 1000.5, 1, metrics.SampleType.Normal, {"success": False}, i + 1, 1, 1))
+
+        values = {(success, name): v for _, _, success, _, _, name, v, _, _ in samples.request_metrics_values(100)}
+        self.assertEqual(90, len(values[(True, "latency")]))
+        self.assertEqual(10, len(values[(False, "latency")]))
+
+    def test_calculates_same_throughput_as_raw_samples(self):
+        raw = [
+            self.sample(0, 1470838595, 21, metrics.SampleType.Normal, None, 1, 5000, 1),
+            self.sample(0, 1470838596, 22, metrics.SampleType.Normal, None, 1, 5000, 2),
+            self.sample(0, 1470838597, 23, metrics.SampleType.Normal, None, 1, 5000, 3),
+            self.sample(0, 1470838598, 24, metrics.SampleType.Normal, None, 1, 5000, 4),
+            self.sample(0, 1470838599, 25, metrics.SampleType.Normal, None, 1, 5000, 5),
+            self.sample(0, 1470838600, 26, metrics.SampleType.Normal, None, 1, 5000, 6),
+        ]
+        expected = driver.calculate_global_throughput(raw)
+        actual = aggregation.calculate_global_throughput(aggregation.AggregatedSamples().add_all(raw))
+        self.assertEqual(expected, actual)
+
+    def test_different_sample_types(self):
+        raw = [
+            self.sample(0, 1470838595, 21, metrics.SampleType.Warmup, None, 1, 3000, 1),
+            self.sample(0, 1470838595.5, 21.5, metrics.SampleType.Normal, None, 1, 2500, 1),
+        ]
+        throughput = aggregation.calculate_global_throughput(aggregation.AggregatedSamples().add_all(raw))[self.task]
+        self.assertEqual(2, len(throughput))
+        self.assertEqual((1470838595, 21, metrics.SampleType.Warmup, 3000, "docs/s"), throughput[0])
+        self.assertEqual((1470838595.5, 21.5, metrics.SampleType.Normal, 3666.6666666666665, "docs/s"), throughput[1])
@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+import unittest.mock as mock
+from unittest import TestCase
+
+from esrally import client, metrics, track
+from esrally.driver import async_driver, driver, runner
+from esrally.track import params
+
+
+class AsyncDriverTestParamSource:
+    def __init__(self, indices=None, params=None):
+        if params is None:
+            params = {}
+        self._indices = indices
+        self._params = params
+
+    def partition(self, partition_index, total_partitions):
+        return self
+
+    def size(self):
+        return self._params["size"] if "size" in self._params else 1
+
+    def params(self):
+        return self._params
+
+
+class FakeAsyncEsClient:
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+        self.closed = False
+
+    def timed(self, request_timings):
+        return self
+
+    async def perform_request(self, method, path, params=None, body=None):
+        self.requests.append((method, path, body))
+        await asyncio.sleep(0)
+        return client.RawResponse(self.response, 200)
+
+    def connection_stats(self):
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncExecutorTests(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_execute_schedule_with_multiple_clients(self, es):
+        async_es = FakeAsyncEsClient(b'{"took": 1, "errors": false, "items": []}')
+
+        params.register_param_source_for_name("async-driver-test-param-source", AsyncDriverTestParamSource)
+        test_track = track.Track(name="unittest", short_description="unittest track", description="unittest track",
+                                 source_root_url="http://example.org",
+                                 indices=None,
+                                 challenges=None)
+
+        task = track.Task(track.Operation("time-based", track.OperationType.Index.name, params={
+            "body": ["action_metadata_line", "index_line"],
+            "action_metadata_present": True,
+            "bulk-size": 1,
+            "size": 5
+        },
+                                          param_source="async-driver-test-param-source"),
+                          warmup_iterations=0, iterations=10, clients=2)
+
+        samplers = [driver.Sampler(client_id=client_id, task=task, start_timestamp=0) for client_id in range(2)]
+        clients = [(client_id, [(task, samplers[client_id])]) for client_id in range(2)]
+        async_driver.run(threading.Event(), test_track, clients, es, lambda: async_es)
+
+        for client_id, sampler in enumerate(samplers):
+            samples = sampler.samples
+            self.assertEqual(5, len(samples))
+            for sample in samples:
+                self.assertEqual(client_id, sample.client_id)
+                self.assertEqual(metrics.SampleType.Normal, sample.sample_type)
+                self.assertEqual(1, sample.total_ops)
+                self.assertEqual("docs", sample.total_ops_unit)
+        # the built-in runner has issued all requests with the non-blocking client
+        es.bulk.assert_not_called()
+        self.assertEqual(10, len(async_es.requests))
+        self.assertEqual(("POST", "/_bulk", b"action_metadata_line\nindex_line\n"), async_es.requests[0])
+        self.assertTrue(async_es.closed)
+
+    def test_executes_blocking_runner_with_standard_client(self):
+        es = mock.Mock()
+
+        def run(es, params):
+            es.info()
+            return 1, "ops"
+
+        schedule = [(0, metrics.SampleType.Normal, 1.0, runner.DelegatingRunner(run), {})]
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        self.loop.run_until_complete(async_driver.execute_schedule(threading.Event(), 0, "operation_name", schedule, es, None, sampler,
+                                                                   self.loop))
+
+        self.assertEqual(1, len(sampler.samples))
+        es.info.assert_called_once_with()
+
+    def test_awaits_coroutine_runner(self):
+        async def run(es, params):
+            await asyncio.sleep(0)
+            return {"weight": 3, "unit": "docs"}
+
+        schedule = [(0, metrics.SampleType.Normal, 1.0, runner.DelegatingRunner(run), {})]
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        self.loop.run_until_complete(async_driver.execute_schedule(threading.Event(), 0, "operation_name", schedule, None, None, sampler,
+                                                                   self.loop))
+
+        samples = sampler.samples
+        self.assertEqual(1, len(samples))
+        self.assertEqual(3, samples[0].total_ops)
+        self.assertEqual("docs", samples[0].total_ops_unit)
+        self.assertEqual({"success": True}, samples[0].request_meta_data)
+
+    def test_execute_schedule_in_open_loop_mode(self):
+        async def run(es, params):
+            await asyncio.sleep(0.05)
+            return 1, "ops"
+
+        schedule = [(i * 0.005, metrics.SampleType.Normal, (i + 1) / 10, runner.DelegatingRunner(run), {}) for i in range(10)]
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        self.loop.run_until_complete(async_driver.execute_schedule(threading.Event(), 0, "operation_name", schedule, None, None, sampler,
+                                                                   self.loop, max_in_flight_requests=3))
+
+        samples = sampler.samples
+        self.assertEqual(10, len(samples))
+        self.assertEqual(3, max([s.in_flight_requests for s in samples]))
+
+    def test_cancel_execute_schedule(self):
+        called = mock.Mock()
+        schedule = [(0, metrics.SampleType.Normal, 1.0, runner.DelegatingRunner(called), {})]
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        cancel = threading.Event()
+        cancel.set()
+        self.loop.run_until_complete(async_driver.execute_schedule(cancel, 0, "operation_name", schedule, None, None, sampler, self.loop))
+
+        self.assertEqual(0, len(sampler.samples))
+        called.assert_not_called()
+
+    def test_waits_without_blocking_the_event_loop(self):
+        ticks = []
+
+        async def tick():
+            for _ in range(5):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0)
+
+        async def wait():
+            await async_driver.wait_until(deadline)
+            return time.perf_counter()
+
+        async def run_both():
+            return await asyncio.gather(wait(), tick())
+
+        deadline = time.perf_counter() + 0.05
+        woken_up_at, _ = self.loop.run_until_complete(run_both())
+        self.assertGreaterEqual(woken_up_at, deadline)
+        # the other coroutine has not waited for the deadline
+        self.assertTrue(all(t < deadline for t in ticks))
+
+    def test_detects_coroutine_runners(self):
+        async def coroutine_runner(es, params):
+            pass
+
+        def plain_runner(es, params):
+            pass
+
+        self.assertTrue(async_driver.is_coroutine_runner(runner.DelegatingRunner(coroutine_runner)))
+        self.assertFalse(async_driver.is_coroutine_runner(runner.DelegatingRunner(plain_runner)))
+        self.assertFalse(async_driver.is_coroutine_runner(runner.BulkIndex()))
+
+
+class ClientOptionsTests(TestCase):
+    def test_sizes_connection_pool_by_number_of_clients(self):
+        self.assertEqual({"timeout": 60, "maxsize": 8}, async_driver.client_options({"timeout": 60}, [[]] * 8))
+
+    def test_sizes_connection_pool_for_in_flight_requests(self):
+        op = track.Operation("search", track.OperationType.Search.name)
+        open_loop = track.Task(op, params={"target-throughput": 10, "open-loop": True, "max-in-flight-requests": 4})
+        self.assertEqual({"maxsize": 9}, async_driver.client_options(None, [[open_loop], [open_loop], [driver.JoinPoint(1)]]))
+
+    def test_respects_user_defined_pool_size(self):
+        self.assertEqual({"maxsize": 2}, async_driver.client_options({"maxsize": 2}, [[]] * 8))
@@ -0,0 +1,118 @@
+import asyncio
+import json
+from unittest import TestCase
+
+from esrally import client, track
+from esrally.driver import async_runner, runner
+
+
+class FakeAsyncEsClient:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        # requests that are not recorded in the request timings
+        self.untimed_requests = []
+
+    def timed(self, request_timings):
+        if request_timings is not None:
+            return self
+        view = FakeAsyncEsClient()
+        view.responses = self.responses
+        view.requests = self.untimed_requests
+        return view
+
+    async def perform_request(self, method, path, params=None, body=None):
+        self.requests.append((method, path, params, body))
+        await asyncio.sleep(0)
+        r = self.responses.pop(0)
+        return client.RawResponse(r if isinstance(r, bytes) else json.dumps(r).encode("utf-8"), 200)
+
+
+class AsyncRunnerTests(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_runner(self, r, es, params):
+        return self.loop.run_until_complete(r(es, params))
+
+    def test_replaces_only_built_in_runners(self):
+        self.assertIsInstance(async_runner.runner_for(track.OperationType.Index.name), async_runner.BulkIndex)
+        self.assertIsInstance(async_runner.runner_for(track.OperationType.Search.name), async_runner.Query)
+
+        def custom_runner(es, params):
+            pass
+
+        runner.register_runner("custom-for-async-test", custom_runner)
+        self.assertIsInstance(async_runner.runner_for("custom-for-async-test"), runner.DelegatingRunner)
+
+    def test_creates_instance_per_request_only_for_stateful_runners(self):
+        scroll = async_runner.runner_for(track.OperationType.SlicedScroll.name)
+        self.assertIsInstance(async_runner.instance_per_request(scroll), async_runner.SlicedScroll)
+        self.assertIsNot(scroll, async_runner.instance_per_request(scroll))
+        bulk = async_runner.runner_for(track.OperationType.Index.name)
+        self.assertIs(bulk, async_runner.instance_per_request(bulk))
+        self.assertIsNot(runner.runner_for("Search"), async_runner.instance_per_request(runner.runner_for("Search")))
+
+    def test_bulk_index(self):
+        es = FakeAsyncEsClient(b'{"took": 5, "errors": false, "items": []}')
+        result = self.run_runner(async_runner.BulkIndex(), es, {
+            "body": ['{"index": {}}', '{"key": "value"}'],
+            "action_metadata_present": False,
+            "index": "logs",
+            "type": "doc",
+            "bulk-size": 1,
+            "pipeline": "ingest"
+        })
+
+        self.assertEqual({"weight": 1, "unit": "docs", "bulk-size": 1, "success": True, "success-count": 1, "error-count": 0}, result)
+        method, path, params, body = es.requests[0]
+        self.assertEqual(("POST", "/logs/doc/_bulk"), (method, path))
+        self.assertEqual("ingest", params["pipeline"])
+        self.assertEqual(b'{"index": {}}\n{"key": "value"}\n', body)
+
+    def test_bulk_index_with_errors(self):
+        es = FakeAsyncEsClient({"errors": True, "items": [
+            {"index": {"status": 201, "_shards": {"total": 1, "successful": 1, "failed": 0}}},
+            {"index": {"status": 500, "_shards": {"total": 1, "successful": 0, "failed": 1}}}
+        ]})
+        result = self.run_runner(async_runner.BulkIndex(), es, {"body": b"...", "action_metadata_present": True, "bulk-size": 2})
+        self.assertFalse(result["success"])
+        self.assertEqual(1, result["error-count"])
+
+    def test_request_body_query(self):
+        es = FakeAsyncEsClient({"took": 3, "hits": {"hits": []}})
+        self.assertEqual((1, "ops"), self.run_runner(async_runner.Query(), es, {
+            "index": "logs", "type": None, "use_request_cache": False, "body": {"query": {"match_all": {}}}
+        }))
+        self.assertEqual(("POST", "/logs/_search", {"request_cache": False}, {"query": {"match_all": {}}}), es.requests[0])
+
+    def test_scroll_query_clears_scroll(self):
+        es = FakeAsyncEsClient({"_scroll_id": "s1", "hits": {"hits": [{}]}}, {"_scroll_id": "s1", "hits": {"hits": []}}, {})
+        self.assertEqual((2, "ops"), self.run_runner(async_runner.Query(), es, {
+            "index": "logs", "type": None, "use_request_cache": False, "body": None, "pages": 5, "items_per_page": 10
+        }))
+        self.assertEqual([("DELETE", "/_search/scroll", None, {"scroll_id": ["s1"]})], es.untimed_requests)
+        self.assertEqual(["POST", "POST"], [method for method, _, _, _ in es.requests])
+
+    def test_sliced_scroll(self):
+        es = FakeAsyncEsClient({"_scroll_id": "a", "hits": {"hits": [{}, {}]}}, {"_scroll_id": "b", "hits": {"hits": [{}]}},
+                               {"_scroll_id": "a", "hits": {"hits": []}}, {"_scroll_id": "b", "hits": {"hits": []}}, {})
+        result = self.run_runner(async_runner.SlicedScroll(), es, {
+            "index": "logs", "type": None, "use_request_cache": False, "body": None, "slices": 2, "items_per_page": 2, "scroll": "1m"
+        })
+
+        self.assertEqual(3, result["weight"])
+        self.assertEqual(4, result["pages"])
+        # both slices are scrolled concurrently
+        self.assertEqual([0, 1], [r[3]["slice"]["id"] for r in es.requests[:2]])
+        method, path, _, body = es.requests[-1]
+        self.assertEqual(("DELETE", "/_search/scroll"), (method, path))
+        self.assertEqual(["a", "b"], sorted(body["scroll_id"]))
+
+    def test_multi_search(self):
+        es = FakeAsyncEsClient({"responses": [{"hits": {}}, {"error": {"type": "parse_exception"}}]})
+        result = self.run_runner(async_runner.MultiSearch(), es, {"body": b"{}\n{}\n{}\n{}\n", "queries": 2})
+        self.assertEqual({"weight": 2, "unit": "queries", "success": False, "success-count": 1, "error-count": 1}, result)
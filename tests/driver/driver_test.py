@@ -1,10 +1,11 @@
 import unittest.mock as mock
 import threading
+import time
 import collections
 from unittest import TestCase
 
-from esrally import metrics, track, exceptions
-from esrally.driver import driver
+from esrally import client, metrics, track, exceptions
+from esrally.driver import aggregation, driver, runner, scheduler
 from esrally.track import params
 from esrally.utils import io
 
@@ -204,6 +205,115 @@ class IndexManagementTests(TestCase):
         es.assert_not_called()
 
 
+class ClientGroupingTests(TestCase):
+    def test_one_client_per_group_if_enough_groups(self):
+        self.assertEqual([[0], [1], [2]], driver.group_clients(3, 8))
+
+    def test_distributes_clients_round_robin(self):
+        self.assertEqual([[0, 3, 6], [1, 4], [2, 5]], driver.group_clients(7, 3))
+
+    def test_assigns_one_client_per_load_generator(self):
+        self.assertEqual([("localhost", [0]), ("localhost", [1]), ("localhost", [2])],
+                         driver.assign_clients(3, ["localhost"], 3))
+
+    def test_assigns_clients_round_robin_across_hosts(self):
+        self.assertEqual([("10.5.5.10", [0, 4]), ("10.5.5.10", [2]), ("10.5.5.11", [1]), ("10.5.5.11", [3])],
+                         driver.assign_clients(5, ["10.5.5.10", "10.5.5.11"], 2))
+
+    def test_omits_hosts_without_clients(self):
+        self.assertEqual([("10.5.5.10", [0])], driver.assign_clients(1, ["10.5.5.10", "10.5.5.11"], 4))
+
+    def test_load_driver_requirements(self):
+        self.assertEqual({"coordinator": True}, driver.load_driver_requirements("localhost"))
+        self.assertEqual({"coordinator": True}, driver.load_driver_requirements("127.0.0.1"))
+        self.assertEqual({"ip": "10.5.5.10"}, driver.load_driver_requirements("10.5.5.10"))
+
+
+class SamplerTests(TestCase):
+    def test_stores_samples_across_chunks(self):
+        sampler = driver.Sampler(client_id=3, task="index", start_timestamp=0, chunk_size=4)
+        for i in range(10):
+            sampler.add(metrics.SampleType.Warmup if i < 5 else metrics.SampleType.Normal, {"success": True}, i * 10, i * 5, 1, "docs",
+                        i, (i + 1) / 10, schedule_lag_ms=None if i == 0 else 0.5)
+
+        samples = sampler.samples
+        self.assertEqual(10, len(samples))
+        for i, sample in enumerate(samples):
+            self.assertEqual(3, sample.client_id)
+            self.assertEqual("index", sample.task)
+            self.assertEqual(metrics.SampleType.Warmup if i < 5 else metrics.SampleType.Normal, sample.sample_type)
+            self.assertEqual(i * 10, sample.latency_ms)
+            self.assertEqual(i * 5, sample.service_time_ms)
+            self.assertEqual(1, sample.total_ops)
+            self.assertEqual("docs", sample.total_ops_unit)
+            self.assertEqual(i, sample.time_period)
+            self.assertAlmostEqual((i + 1) / 10, sample.percent_completed)
+            self.assertEqual({"success": True}, sample.request_meta_data)
+        self.assertIsNone(samples[0].schedule_lag_ms)
+        self.assertEqual(0.5, samples[1].schedule_lag_ms)
+        self.assertEqual(90, samples[-1].latency_ms)
+        # drained
+        self.assertEqual(0, len(sampler.samples))
+
+    def test_stores_deviating_request_meta_data_and_units(self):
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        sampler.add(metrics.SampleType.Normal, {"success": True}, 1, 1, 1, "ops", 1, 0.5)
+        sampler.add(metrics.SampleType.Normal, {"success": False, "http-status": 500}, 1, 1, 2.5, "MB", 1, 1.0)
+
+        samples = sampler.samples
+        self.assertEqual({"success": True}, samples[0].request_meta_data)
+        self.assertEqual("ops", samples[0].total_ops_unit)
+        self.assertEqual({"success": False, "http-status": 500}, samples[1].request_meta_data)
+        self.assertEqual("MB", samples[1].total_ops_unit)
+        self.assertEqual(2.5, samples[1].total_ops)
+        self.assertEqual(1, len(samples.request_meta_data))
+
+    def test_never_drops_samples(self):
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        for i in range(50000):
+            sampler.add(metrics.SampleType.Normal, {"success": True}, 1, 1, 1, "ops", i, 1.0)
+        samples = sampler.samples
+        self.assertEqual(50000, len(samples))
+        self.assertEqual(49999, samples[-1].time_period)
+
+    def test_samples_can_be_pickled(self):
+        import pickle
+        sampler = driver.Sampler(client_id=1, task=None, start_timestamp=0, chunk_size=2)
+        for i in range(3):
+            sampler.add(metrics.SampleType.Normal, {"success": True}, i, i, 1, "ops", i, 1.0)
+        samples = pickle.loads(pickle.dumps(sampler.samples))
+        self.assertEqual(3, len(samples))
+        self.assertEqual([0, 1, 2], [s.latency_ms for s in samples])
+        self.assertEqual([0, 1, 2], list(samples.column("latency_ms")))
+
+    def test_stores_request_time_breakdown(self):
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        timings = client.RequestTimings()
+        timings.requests = 1
+        timings.add_server_time(5)
+        timings.connection_wait_time = 0.001
+        timings.wire_time = 0.008
+        timings.deserialization_time = 0.0005
+        sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", 1, 0.5, request_timings=timings)
+        # no requests have been issued
+        sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", 1, 1.0, request_timings=client.RequestTimings())
+
+        samples = sampler.samples
+        self.assertEqual([("server_time", 5), ("connection_wait_time", 1), ("wire_time", 8), ("deserialization_time", 0.5)],
+                         samples[0].request_time_breakdown())
+        self.assertEqual([("server_time", None), ("connection_wait_time", None), ("wire_time", None), ("deserialization_time", None)],
+                         samples[1].request_time_breakdown())
+
+    def test_stores_in_flight_requests_without_request_meta_data(self):
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", 1, 0.5, in_flight_requests=3)
+        sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 10, 1, "ops", 1, 1.0)
+
+        samples = sampler.samples
+        self.assertEqual({}, samples.request_meta_data)
+        self.assertEqual([3, None], [s.in_flight_requests for s in samples])
+
+
 class MetricsAggregationTests(TestCase):
     def setUp(self):
         params.register_param_source_for_name("driver-test-param-source", DriverTestParamSource)
@@ -256,6 +366,162 @@ class MetricsAggregationTests(TestCase):
         self.assertEqual((1470838600, 26, metrics.SampleType.Normal, 6666.666666666667, "docs/s"), throughput[5])
         # self.assertEqual((1470838600.5, 26.5, metrics.SampleType.Normal, 10000), throughput[6])
 
+    def test_calculates_throughput_from_sample_buffers_of_multiple_clients(self):
+        op = track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source")
+        task = track.Task(op)
+
+        buffers = []
+        for client_id in range(2):
+            for batch in range(2):
+                buffer = driver.SampleBuffer(client_id, task, chunk_size=2)
+                for i in range(batch * 3, batch * 3 + 3):
+                    t = i + client_id * 0.5
+                    sample_type = metrics.SampleType.Warmup if i < 2 else metrics.SampleType.Normal
+                    buffer.add(1470838595 + t, 21 + t, sample_type, {"success": True}, -1, -1, 5000, "docs", i + 1, 0.5)
+                buffer.trim()
+                buffers.append(buffer)
+
+        throughput = driver.calculate_global_throughput(buffers)[task]
+        # individual samples must produce the identical result
+        self.assertEqual(driver.calculate_global_throughput([s for b in buffers for s in b])[task], throughput)
+        self.assertEqual(6, len(throughput))
+        self.assertEqual((1470838595, 21, metrics.SampleType.Warmup, 5000, "docs/s"), throughput[0])
+        self.assertEqual((1470838596, 22, metrics.SampleType.Warmup, 7500, "docs/s"), throughput[1])
+        self.assertEqual((1470838597, 23, metrics.SampleType.Normal, 25000 / 3, "docs/s"), throughput[2])
+        self.assertEqual((1470838600, 26, metrics.SampleType.Normal, 55000 / 6, "docs/s"), throughput[5])
+
+    def test_calculates_throughput_for_unordered_samples(self):
+        op = track.Operation("index", track.OperationType.Index, param_source="driver-test-param-source")
+
+        samples = [
+            driver.Sample(0, 1470838597, 23, op, metrics.SampleType.Normal, None, -1, -1, 5000, "docs", 3, 3 / 3),
+            driver.Sample(0, 1470838595, 21, op, metrics.SampleType.Normal, None, -1, -1, 5000, "docs", 1, 1 / 3),
+            driver.Sample(0, 1470838596, 22, op, metrics.SampleType.Normal, None, -1, -1, 5000, "docs", 2, 2 / 3),
+        ]
+
+        throughput = driver.calculate_global_throughput(samples)[op]
+        self.assertEqual(3, len(throughput))
+        self.assertEqual((1470838595, 21, metrics.SampleType.Normal, 5000, "docs/s"), throughput[0])
+        self.assertEqual((1470838597, 23, metrics.SampleType.Normal, 5000, "docs/s"), throughput[2])
+
+
+class AggregatedSamplesPostProcessingTests(TestCase):
+    def test_stores_one_document_per_histogram(self):
+        d = driver.Driver()
+        d.config = mock.Mock()
+        d.config.opts.return_value = 1000
+        d.track = track.Track(name="unittest", short_description="unittest track", description="unittest track")
+        d.challenge = track.Challenge(name="default", description="default challenge")
+        d.metrics_store = mock.create_autospec(metrics.MetricsStore)
+
+        op = track.Operation("index", track.OperationType.Index)
+        sampler = driver.Sampler(client_id=0, task=track.Task(op), start_timestamp=0)
+        for i in range(100):
+            sampler.add(metrics.SampleType.Normal, {"success": False, "http-status": 500}, 10, 5, 1, "ops", 1, 1.0)
+        d.update_samples(driver.UpdateSamples(0, aggregation.AggregatedSamples(0).add_all(sampler.samples)))
+        d.post_process_aggregated_samples()
+
+        docs = {c[1]["name"]: c[1] for c in d.metrics_store.put_value_cluster_level.call_args_list}
+        self.assertEqual({"latency", "service_time", "throughput"}, set(docs.keys()))
+        self.assertEqual(100, len(docs["latency"]["value"]))
+        meta_data = docs["service_time"]["meta_data"]
+        self.assertFalse(meta_data["success"])
+        self.assertEqual(500, meta_data["http-status"])
+        self.assertEqual(100, meta_data["histogram"]["count"])
+        self.assertEqual(5, meta_data["histogram"]["mean"])
+
+
+class StreamingMetricsTests(TestCase):
+    def create_driver(self, flush_interval):
+        d = driver.Driver()
+        d.track = track.Track(name="unittest", short_description="unittest track", description="unittest track")
+        d.challenge = track.Challenge(name="default", description="default challenge")
+        d.metrics_store = mock.create_autospec(metrics.MetricsStore)
+        d.stream_metrics = True
+        d.metrics_flush_interval = flush_interval
+        d.last_metrics_flush = time.perf_counter()
+        return d
+
+    def samples(self):
+        op = track.Operation("index", track.OperationType.Index)
+        sampler = driver.Sampler(client_id=0, task=track.Task(op), start_timestamp=0)
+        sampler.add(metrics.SampleType.Normal, {"success": True}, 10, 5, 1, "ops", 1, 1.0)
+        return sampler.samples
+
+    def test_stores_and_flushes_metrics_per_batch(self):
+        d = self.create_driver(flush_interval=0)
+        d.update_samples(driver.UpdateSamples(0, self.samples()))
+
+        self.assertEqual(2, d.metrics_store.put_value_cluster_level.call_count)
+        d.metrics_store.flush.assert_called_once_with()
+
+    def test_flushes_only_after_interval(self):
+        d = self.create_driver(flush_interval=3600)
+        d.update_samples(driver.UpdateSamples(0, self.samples()))
+
+        self.assertEqual(2, d.metrics_store.put_value_cluster_level.call_count)
+        d.metrics_store.flush.assert_not_called()
+
+        d.flush_metrics(force=True)
+        d.metrics_store.flush.assert_called_once_with()
+
+    def test_does_not_retain_raw_samples(self):
+        d = self.create_driver(flush_interval=3600)
+        for _ in range(3):
+            d.update_samples(driver.UpdateSamples(0, self.samples()))
+
+        self.assertEqual([], d.raw_samples)
+        self.assertEqual(3, len(d.streamed_throughput))
+        d.metrics_store.reset_mock()
+        d.post_process_samples()
+        # only throughput is stored
+        self.assertEqual({"throughput"}, {c[1]["name"] for c in d.metrics_store.put_value_cluster_level.call_args_list})
+
+    def test_does_not_store_request_metrics_twice(self):
+        d = self.create_driver(flush_interval=3600)
+        d.update_samples(driver.UpdateSamples(0, self.samples()))
+        d.post_process_samples()
+
+        names = [c[1]["name"] for c in d.metrics_store.put_value_cluster_level.call_args_list]
+        self.assertEqual(["latency", "service_time", "throughput"], names)
+
+
+class WaitTests(TestCase):
+    class FakeClock:
+        def __init__(self, now=0.0, tick=0.0001):
+            self.now = now
+            self.tick = tick
+            self.sleeps = []
+
+        def __call__(self):
+            # each clock invocation advances time a little bit so busy-waiting terminates
+            self.now += self.tick
+            return self.now
+
+        def sleep(self, seconds):
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+    def test_sleeps_coarsely_and_spins_until_deadline(self):
+        clock = WaitTests.FakeClock()
+        driver.wait_until(1.0, clock=clock, sleep=clock.sleep)
+        self.assertEqual(1, len(clock.sleeps))
+        self.assertAlmostEqual(1.0 - 0.0001 - driver.SPIN_WAIT_SECONDS, clock.sleeps[0])
+        self.assertGreaterEqual(clock.now, 1.0)
+        self.assertLess(clock.now, 1.0 + 2 * clock.tick)
+
+    def test_only_spins_for_short_waits(self):
+        clock = WaitTests.FakeClock()
+        driver.wait_until(0.0003, clock=clock, sleep=clock.sleep)
+        self.assertEqual(0, len(clock.sleeps))
+        self.assertGreaterEqual(clock.now, 0.0003)
+
+    def test_does_not_wait_if_deadline_has_passed(self):
+        clock = WaitTests.FakeClock(now=5.0)
+        driver.wait_until(1.0, clock=clock, sleep=clock.sleep)
+        self.assertEqual(0, len(clock.sleeps))
+        self.assertAlmostEqual(5.0002, clock.now)
+
 
 class SchedulerTests(ScheduleTestCase):
     def setUp(self):
@@ -318,6 +584,35 @@ class SchedulerTests(ScheduleTestCase):
             (10.0, metrics.SampleType.Normal, 11 / 11, {"body": ["a"], "size": 11}),
         ], list(invocations))
 
+    def test_schedule_until_param_source_is_exhausted(self):
+        class ExhaustibleParamSource:
+            def __init__(self, iterations):
+                self.remaining = iterations
+
+            def size(self):
+                return None
+
+            def estimated_size(self):
+                return 4
+
+            def params(self):
+                if self.remaining == 0:
+                    raise StopIteration()
+                self.remaining -= 1
+                return {"remaining": self.remaining}
+
+        invocations = driver.time_period_based(scheduler.DeterministicScheduler({"target-throughput": 1}), 0, None, "runner",
+                                               ExhaustibleParamSource(iterations=5))
+
+        self.assert_schedule([
+            (0.0, metrics.SampleType.Normal, 1 / 4, {"remaining": 4}),
+            (1.0, metrics.SampleType.Normal, 2 / 4, {"remaining": 3}),
+            (2.0, metrics.SampleType.Normal, 3 / 4, {"remaining": 2}),
+            (3.0, metrics.SampleType.Normal, 4 / 4, {"remaining": 1}),
+            # the estimate was too low
+            (4.0, metrics.SampleType.Normal, 4 / 4, {"remaining": 0}),
+        ], list(invocations))
+
     def test_schedule_for_time_based(self):
         task = track.Task(track.Operation("time-based", track.OperationType.Index.name, params={"body": ["a"], "size": 11},
                                           param_source="driver-test-param-source"), warmup_time_period=0.1, time_period=0.1, clients=1)
@@ -444,6 +739,111 @@ class ExecutorTests(TestCase):
             self.assertTrue(lower_bound <= sample_size <= upper_bound,
                             msg="Expected sample size to be between %d and %d but was %d" % (lower_bound, upper_bound, sample_size))
 
+    def test_execute_schedule_records_schedule_lag_for_throttled_requests(self):
+        runner = mock.Mock()
+        schedule = [(0, metrics.SampleType.Normal, 0.5, self.context_managed(runner), {}),
+                    (0.01, metrics.SampleType.Normal, 1.0, self.context_managed(runner), {})]
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        driver.execute_schedule(threading.Event(), 0, "operation_name", schedule, None, sampler)
+
+        samples = sampler.samples
+        self.assertEqual(2, len(samples))
+        # the first request is not throttled
+        self.assertIsNone(samples[0].schedule_lag_ms)
+        self.assertIsNotNone(samples[1].schedule_lag_ms)
+        self.assertGreaterEqual(samples[1].schedule_lag_ms, 0)
+
+    def test_execute_schedule_in_open_loop_mode(self):
+        in_flight = []
+        lock = threading.Lock()
+
+        def run(es, params):
+            with lock:
+                in_flight.append(True)
+            # take much longer than the target interval
+            time.sleep(0.05)
+            return 1, "ops"
+
+        # the first request is issued immediately, all other requests every 5 ms
+        schedule = [(i * 0.005, metrics.SampleType.Normal, (i + 1) / 10, self.context_managed(run), {}) for i in range(10)]
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        cancel = threading.Event()
+        start = time.perf_counter()
+        driver.execute_schedule(cancel, 0, "operation_name", schedule, None, sampler, max_in_flight_requests=10)
+        duration = time.perf_counter() - start
+
+        samples = sampler.samples
+        self.assertEqual(10, len(samples))
+        # requests are not delayed by outstanding responses
+        self.assertLess(duration, 0.3)
+        self.assertGreater(max([s.in_flight_requests for s in samples]), 1)
+        for sample in samples:
+            self.assertTrue(sample.request_meta_data["success"])
+            self.assertGreaterEqual(sample.latency_ms, sample.service_time_ms)
+
+    def test_execute_schedule_in_open_loop_mode_respects_in_flight_limit(self):
+        def run(es, params):
+            time.sleep(0.01)
+
+        schedule = [(i * 0.001, metrics.SampleType.Normal, (i + 1) / 20, self.context_managed(run), {}) for i in range(20)]
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        driver.execute_schedule(threading.Event(), 0, "operation_name", schedule, None, sampler, max_in_flight_requests=2)
+
+        samples = sampler.samples
+        self.assertEqual(20, len(samples))
+        self.assertEqual(2, max([s.in_flight_requests for s in samples]))
+
+    def test_execute_schedule_in_open_loop_mode_creates_stateful_runner_per_request(self):
+        stateful_runner = runner.runner_for(track.OperationType.Search.name)
+        schedule = [(i * 0.001, metrics.SampleType.Normal, (i + 1) / 5, stateful_runner, {}) for i in range(5)]
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        with mock.patch.object(runner.Query, "__call__", autospec=True, return_value=(1, "ops")) as call:
+            driver.execute_schedule(threading.Event(), 0, "operation_name", schedule, None, sampler, max_in_flight_requests=5)
+
+        self.assertEqual(5, len(sampler.samples))
+        instances = {id(c[0][0]) for c in call.call_args_list}
+        self.assertEqual(5, len(instances))
+        self.assertNotIn(id(stateful_runner), instances)
+
+    def test_execute_schedule_in_open_loop_mode_aborts_on_error(self):
+        class ExpectedUnitTestException(Exception):
+            pass
+
+        def run(*args, **kwargs):
+            raise ExpectedUnitTestException()
+
+        schedule = [(0, metrics.SampleType.Warmup, 0, self.context_managed(run), None)]
+        sampler = driver.Sampler(client_id=0, task=None, start_timestamp=0)
+        with self.assertRaises(ExpectedUnitTestException):
+            driver.execute_schedule(threading.Event(), 0, "operation_name", schedule, None, sampler, max_in_flight_requests=4)
+
+    def test_max_in_flight_requests(self):
+        op = track.Operation("search", track.OperationType.Search.name)
+        self.assertIsNone(driver.max_in_flight_requests(track.Task(op, params={"target-throughput": 10})))
+        self.assertEqual(32, driver.max_in_flight_requests(track.Task(op, params={"target-throughput": 10, "open-loop": True})))
+        self.assertEqual(4, driver.max_in_flight_requests(track.Task(op, params={"target-interval": 1, "open-loop": True,
+                                                                                 "max-in-flight-requests": 4})))
+
+    def test_open_loop_requires_throttled_task(self):
+        op = track.Operation("search", track.OperationType.Search.name)
+        with self.assertRaises(exceptions.SystemSetupError):
+            driver.max_in_flight_requests(track.Task(op, params={"open-loop": True}))
+
+    def test_max_in_flight_requests_must_be_positive(self):
+        op = track.Operation("search", track.OperationType.Search.name)
+        with self.assertRaises(exceptions.SystemSetupError):
+            driver.max_in_flight_requests(track.Task(op, params={"target-throughput": 10, "open-loop": True,
+                                                                 "max-in-flight-requests": 0}))
+
+    def test_sizes_connection_pool_for_in_flight_requests(self):
+        op = track.Operation("search", track.OperationType.Search.name)
+        closed_loop = track.Task(op, params={"target-throughput": 10})
+        open_loop = track.Task(op, params={"target-throughput": 10, "open-loop": True})
+        self.assertEqual({"timeout": 60}, driver.client_options({"timeout": 60}, [closed_loop, driver.JoinPoint(1)]))
+        self.assertEqual({"maxsize": 32}, driver.client_options(None, [closed_loop, driver.JoinPoint(1), open_loop]))
+        # respect the user's choice
+        self.assertEqual({"maxsize": 4}, driver.client_options({"maxsize": 4}, [open_loop]))
+
     @mock.patch("elasticsearch.Elasticsearch")
     def test_cancel_execute_schedule(self, es):
         es.bulk.return_value = {
@@ -505,6 +905,15 @@ class ExecutorTests(TestCase):
         self.assertEqual("ops", total_ops_unit)
         self.assertEqual({"success": True}, request_meta_data)
 
+    def test_execute_single_activates_request_timings(self):
+        timings = client.RequestTimings()
+
+        def runner(es, params):
+            self.assertIs(timings, client.current_request_timings())
+
+        driver.execute_single(self.context_managed(runner), None, None, timings)
+        self.assertIsNone(client.current_request_timings())
+
     def test_execute_single_tuple(self):
         es = None
         params = None
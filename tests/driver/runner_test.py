@@ -1,9 +1,38 @@
+import json
 import unittest.mock as mock
 from unittest import TestCase
 
+from esrally import client
 from esrally.driver import runner
 
 
+class RegisterRunnerTests(TestCase):
+    def test_creates_runner_instance_per_client(self):
+        self.assertIsInstance(runner.runner_for("SlicedScroll"), runner.SlicedScroll)
+        self.assertIsNot(runner.runner_for("SlicedScroll"), runner.runner_for("SlicedScroll"))
+        self.assertIsNot(runner.runner_for("Search"), runner.runner_for("Search"))
+
+    def test_creates_instance_per_request_only_for_stateful_runners(self):
+        query = runner.runner_for("Search")
+        self.assertIsInstance(runner.instance_per_request(query), runner.Query)
+        self.assertIsNot(query, runner.instance_per_request(query))
+        bulk = runner.runner_for("Index")
+        self.assertIs(bulk, runner.instance_per_request(bulk))
+
+    def test_does_not_instantiate_custom_runner_classes(self):
+        class CustomRunner(runner.Runner):
+            def __call__(self, es, params):
+                return 1, "ops"
+
+        runner.register_runner("custom-class-for-test", CustomRunner)
+        self.assertIs(CustomRunner, runner.runner_for("custom-class-for-test"))
+
+    def test_shares_custom_runner_objects(self):
+        custom_runner = runner.Query()
+        runner.register_runner("custom-object-for-test", custom_runner)
+        self.assertIs(custom_runner, runner.runner_for("custom-object-for-test"))
+
+
 class BulkIndexRunnerTests(TestCase):
     @mock.patch("elasticsearch.Elasticsearch")
     def test_bulk_index_success_with_metadata(self, es):
@@ -33,7 +62,7 @@ class BulkIndexRunnerTests(TestCase):
         self.assertEqual(True, result["success"])
         self.assertEqual(0, result["error-count"])
 
-        es.bulk.assert_called_with(body=bulk_params["body"], params={})
+        es.bulk.assert_called_with(body=bulk_params["body"], params=client.raw_response_params())
 
     @mock.patch("elasticsearch.Elasticsearch")
     def test_bulk_index_success_without_metadata(self, es):
@@ -62,7 +91,73 @@ class BulkIndexRunnerTests(TestCase):
         self.assertEqual(True, result["success"])
         self.assertEqual(0, result["error-count"])
 
-        es.bulk.assert_called_with(body=bulk_params["body"], index="test-index", doc_type="test-type", params={})
+        es.bulk.assert_called_with(body=bulk_params["body"], index="test-index", doc_type="test-type", params=client.raw_response_params())
+
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_bulk_index_passes_bytes_body_unchanged(self, es):
+        es.transport.perform_request.return_value = {
+            "errors": False
+        }
+        bulk = runner.BulkIndex()
+
+        bulk_params = {
+            "body": b"index_line\nindex_line\n",
+            "action_metadata_present": False,
+            "bulk-size": 2,
+            "index": "test-index",
+            "type": "test-type",
+            "pipeline": "test-pipeline"
+        }
+
+        result = bulk(es, bulk_params)
+
+        self.assertEqual(2, result["bulk-size"])
+        self.assertEqual(True, result["success"])
+
+        es.transport.perform_request.assert_called_with("POST", "/test-index/test-type/_bulk", params=client.raw_response_params({"pipeline": "test-pipeline"}),
+                                                        body=b"index_line\nindex_line\n")
+        es.bulk.assert_not_called()
+
+    @mock.patch("json.loads")
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_raw_bulk_response_without_errors_is_not_deserialized(self, es, json_loads):
+        es.transport.perform_request.return_value = b'{"took":30,"errors":false,"items":[{"index":{"status":201,"errors":true}}]}'
+        bulk = runner.BulkIndex()
+
+        result = bulk(es, {
+            "body": b"index_line\n",
+            "action_metadata_present": True,
+            "bulk-size": 1
+        })
+
+        self.assertEqual(True, result["success"])
+        self.assertEqual(0, result["error-count"])
+        json_loads.assert_not_called()
+
+    @mock.patch("elasticsearch.Elasticsearch")
+    def test_raw_bulk_response_with_errors(self, es):
+        es.transport.perform_request.return_value = b'{"took":30, "errors" : true,"items":[' \
+                                                    b'{"index":{"result":"created","_shards":{"total":2,"successful":1,"failed":0},"status":201}},' \
+                                                    b'{"index":{"result":"noop","_shards":{"total":2,"successful":0,"failed":2},"status":500}}]}'
+        bulk = runner.BulkIndex()
+        bulk_params = {
+            "body": b"index_line\nindex_line\n",
+            "action_metadata_present": True,
+            "bulk-size": 2
+        }
+
+        result = bulk(es, bulk_params)
+        self.assertEqual(False, result["success"])
+        self.assertEqual(1, result["error-count"])
+
+        bulk_params["detailed-results"] = True
+        result = bulk(es, bulk_params)
+        self.assertEqual(1, result["error-count"])
+        self.assertEqual({"index": {"item-count": 2, "created": 1, "noop": 1}}, result["ops"])
+        self.assertEqual([
+            {"item-count": 1, "shards": {"total": 2, "successful": 1, "failed": 0}},
+            {"item-count": 1, "shards": {"total": 2, "successful": 0, "failed": 2}}
+        ], result["shards_histogram"])
 
     @mock.patch("elasticsearch.Elasticsearch")
     def test_bulk_index_error(self, es):
@@ -124,7 +219,7 @@ class BulkIndexRunnerTests(TestCase):
         self.assertEqual(False, result["success"])
         self.assertEqual(2, result["error-count"])
 
-        es.bulk.assert_called_with(body=bulk_params["body"], params={})
+        es.bulk.assert_called_with(body=bulk_params["body"], params=client.raw_response_params())
 
     @mock.patch("elasticsearch.Elasticsearch")
     def test_mixed_bulk_with_simple_stats(self, es):
@@ -226,7 +321,7 @@ class BulkIndexRunnerTests(TestCase):
         self.assertEqual(False, result["success"])
         self.assertEqual(2, result["error-count"])
 
-        es.bulk.assert_called_with(body=bulk_params["body"], params={})
+        es.bulk.assert_called_with(body=bulk_params["body"], params=client.raw_response_params())
 
     @mock.patch("elasticsearch.Elasticsearch")
     def test_mixed_bulk_with_detailed_stats(self, es):
@@ -407,4 +502,120 @@ class BulkIndexRunnerTests(TestCase):
                 }
             ], result["shards_histogram"])
 
-        es.bulk.assert_called_with(body=bulk_params["body"], params={})
+        es.bulk.assert_called_with(body=bulk_params["body"], params=client.raw_response_params())
+
+
+class SlicedScrollTests(TestCase):
+    @staticmethod
+    def page(scroll_id, hits):
+        return {"_scroll_id": scroll_id, "hits": {"hits": [{"_id": str(i)} for i in range(hits)]}}
+
+    def params(self, **kwargs):
+        p = {
+            "index": "logs",
+            "type": "doc",
+            "use_request_cache": False,
+            "body": {"query": {"match_all": {}}},
+            "slices": 2,
+            "items_per_page": 3,
+            "scroll": "10s"
+        }
+        p.update(kwargs)
+        return p
+
+    def test_scrolls_all_slices(self):
+        es = mock.Mock()
+        es.search.side_effect = lambda body, **kwargs: self.page("slice-%d" % body["slice"]["id"], 3)
+        # number of hits of the remaining pages per slice
+        remaining_pages = {"slice-0": iter([2, 0]), "slice-1": iter([0])}
+        es.scroll.side_effect = lambda body: self.page(body["scroll_id"], next(remaining_pages[body["scroll_id"]]))
+
+        with runner.SlicedScroll() as sliced_scroll:
+            result = sliced_scroll(es, self.params())
+
+        self.assertEqual(8, result["weight"])
+        self.assertEqual("docs", result["unit"])
+        self.assertEqual(2, result["slices"])
+        self.assertEqual(5, result["pages"])
+        self.assertGreaterEqual(result["page-latency-max"], result["page-latency-mean"])
+        self.assertGreaterEqual(result["clear-scroll-time"], 0)
+
+        slices = sorted(c[1]["body"]["slice"]["id"] for c in es.search.call_args_list)
+        self.assertEqual([0, 1], slices)
+        # the query body of the track is not modified
+        self.assertNotIn("slice", self.params()["body"])
+        es.clear_scroll.assert_called_once_with(body={"scroll_id": mock.ANY})
+        self.assertEqual(["slice-0", "slice-1"], sorted(es.clear_scroll.call_args[1]["body"]["scroll_id"]))
+
+    def test_single_slice_does_not_slice_query(self):
+        es = mock.Mock()
+        es.search.return_value = self.page("scroll-1", 3)
+        es.scroll.return_value = self.page("scroll-2", 3)
+
+        with runner.SlicedScroll() as sliced_scroll:
+            result = sliced_scroll(es, self.params(slices=1, pages=2))
+
+        self.assertEqual(6, result["weight"])
+        self.assertEqual(2, result["pages"])
+        self.assertEqual({"query": {"match_all": {}}}, es.search.call_args[1]["body"])
+        es.scroll.assert_called_once_with(body={"scroll_id": "scroll-1", "scroll": "10s"})
+        # the most recent scroll id is cleared
+        es.clear_scroll.assert_called_once_with(body={"scroll_id": ["scroll-2"]})
+
+    def test_clears_scroll_on_failure(self):
+        es = mock.Mock()
+        es.search.return_value = self.page("scroll-1", 3)
+        es.scroll.side_effect = RuntimeError("connection lost")
+
+        with self.assertRaises(RuntimeError):
+            with runner.SlicedScroll() as sliced_scroll:
+                sliced_scroll(es, self.params(slices=1))
+
+        es.clear_scroll.assert_called_once_with(body={"scroll_id": ["scroll-1"]})
+
+    def test_merges_request_timings_of_all_slices(self):
+        es = mock.Mock()
+
+        def search(body, **kwargs):
+            timings = client.current_request_timings()
+            timings.requests += 1
+            return self.page("slice-%d" % body["slice"]["id"], 0)
+
+        es.search.side_effect = search
+
+        with client.RequestTimings() as timings:
+            with runner.SlicedScroll() as sliced_scroll:
+                sliced_scroll(es, self.params(slices=3))
+
+        self.assertEqual(3, timings.requests)
+
+
+class MultiSearchTests(TestCase):
+    def test_counts_failed_queries(self):
+        es = mock.Mock()
+        es.transport.perform_request.return_value = client.RawResponse(json.dumps({
+            "responses": [
+                {"took": 1, "hits": {"total": 0, "hits": []}},
+                {"error": {"type": "query_parsing_exception"}, "status": 400}
+            ]
+        }).encode("utf-8"))
+        body = b'{"index": "logs"}\n{"query": {"match_all": {}}}\n{"index": "logs"}\n{"query": {"match": {}}}\n'
+
+        result = runner.MultiSearch()(es, {"body": body, "queries": 2})
+
+        self.assertEqual({
+            "weight": 2,
+            "unit": "queries",
+            "success": False,
+            "success-count": 1,
+            "error-count": 1
+        }, result)
+        es.transport.perform_request.assert_called_once_with("POST", "/_msearch", params=client.raw_response_params(), body=body)
+
+    def test_does_not_deserialize_successful_responses(self):
+        self.assertEqual(0, runner.MultiSearch.error_count(client.RawResponse(b'{"responses": [{"hits": {"hits": []}}]}')))
+        self.assertEqual(0, runner.MultiSearch.error_count({"responses": [{"hits": {"hits": []}}]}))
+
+    def test_counts_errors_in_raw_responses(self):
+        self.assertEqual(1, runner.MultiSearch.error_count(b'{"responses": [{"hits": {}}, {"error": {"type": "parse_exception"}}]}'))
+        self.assertEqual(1, runner.MultiSearch.error_count({"responses": [{"hits": {}}, {"error": {"type": "parse_exception"}}]}))
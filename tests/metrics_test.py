@@ -366,8 +366,10 @@ class EsMetricsTests(TestCase):
             {
                 "key": 1,
                 "key_as_string": "true",
-                "doc_count": 0
-
+                "doc_count": 0,
+                "request_count": {
+                    "value": 0
+                }
             }
         ]))
 
@@ -376,12 +378,18 @@ class EsMetricsTests(TestCase):
             {
                 "key": 0,
                 "key_as_string": "false",
-                "doc_count": 0
+                "doc_count": 0,
+                "request_count": {
+                    "value": 0
+                }
             },
             {
                 "key": 1,
                 "key_as_string": "true",
-                "doc_count": 500
+                "doc_count": 500,
+                "request_count": {
+                    "value": 500
+                }
             }
         ]))
 
@@ -390,7 +398,10 @@ class EsMetricsTests(TestCase):
             {
                 "key": 0,
                 "key_as_string": "false",
-                "doc_count": 123
+                "doc_count": 123,
+                "request_count": {
+                    "value": 123
+                }
             }
         ]))
 
@@ -399,12 +410,18 @@ class EsMetricsTests(TestCase):
             {
                 "key": 0,
                 "key_as_string": "false",
-                "doc_count": 123
+                "doc_count": 123,
+                "request_count": {
+                    "value": 123
+                }
             },
             {
                 "key": 1,
                 "key_as_string": "true",
-                "doc_count": 0
+                "doc_count": 0,
+                "request_count": {
+                    "value": 0
+                }
             }
         ]))
 
@@ -413,12 +430,38 @@ class EsMetricsTests(TestCase):
             {
                 "key": 0,
                 "key_as_string": "false",
-                "doc_count": 500
+                "doc_count": 500,
+                "request_count": {
+                    "value": 500
+                }
+            },
+            {
+                "key": 1,
+                "key_as_string": "true",
+                "doc_count": 500,
+                "request_count": {
+                    "value": 500
+                }
+            }
+        ]))
+
+    def test_get_error_rate_counts_requests_instead_of_documents(self):
+        self.assertEqual(0.1, self._get_error_rate(buckets=[
+            {
+                "key": 0,
+                "key_as_string": "false",
+                "doc_count": 5,
+                "request_count": {
+                    "value": 10
+                }
             },
             {
                 "key": 1,
                 "key_as_string": "true",
-                "doc_count": 500
+                "doc_count": 5,
+                "request_count": {
+                    "value": 90
+                }
             }
         ]))
 
@@ -427,17 +470,26 @@ class EsMetricsTests(TestCase):
             {
                 "key": 0,
                 "key_as_string": "false",
-                "doc_count": 500
+                "doc_count": 500,
+                "request_count": {
+                    "value": 500
+                }
             },
             {
                 "key": 1,
                 "key_as_string": "true",
-                "doc_count": 1500
+                "doc_count": 1500,
+                "request_count": {
+                    "value": 1500
+                }
             },
             {
                 "key": 2,
                 "key_as_string": "undefined_for_test",
-                "doc_count": 13700
+                "doc_count": 13700,
+                "request_count": {
+                    "value": 13700
+                }
             }
         ]))
 
@@ -508,6 +560,13 @@ class EsMetricsTests(TestCase):
                 "error_rate": {
                     "terms": {
                         "field": "meta.success"
+                    },
+                    "aggs": {
+                        "request_count": {
+                            "value_count": {
+                                "field": "value"
+                            }
+                        }
                     }
                 }
             }
@@ -720,3 +779,20 @@ class InMemoryMetricsStoreTests(TestCase):
 
         self.assertEqual(0.0, self.metrics_store.get_error_rate("term-query", sample_type=metrics.SampleType.Warmup))
         self.assertEqual(0.2, self.metrics_store.get_error_rate("term-query", sample_type=metrics.SampleType.Normal))
+
+    def test_multiple_values_per_document(self):
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
+        self.metrics_store.lap = 1
+        self.metrics_store.put_value_cluster_level("service_time", [float(i) for i in range(1, 91)], "ms", operation="term-query",
+                                                   meta_data={"success": True})
+        self.metrics_store.put_value_cluster_level("service_time", [float(i) for i in range(91, 101)], "ms", operation="term-query",
+                                                   meta_data={"success": False})
+
+        self.metrics_store.close()
+
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults")
+
+        self.assertEqual(100, len(self.metrics_store.get("service_time")))
+        self.assertEqual(100, self.metrics_store.get_count("service_time"))
+        self.assertEqual(0.1, self.metrics_store.get_error_rate("term-query"))
+        self.assert_equal_percentiles("service_time", [100.0], {100.0: 100.0})
@@ -45,6 +45,45 @@ class StatsTests(TestCase):
         self.assertEqual(collections.OrderedDict([(50.0, 200), (100, 215)]), stats.op_metrics["index"]["service_time"])
         self.assertAlmostEqual(0.3333333333333333, stats.op_metrics["index"]["error_rate"])
 
+        self.assertEqual({}, stats.op_metrics["index"]["time_breakdown"])
+
+    def test_calculates_time_breakdown(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "system", "env.name", "unittest")
+
+        store = metrics.InMemoryMetricsStore(cfg=cfg)
+        store.open(datetime.datetime.now(), "test", "unittest", "unittest_car")
+        store.lap = 1
+
+        for name, values in [("service_time", [20, 30]), ("server_time", [10, 14]), ("connection_wait_time", [0, 2]),
+                             ("wire_time", [16, 20]), ("deserialization_time", [1, 3])]:
+            for value in values:
+                store.put_value_cluster_level(name, value, unit="ms", operation="search", operation_type=track.OperationType.Search,
+                                              meta_data={"success": True})
+
+        search = track.Task(operation=track.Operation(name="search", operation_type=track.OperationType.Search, params=None))
+        challenge = track.Challenge(name="unittest", description="", index_settings=None, schedule=[search])
+
+        stats = reporter.Stats(store, challenge)
+        self.assertEqual({
+            "service_time": 25,
+            "server_time": 12,
+            "connection_wait_time": 1,
+            "wire_time": 18,
+            "deserialization_time": 2
+        }, stats.op_metrics["search"]["time_breakdown"])
+
+        lines = reporter.SummaryReporter(None, store, cfg, lap=None).report_time_breakdown(stats, search.operation)
+        self.assertEqual([
+            ["All", "Mean service time", "search", 25, "ms"],
+            ["All", "Mean server-side time (took)", "search", 12, "ms"],
+            ["All", "Mean network time", "search", 6, "ms"],
+            ["All", "Mean connection wait time", "search", 1, "ms"],
+            ["All", "Mean deserialization time", "search", 2, "ms"],
+            ["All", "Mean client-side overhead", "search", 4, "ms"],
+            ["All", "Server-side share of service time", "search", "48.00", "%"]
+        ], lines)
+
 
 class ComparisonReporterTests(TestCase):
     def test_formats_table(self):
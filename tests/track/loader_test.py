@@ -3,7 +3,7 @@ from unittest import TestCase
 
 import jinja2
 
-from esrally.track import loader
+from esrally.track import loader, track
 
 
 def strip_ws(s):
@@ -296,6 +296,34 @@ class TrackSpecificationReaderTests(TestCase):
         self.assertEqual("longer description of this track for unit test", resulting_track.description)
         self.assertEqual("https://localhost/data", resulting_track.source_root_url)
 
+    def test_resolves_query_log_relative_to_track(self):
+        track_specification = {
+            "short-description": "short description for unit test",
+            "description": "longer description of this track for unit test",
+            "indices": [{"name": "test-index", "auto-managed": False}],
+            "operations": [
+                {
+                    "name": "replay",
+                    "operation-type": "msearch",
+                    "queries": "queries.json"
+                }
+            ],
+            "challenges": [
+                {
+                    "name": "default-challenge",
+                    "description": "Default challenge",
+                    "schedule": [{"operation": "replay"}]
+                }
+            ]
+        }
+        reader = loader.TrackSpecificationReader()
+        resulting_track = reader("unittest", track_specification, "/tracks/unittest", "/data")
+        op = resulting_track.challenges[0].schedule[0].operation
+        self.assertEqual(track.OperationType.MultiSearch.name, op.type)
+        self.assertEqual("/tracks/unittest/queries.json", op.params["queries"])
+        # the track specification is not modified
+        self.assertEqual("queries.json", track_specification["operations"][0]["queries"])
+
     def test_parse_with_mixed_warmup_iterations_and_measurement(self):
         track_specification = {
             "short-description": "short description for unit test",
@@ -1,43 +1,15 @@
+import gzip
+import json
+import os
+import tempfile
+import time
 from unittest import TestCase
 
-from esrally import exceptions
-from esrally.utils import io
+from esrally import client, exceptions
+from esrally.utils import archive
 from esrally.track import params, track
 
 
-class SliceTests(TestCase):
-    def test_slice_with_source_larger_than_slice(self):
-        source = params.Slice(io.StringAsFileSource, 2, 5)
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}',
-            '{"key": "value8"}',
-            '{"key": "value9"}',
-            '{"key": "value10"}'
-        ]
-
-        source.open(data, "r")
-        self.assertEqual(data[2:7], list(source))
-        source.close()
-
-    def test_slice_with_slice_larger_than_source(self):
-        source = params.Slice(io.StringAsFileSource, 0, 5)
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-        ]
-
-        source.open(data, "r")
-        self.assertEqual(data, list(source))
-        source.close()
-
-
 class ConflictingIdsBuilderTests(TestCase):
     def test_no_id_conflicts(self):
         self.assertIsNone(params.build_conflicting_ids(None, 100, 0))
@@ -58,7 +30,7 @@ class ConflictingIdsBuilderTests(TestCase):
                 "         9",
                 "        10",
             ],
-            params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 11, 0)
+            list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 11, 0))
         )
 
         self.assertEqual(
@@ -75,37 +47,46 @@ class ConflictingIdsBuilderTests(TestCase):
                 "        14",
                 "        15",
             ],
-            params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 11, 5)
+            list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 11, 5))
         )
 
     def test_random_conflicts(self):
-        self.assertEqual(
-            [
-                "         3",
-                "         3",
-                "         3"
-            ],
-            params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 3, 0, rand=lambda x, y: y)
-        )
-
-        self.assertEqual(
-            [
-                "         8",
-                "         8",
-                "         8"
-            ],
-            params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 3, 5, rand=lambda x, y: y)
-        )
+        ids = list(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 100, 5, seed=42))
+        self.assertEqual(100, len(ids))
+        self.assertTrue(all(5 <= int(doc_id) <= 105 for doc_id in ids))
+        # ids are random...
+        self.assertGreater(len(set(ids)), 50)
+        # ... but are derived only from the seed and the position
+        self.assertEqual(ids, list(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 100, 5, seed=42)))
+        self.assertNotEqual(ids, list(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 100, 5, seed=43)))
+
+    def test_random_ids_are_stable_without_being_stored(self):
+        ids = params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 10 ** 12, 0)
+        self.assertEqual(10 ** 12, len(ids))
+        self.assertEqual(ids[10 ** 12 - 1], ids[10 ** 12 - 1])
+        self.assertEqual(ids[7], ids[7])
+        self.assertFalse(hasattr(ids, "random_ids"))
+        with self.assertRaises(IndexError):
+            ids[10 ** 12]
+
+    def test_sequential_ids_do_not_depend_on_corpus_size(self):
+        ids = params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 10 ** 12, 5)
+        self.assertEqual(10 ** 12, len(ids))
+        self.assertEqual("         5", ids[0])
+        self.assertEqual("1000000000004", ids[10 ** 12 - 1])
 
 
 class ActionMetaDataTests(TestCase):
-    def test_none_action_meta_data_is_none(self):
-        self.assertIsNone(next(params.NoneActionMetaData()))
-
     def test_generate_action_meta_data_without_id_conflicts(self):
         self.assertEqual('{"index": {"_index": "test_index", "_type": "test_type"}}',
                          next(params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)))
 
+    def test_generate_encoded_ids(self):
+        generator = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=[100, 200, 300], rand=lambda x, y: 0)
+        self.assertEqual((b"100", b"200"), generator.next_encoded_ids(2))
+        self.assertEqual(b'{"index": {"_index": "test_index", "_type": "test_type", "_id": "300"}}\n',
+                         generator.line_template % generator.next_encoded_ids(1))
+
     def test_generate_action_meta_data_with_id_conflicts(self):
         pseudo_random_sequence = iter([
             # first column == 3 -> we'll draw a "random" id, second column == "random" id
@@ -129,173 +110,386 @@ class ActionMetaDataTests(TestCase):
         # and we're back to random
         self.assertEqual('{"index": {"_index": "test_index", "_type": "test_type", "_id": "100"}}', next(generator))
 
-    def test_source_file_action_meta_data(self):
-        source = params.Slice(io.StringAsFileSource, 0, 5)
-        generator = params.SourceActionMetaData(source)
-
-        data = [
-            '{"index": {"_index": "test_index", "_type": "test_type", "_id": "1"}}',
-            '{"index": {"_index": "test_index", "_type": "test_type", "_id": "2"}}',
-            '{"index": {"_index": "test_index", "_type": "test_type", "_id": "3"}}',
-            '{"index": {"_index": "test_index", "_type": "test_type", "_id": "4"}}',
-            '{"index": {"_index": "test_index", "_type": "test_type", "_id": "5"}}',
-        ]
 
-        source.open(data, "r")
-        self.assertEqual(data, list(generator))
-        source.close()
+class MmapIndexDataReaderTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
 
+    def tearDown(self):
+        self.tmp_dir.cleanup()
 
-class IndexDataReaderTests(TestCase):
-    def test_read_bulk_larger_than_number_of_docs(self):
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}'
-        ]
-        bulk_size = 50
-
-        source = params.Slice(io.StringAsFileSource, 0, len(data))
-        am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+    def data_file(self, lines, trailing_newline=True):
+        path = os.path.join(self.tmp_dir.name, "docs.json")
+        with open(path, "wt") as f:
+            f.write("\n".join(lines))
+            if trailing_newline:
+                f.write("\n")
+        return path
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+    def docs(self, n):
+        return ['{"key": "value%d"}' % i for i in range(1, n + 1)]
 
-        expected_bulk_sizes = [len(data)]
-        # lines should include meta-data
-        expected_line_sizes = [len(data) * 2]
-        self.assert_bulks_sized(reader, expected_bulk_sizes, expected_line_sizes)
+    def read(self, reader):
+        bulks = []
+        with reader:
+            for index, type, batch in reader:
+                bulks.extend(batch)
+        return bulks
 
-    def test_read_bulk_with_offset(self):
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}'
-        ]
-        bulk_size = 50
-
-        source = params.Slice(io.StringAsFileSource, 3, len(data))
+    def test_read_bulks_and_generate_metadata(self):
+        data_file = self.data_file(self.docs(7))
         am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+        reader = params.MmapIndexDataReader(data_file, batch_size=3, bulk_size=3, offset=0, number_of_lines=7, lines_per_doc=1,
+                                            action_metadata=am_handler, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
+
+        meta = '{"index": {"_index": "test_index", "_type": "test_type"}}'
+        self.assertEqual([3, 3, 1], [docs for docs, _ in bulks])
+        self.assertEqual(("%s\n{\"key\": \"value7\"}\n" % meta).encode("utf-8"), bulks[2][1])
+        self.assertEqual("\n".join([meta, '{"key": "value1"}', meta, '{"key": "value2"}', meta, '{"key": "value3"}', ""]),
+                         bulks[0][1].decode("utf-8"))
+
+    def test_read_bulks_with_conflicting_ids(self):
+        data_file = self.data_file(self.docs(3))
+        am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=["100", "200", "300"], rand=lambda x, y: y)
+        reader = params.MmapIndexDataReader(data_file, batch_size=3, bulk_size=3, offset=0, number_of_lines=3, lines_per_doc=1,
+                                            action_metadata=am_handler, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
+
+        self.assertEqual(1, len(bulks))
+        lines = bulks[0][1].decode("utf-8").split("\n")
+        self.assertEqual('{"index": {"_index": "test_index", "_type": "test_type", "_id": "100"}}', lines[0])
+        self.assertEqual('{"key": "value1"}', lines[1])
+        self.assertEqual('{"key": "value3"}', lines[5])
+        self.assertEqual("", lines[6])
+
+    def test_read_bulks_with_conflicting_ids_and_percent_signs(self):
+        data_file = self.data_file(['{"key": "100%"}', '{"key": "%s%d"}'])
+        am_handler = params.GenerateActionMetaData("test%index", "test_type", conflicting_ids=["1", "2"], rand=lambda x, y: 0)
+        reader = params.MmapIndexDataReader(data_file, batch_size=2, bulk_size=2, offset=0, number_of_lines=2, lines_per_doc=1,
+                                            action_metadata=am_handler, index_name="test%index", type_name="test_type")
+        bulks = self.read(reader)
+
+        self.assertEqual([(2, b'{"index": {"_index": "test%index", "_type": "test_type", "_id": "1"}}\n{"key": "100%"}\n'
+                              b'{"index": {"_index": "test%index", "_type": "test_type", "_id": "2"}}\n{"key": "%s%d"}\n')], bulks)
+
+    def test_read_bulks_with_offset_and_limit(self):
+        data_file = self.data_file(self.docs(10), trailing_newline=False)
+        reader = params.MmapIndexDataReader(data_file, batch_size=4, bulk_size=2, offset=3, number_of_lines=5, lines_per_doc=1,
+                                            action_metadata=None, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
+
+        self.assertEqual([2, 2, 1], [docs for docs, _ in bulks])
+        self.assertEqual(b'{"key": "value4"}\n{"key": "value5"}\n', bulks[0][1])
+        self.assertEqual(b'{"key": "value8"}\n', bulks[2][1])
+
+    def test_read_last_line_without_newline(self):
+        data_file = self.data_file(self.docs(3), trailing_newline=False)
+        reader = params.MmapIndexDataReader(data_file, batch_size=10, bulk_size=10, offset=0, number_of_lines=10, lines_per_doc=1,
+                                            action_metadata=None, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
+
+        self.assertEqual([(3, b'{"key": "value1"}\n{"key": "value2"}\n{"key": "value3"}\n')], bulks)
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+    def test_read_bulks_and_assume_metadata_line_in_source_file(self):
+        lines = []
+        for doc in self.docs(5):
+            lines.append('{"index": {"_index": "test_index", "_type": "test_type"}}')
+            lines.append(doc)
+        data_file = self.data_file(lines)
+        reader = params.MmapIndexDataReader(data_file, batch_size=2, bulk_size=2, offset=0, number_of_lines=10, lines_per_doc=2,
+                                            action_metadata=None, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
+
+        self.assertEqual([2, 2, 1], [docs for docs, _ in bulks])
+        self.assertEqual(("\n".join(lines[8:]) + "\n").encode("utf-8"), bulks[2][1])
+
+    def test_read_large_bulks(self):
+        # large enough so line boundaries are estimated
+        docs = ['{"key": "%s"}' % ("x" * (i % 17)) for i in range(5000)]
+        data_file = self.data_file(docs)
+        reader = params.MmapIndexDataReader(data_file, batch_size=1000, bulk_size=1000, offset=0, number_of_lines=4500, lines_per_doc=1,
+                                            action_metadata=None, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
+
+        self.assertEqual([1000, 1000, 1000, 1000, 500], [docs for docs, _ in bulks])
+        self.assertEqual(("\n".join(docs[:4500]) + "\n").encode("utf-8"), b"".join(bulk for _, bulk in bulks))
 
-        expected_bulk_sizes = [(len(data) - 3)]
-        # lines should include meta-data
-        expected_line_sizes = [(len(data) - 3) * 2]
-        self.assert_bulks_sized(reader, expected_bulk_sizes, expected_line_sizes)
-
-    def test_read_bulk_smaller_than_number_of_docs(self):
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}',
-        ]
-        bulk_size = 3
-
-        source = params.Slice(io.StringAsFileSource, 0, len(data))
+    def test_read_bulk_larger_than_number_of_docs(self):
+        data_file = self.data_file(self.docs(5))
         am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+        reader = params.MmapIndexDataReader(data_file, batch_size=50, bulk_size=50, offset=0, number_of_lines=5, lines_per_doc=1,
+                                            action_metadata=am_handler, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
-
-        expected_bulk_sizes = [3, 3, 1]
+        self.assertEqual([5], [docs for docs, _ in bulks])
         # lines should include meta-data
-        expected_line_sizes = [6, 6, 2]
-        self.assert_bulks_sized(reader, expected_bulk_sizes, expected_line_sizes)
+        self.assertEqual([10], [bulk.count(b"\n") for _, bulk in bulks])
 
-    def test_read_bulk_smaller_than_number_of_docs_and_multiple_clients(self):
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}',
-        ]
-        bulk_size = 3
-
-        # only 5 documents to index for this client
-        source = params.Slice(io.StringAsFileSource, 0, 5)
+    def test_read_bulk_with_offset(self):
+        data_file = self.data_file(self.docs(5))
         am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+        reader = params.MmapIndexDataReader(data_file, batch_size=50, bulk_size=50, offset=3, number_of_lines=5, lines_per_doc=1,
+                                            action_metadata=am_handler, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
 
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+        self.assertEqual([2], [docs for docs, _ in bulks])
+        self.assertEqual([4], [bulk.count(b"\n") for _, bulk in bulks])
 
-        expected_bulk_sizes = [3, 2]
-        # lines should include meta-data
-        expected_line_sizes = [6, 4]
-        self.assert_bulks_sized(reader, expected_bulk_sizes, expected_line_sizes)
+    def test_read_bulk_smaller_than_number_of_docs_and_multiple_clients(self):
+        data_file = self.data_file(self.docs(7))
+        am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+        # only 5 documents to index for this client
+        reader = params.MmapIndexDataReader(data_file, batch_size=3, bulk_size=3, offset=0, number_of_lines=5, lines_per_doc=1,
+                                            action_metadata=am_handler, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
 
-    def test_read_bulks_and_assume_metadata_line_in_source_file(self):
-        data = [
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value1"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value2"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value3"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value4"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value5"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value6"}',
-            '{"index": {"_index": "test_index", "_type": "test_type"}',
-            '{"key": "value7"}'
-        ]
-        bulk_size = 3
-
-        source = params.Slice(io.StringAsFileSource, 0, len(data))
-        am_handler = params.SourceActionMetaData(source)
-
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
-
-        expected_bulk_sizes = [3, 3, 1]
-        # lines should include meta-data
-        expected_line_sizes = [6, 6, 2]
-        self.assert_bulks_sized(reader, expected_bulk_sizes, expected_line_sizes)
+        self.assertEqual([3, 2], [docs for docs, _ in bulks])
+        self.assertEqual([6, 4], [bulk.count(b"\n") for _, bulk in bulks])
 
     def test_read_bulks_and_assume_no_metadata(self):
-        data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}'
-        ]
-        bulk_size = 3
-
-        source = params.Slice(io.StringAsFileSource, 0, len(data))
-        am_handler = params.NoneActionMetaData()
-
-        reader = params.IndexDataReader(data, batch_size=bulk_size, bulk_size=bulk_size, file_source=source, action_metadata=am_handler,
-                                        index_name="test_index", type_name="test_type")
+        data_file = self.data_file(self.docs(7))
+        reader = params.MmapIndexDataReader(data_file, batch_size=3, bulk_size=3, offset=0, number_of_lines=7, lines_per_doc=1,
+                                            action_metadata=None, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
 
         # no meta-data, hence line numbers and bulk sizes need to be identical
-        expected_bulk_sizes = [3, 3, 1]
-        self.assert_bulks_sized(reader, expected_bulk_sizes, expected_bulk_sizes)
+        self.assertEqual([3, 3, 1], [docs for docs, _ in bulks])
+        self.assertEqual([3, 3, 1], [bulk.count(b"\n") for _, bulk in bulks])
 
-    def assert_bulks_sized(self, reader, expected_bulk_sizes, expected_line_sizes):
-        with reader:
-            bulk_index = 0
-            for index, type, batch in reader:
-                for bulk_size, bulk in batch:
-                    self.assertEqual(expected_bulk_sizes[bulk_index], bulk_size)
-                    self.assertEqual(expected_line_sizes[bulk_index], len(bulk))
-                    bulk_index += 1
+    def test_sends_lines_without_stripping_them(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json")
+        with open(path, "wb") as f:
+            f.write(b'{"key": "value1"}\r\n  {"key": "value2"} \n')
+        am_handler = params.GenerateActionMetaData("test_index", "test_type", conflicting_ids=None)
+        reader = params.MmapIndexDataReader(path, batch_size=2, bulk_size=2, offset=0, number_of_lines=2, lines_per_doc=1,
+                                            action_metadata=am_handler, index_name="test_index", type_name="test_type")
+        bulks = self.read(reader)
+
+        meta = b'{"index": {"_index": "test_index", "_type": "test_type"}}\n'
+        self.assertEqual([(2, meta + b'{"key": "value1"}\r\n' + meta + b'  {"key": "value2"} \n')], bulks)
+        # surrounding whitespace does not change the document
+        self.assertEqual([{"key": "value1"}, {"key": "value2"}], [json.loads(line) for line in bulks[0][1].splitlines()[1::2]])
+
+    def test_read_empty_file(self):
+        data_file = self.data_file([], trailing_newline=False)
+        reader = params.MmapIndexDataReader(data_file, batch_size=10, bulk_size=10, offset=0, number_of_lines=10, lines_per_doc=1,
+                                            action_metadata=None, index_name="test_index", type_name="test_type")
+        self.assertEqual([], self.read(reader))
+
+
+class ByteRangePartitioningTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def data_file(self, lines):
+        path = os.path.join(self.tmp_dir.name, "docs.json")
+        with open(path, "wt") as f:
+            f.write("\n".join(lines))
+            f.write("\n")
+        return path
+
+    def read_all(self, num_clients, action_metadata, docs, number_of_documents, id_conflicts=None):
+        document_file = self.data_file(docs)
+        indices = [track.Index(name="test-idx", auto_managed=True, types=[
+            track.Type(name="test-type", mapping_file=None, document_file=document_file, number_of_documents=number_of_documents)])]
+        bulks_per_client = []
+        for client_index in range(num_clients):
+            bulks = params.bulk_data_based(num_clients, client_index, indices, action_metadata, batch_size=4, bulk_size=2,
+                                           id_conflicts=id_conflicts, pipeline=None, partitioning=params.Partitioning.Bytes)
+            bulks_per_client.append([bulk["body"] for bulk in bulks])
+        return bulks_per_client
+
+    def test_compresses_bulks_ahead_of_time(self):
+        docs = ['{"key": "value%d"}' % i for i in range(1, 6)]
+        document_file = self.data_file(docs)
+        indices = [track.Index(name="test-idx", auto_managed=True, types=[
+            track.Type(name="test-type", mapping_file=None, document_file=document_file, number_of_documents=5)])]
+        bulks = list(params.bulk_data_based(1, 0, indices, params.ActionMetaData.NoMetaData, batch_size=4, bulk_size=2,
+                                            id_conflicts=None, pipeline=None, compression_level=1))
+
+        self.assertEqual([2, 2, 1], [bulk["bulk-size"] for bulk in bulks])
+        for bulk in bulks:
+            self.assertIsInstance(bulk["body"], client.GzipCompressedBody)
+        self.assertEqual(("\n".join(docs) + "\n").encode("utf-8"), b"".join(gzip.decompress(bulk["body"]) for bulk in bulks))
+
+    def test_byte_ranges_are_adjacent_and_aligned_to_lines(self):
+        path = self.data_file(['{"key": "%s"}' % ("x" * i) for i in range(10)])
+        size = os.path.getsize(path)
+        ranges = [params.byte_range_bounds(path, client_index, 3, lines_per_doc=1) for client_index in range(3)]
+
+        self.assertEqual(0, ranges[0][0])
+        self.assertEqual(size, ranges[2][1])
+        with open(path, "rb") as f:
+            data = f.read()
+        for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(ord("\n"), data[end - 1])
+
+    def test_reads_every_document_once_even_if_document_count_is_approximate(self):
+        docs = ['{"key": "value%d"}' % i for i in range(1, 12)]
+        for number_of_documents in [1, 11, 1000]:
+            for num_clients in [1, 2, 3, 5]:
+                bulks_per_client = self.read_all(num_clients, params.ActionMetaData.NoMetaData, docs, number_of_documents)
+                self.assertEqual(num_clients, len(bulks_per_client))
+                self.assertEqual(("\n".join(docs) + "\n").encode("utf-8"), b"".join(b"".join(bulks) for bulks in bulks_per_client))
+
+    def test_aligns_byte_ranges_to_documents_with_metadata_line_in_source_file(self):
+        lines = []
+        for i in range(1, 8):
+            lines.append('{"index": {"_index": "test-idx", "_type": "test-type", "_id": "%d"}}' % i)
+            lines.append('{"key": "v"}')
+        for num_clients in [2, 3, 4]:
+            bulks_per_client = self.read_all(num_clients, params.ActionMetaData.SourceFile, lines, number_of_documents=7)
+            for bulks in bulks_per_client:
+                for bulk in bulks:
+                    self.assertTrue(bulk.startswith(b'{"index"'))
+            self.assertEqual(("\n".join(lines) + "\n").encode("utf-8"), b"".join(b"".join(bulks) for bulks in bulks_per_client))
+
+    def test_builds_conflicting_ids_per_byte_range(self):
+        docs = ['{"key": "value%d"}' % i for i in range(1, 7)]
+        bulks_per_client = self.read_all(2, params.ActionMetaData.Generate, docs, number_of_documents=3,
+                                         id_conflicts=params.IndexIdConflict.SequentialConflicts)
+        ids_per_client = []
+        for bulks in bulks_per_client:
+            ids = set()
+            for bulk in bulks:
+                for line in bulk.decode("utf-8").splitlines():
+                    if line.startswith('{"index"'):
+                        ids.add(int(line.split('"_id": "')[1].split('"')[0]))
+            ids_per_client.append(ids)
+        # all documents have the same length so each client indexes three of them and uses its own id range
+        self.assertTrue(ids_per_client[0].issubset({0, 1, 2}))
+        self.assertTrue(ids_per_client[1].issubset({3, 4, 5}))
+        self.assertIn(0, ids_per_client[0])
+        self.assertIn(3, ids_per_client[1])
+
+    def test_size_of_byte_range_partition_is_unknown(self):
+        indices = [track.Index(name="test-idx", auto_managed=True, types=[
+            track.Type(name="test-type", mapping_file=None, document_file="docs.json", number_of_documents=10)])]
+        source = params.PartitionBulkIndexParamSource(indices, 0, 2, params.ActionMetaData.Generate, batch_size=2, bulk_size=2,
+                                                      partitioning=params.Partitioning.Bytes)
+        self.assertIsNone(source.size())
+        self.assertEqual(3, source.estimated_size())
+
+
+class ArchiveIndexDataReaderTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def archive(self, lines, block_size):
+        import gzip
+        document_file = os.path.join(self.tmp_dir.name, "docs.json")
+        document_archive = "%s.gz" % document_file
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with open(document_archive, "wb") as f:
+            for i in range(0, len(data), block_size):
+                f.write(gzip.compress(data[i:i + block_size]))
+        archive.prepare_block_index(document_archive)
+        return track.Type(name="test-type", mapping_file=None, document_file=document_file, document_archive=document_archive,
+                          number_of_documents=len(lines))
+
+    def read_all(self, num_clients, action_metadata, type, id_conflicts=None):
+        indices = [track.Index(name="test-idx", auto_managed=True, types=[type])]
+        bulks_per_client = []
+        for client_index in range(num_clients):
+            bulks = params.bulk_data_based(num_clients, client_index, indices, action_metadata, batch_size=6, bulk_size=3,
+                                           id_conflicts=id_conflicts, pipeline=None)
+            bulks_per_client.append([(bulk["bulk-size"], bulk["body"]) for bulk in bulks])
+        return bulks_per_client
+
+    def test_reads_every_document_once(self):
+        docs = ['{"key": "value%d"}' % i for i in range(1, 101)]
+        type = self.archive(docs, block_size=70)
+        self.assertTrue(params.reads_from_archive(type))
+        for num_clients in [1, 2, 3, 8]:
+            bulks_per_client = self.read_all(num_clients, params.ActionMetaData.NoMetaData, type)
+            self.assertEqual(("\n".join(docs) + "\n").encode("utf-8"),
+                             b"".join(body for bulks in bulks_per_client for _, body in bulks))
+            for bulks in bulks_per_client:
+                for docs_in_bulk, body in bulks[:-1]:
+                    self.assertEqual(3, docs_in_bulk)
+                    self.assertEqual(3, body.count(b"\n"))
+
+    def test_keeps_metadata_line_and_document_together(self):
+        lines = []
+        for i in range(1, 31):
+            lines.append('{"index": {"_index": "test-idx", "_type": "test-type", "_id": "%d"}}' % i)
+            lines.append('{"key": "v"}')
+        type = self.archive(lines, block_size=100)
+        for num_clients in [2, 5]:
+            bulks_per_client = self.read_all(num_clients, params.ActionMetaData.SourceFile, type)
+            for bulks in bulks_per_client:
+                for _, body in bulks:
+                    self.assertTrue(body.startswith(b'{"index"'))
+            self.assertEqual(("\n".join(lines) + "\n").encode("utf-8"),
+                             b"".join(body for bulks in bulks_per_client for _, body in bulks))
+
+    def test_generates_metadata_with_conflicting_ids(self):
+        docs = ['{"key": "value%d"}' % i for i in range(1, 41)]
+        type = self.archive(docs, block_size=100)
+        bulks_per_client = self.read_all(2, params.ActionMetaData.Generate, type, id_conflicts=params.IndexIdConflict.SequentialConflicts)
+        self.assertEqual(40, sum(docs_in_bulk for bulks in bulks_per_client for docs_in_bulk, _ in bulks))
+
+    def test_rejects_more_clients_than_blocks(self):
+        type = self.archive(['{"key": "value%d"}' % i for i in range(1, 11)], block_size=10 ** 6)
+        with self.assertRaisesRegex(exceptions.SystemSetupError, "contains only \\[1\\] independently decompressible blocks"):
+            self.read_all(2, params.ActionMetaData.NoMetaData, type)
+
+    def test_prefers_decompressed_file(self):
+        type = self.archive(['{"key": "value"}'], block_size=100)
+        with open(type.document_file, "wt") as f:
+            f.write('{"key": "value"}\n')
+        self.assertFalse(params.reads_from_archive(type))
+
+
+class PrefetcherTests(TestCase):
+    def test_provides_all_items_in_order(self):
+        prefetcher = params.Prefetcher(iter(range(100)), queue_size=3, name="test")
+        self.assertEqual(list(range(100)), list(prefetcher))
+        self.assertEqual(100, prefetcher.consumed)
+        # exhausted
+        with self.assertRaises(StopIteration):
+            next(prefetcher)
+
+    def test_counts_starvation(self):
+        def slow_source():
+            for i in range(3):
+                time.sleep(0.05)
+                yield i
+
+        prefetcher = params.Prefetcher(slow_source(), queue_size=3, name="test")
+        self.assertEqual([0, 1, 2], list(prefetcher))
+        self.assertEqual(3, prefetcher.starved)
+        self.assertEqual(0, prefetcher.average_queue_depth)
+
+    def test_reports_queue_depth(self):
+        prefetcher = params.Prefetcher(iter(range(10)), queue_size=4, name="test")
+        self.assertEqual(0, next(prefetcher))
+        starved = prefetcher.starved
+        # wait until the queue is full
+        while prefetcher.queue.qsize() < 4:
+            time.sleep(0.01)
+        self.assertEqual(1, next(prefetcher))
+        # we did not need to wait for the second item
+        self.assertEqual(starved, prefetcher.starved)
+        self.assertGreaterEqual(prefetcher.average_queue_depth, 2)
+
+    def test_propagates_errors(self):
+        def failing_source():
+            yield 1
+            raise exceptions.DataError("corrupt data")
+
+        prefetcher = params.Prefetcher(failing_source(), queue_size=2, name="test")
+        self.assertEqual(1, next(prefetcher))
+        with self.assertRaises(exceptions.DataError):
+            next(prefetcher)
 
 
 class InvocationGeneratorTests(TestCase):
@@ -403,7 +597,7 @@ class InvocationGeneratorTests(TestCase):
     def test_build_conflicting_ids(self):
         self.assertIsNone(params.build_conflicting_ids(params.IndexIdConflict.NoConflicts, 3, 0))
         self.assertEqual(["         0", "         1", "         2"],
-                         params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 3, 0))
+                         list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 3, 0)))
         # we cannot tell anything specific about the contents...
         self.assertEqual(3, len(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 3, 0)))
 
@@ -475,6 +669,38 @@ class BulkIndexParamSourceTests(TestCase):
 
         self.assertEqual("Unknown 'action-and-meta-data' setting [guess]", ctx.exception.args[0])
 
+    def test_create_with_unknown_partitioning(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.BulkIndexParamSource(indices=[], params={
+                "partitioning": "lines",
+            })
+
+        self.assertEqual("Unknown 'partitioning' setting [lines]", ctx.exception.args[0])
+
+    def test_create_with_negative_prefetch_bulks(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.BulkIndexParamSource(indices=[], params={
+                "bulk-size": 5000,
+                "prefetch-bulks": -1
+            })
+
+        self.assertEqual("'prefetch-bulks' must be non-negative but was -1", ctx.exception.args[0])
+
+    def test_prefetches_bulks_by_default(self):
+        self.assertEqual(2, params.BulkIndexParamSource(indices=[], params={"bulk-size": 5000}).prefetch_bulks)
+
+    def test_disables_prefetching(self):
+        self.assertEqual(0, params.BulkIndexParamSource(indices=[], params={"bulk-size": 5000, "prefetch-bulks": 0}).prefetch_bulks)
+
+    def test_create_with_invalid_compression_level(self):
+        with self.assertRaises(exceptions.InvalidSyntax) as ctx:
+            params.BulkIndexParamSource(indices=[], params={
+                "bulk-size": 5000,
+                "compression-level": 10
+            })
+
+        self.assertEqual("'compression-level' must be between 0 and 9 but was 10", ctx.exception.args[0])
+
     def test_create_valid_param_source(self):
         self.assertIsNotNone(params.BulkIndexParamSource(indices=[], params={
             "action-and-meta-data": "generate",
@@ -538,6 +764,100 @@ class BulkIndexParamSourceTests(TestCase):
         self.assertEqual("The provided index [does_not_exist] does not match any of the indices [index1].", ctx.exception.args[0])
 
 
+class SlicedScrollParamSourceTests(TestCase):
+    def setUp(self):
+        self.indices = [track.Index(name="logs", auto_managed=True, types=[
+            track.Type(name="doc", mapping_file=None, document_file=None, number_of_documents=10)])]
+
+    def test_defaults(self):
+        source = params.param_source_for_operation(track.OperationType.SlicedScroll.name, self.indices, {
+            "body": {"query": {"match_all": {}}}
+        })
+        self.assertEqual({
+            "index": "logs",
+            "type": "doc",
+            "use_request_cache": False,
+            "body": {"query": {"match_all": {}}},
+            "slices": params.DEFAULT_SCROLL_SLICES,
+            "items_per_page": params.DEFAULT_SCROLL_RESULTS_PER_PAGE,
+            "scroll": params.DEFAULT_SCROLL_KEEP_ALIVE
+        }, source.params())
+
+    def test_limits_pages_per_slice(self):
+        source = params.SlicedScrollParamSource(self.indices, {
+            "body": {"query": {"match_all": {}}},
+            "slices": "4",
+            "results-per-page": 500,
+            "pages": 10,
+            "scroll": "1m"
+        })
+        p = source.params()
+        self.assertEqual(4, p["slices"])
+        self.assertEqual(500, p["items_per_page"])
+        self.assertEqual(10, p["pages"])
+        self.assertEqual("1m", p["scroll"])
+
+    def test_rejects_invalid_number_of_slices(self):
+        with self.assertRaisesRegex(exceptions.InvalidSyntax, "'slices' must be positive but was 0"):
+            params.SlicedScrollParamSource(self.indices, {"body": {}, "slices": 0})
+        with self.assertRaisesRegex(exceptions.InvalidSyntax, "'slices' must be numeric"):
+            params.SlicedScrollParamSource(self.indices, {"body": {}, "slices": "many"})
+
+
+class QueryLogParamSourceTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.query_log = os.path.join(self.tmp_dir.name, "queries.json")
+        with open(self.query_log, "wt") as f:
+            for i in range(7):
+                f.write('{"query": {"term": {"id": %d}}}\n' % i)
+        self.indices = [track.Index(name="logs", auto_managed=True, types=[
+            track.Type(name="doc", mapping_file=None, document_file=None, number_of_documents=10)])]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_batches_queries(self):
+        source = params.param_source_for_operation(track.OperationType.MultiSearch.name, self.indices, {
+            "queries": self.query_log,
+            "queries-per-request": 3
+        }).partition(0, 1)
+
+        p = source.params()
+        self.assertEqual(3, p["queries"])
+        lines = p["body"].decode("utf-8").splitlines()
+        self.assertEqual(6, len(lines))
+        self.assertEqual({"index": "logs", "type": "doc", "request_cache": False}, json.loads(lines[0]))
+        self.assertEqual({"query": {"term": {"id": 0}}}, json.loads(lines[1]))
+        self.assertTrue(p["body"].endswith(b"\n"))
+
+        self.assertEqual(3, source.params()["queries"])
+        self.assertEqual(1, source.params()["queries"])
+        # starts over
+        self.assertEqual(p, source.params())
+
+    def test_partitions_queries_across_clients(self):
+        source = params.QueryLogParamSource(self.indices, {"queries": self.query_log, "queries-per-request": 10})
+        queries = []
+        for client_index in range(3):
+            body = source.partition(client_index, 3).params()["body"].decode("utf-8")
+            queries.extend(json.loads(line)["query"]["term"]["id"] for line in body.splitlines()[1::2])
+        self.assertEqual(list(range(7)), queries)
+
+    def test_rejects_invalid_queries(self):
+        with open(self.query_log, "at") as f:
+            f.write("{broken\n")
+        source = params.QueryLogParamSource(self.indices, {"queries": self.query_log})
+        with self.assertRaisesRegex(exceptions.DataError, r"contains an invalid query \[\{broken\]"):
+            source.partition(0, 1)
+
+    def test_query_log_is_mandatory(self):
+        with self.assertRaisesRegex(exceptions.InvalidSyntax, "'queries' is mandatory"):
+            params.QueryLogParamSource(self.indices, {})
+        with self.assertRaisesRegex(exceptions.DataError, "does not exist"):
+            params.QueryLogParamSource(self.indices, {"queries": self.query_log + ".missing"}).partition(0, 1)
+
+
 class ParamsRegistrationTests(TestCase):
     @staticmethod
     def param_source_function(indices, params):
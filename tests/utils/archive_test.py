@@ -0,0 +1,153 @@
+import bz2
+import gzip
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from esrally.utils import archive
+
+
+def write_archive(path, lines, block_size, compress):
+    data = ("\n".join(lines) + "\n").encode("utf-8")
+    with open(path, "wb") as f:
+        # block boundaries are deliberately not aligned to line boundaries
+        for i in range(0, len(data), block_size):
+            f.write(compress(data[i:i + block_size]))
+    return data
+
+
+class BlockIndexTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.lines = ['{"id": %d, "text": "%s"}' % (i, "x" * (i % 13)) for i in range(200)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assert_blocks(self, path, data, expected_number_of_blocks, **kwargs):
+        blocks = archive.find_blocks(path, **kwargs)
+        self.assertEqual(expected_number_of_blocks, len(blocks))
+        self.assertEqual(data, b"".join(archive.decompress_block(path, b) for b in blocks))
+        for block in blocks:
+            uncompressed = data[block.uncompressed_offset:block.uncompressed_offset + block.uncompressed_size]
+            self.assertEqual(uncompressed.count(b"\n"), block.line_breaks)
+            self.assertEqual(uncompressed.endswith(b"\n"), block.ends_with_line_break)
+        self.assertEqual(os.path.getsize(path), sum(b.compressed_size for b in blocks))
+
+    def test_finds_gzip_members(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json.gz")
+        data = write_archive(path, self.lines, 1000, gzip.compress)
+        self.assert_blocks(path, data, -(-len(data) // 1000))
+        self.assert_blocks(path, data, -(-len(data) // 1000), parallelism=3, parallel_threshold=0)
+
+    def test_finds_bzip2_streams(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json.bz2")
+        data = write_archive(path, self.lines, 1500, bz2.compress)
+        self.assert_blocks(path, data, -(-len(data) // 1500))
+        self.assert_blocks(path, data, -(-len(data) // 1500), parallelism=2, parallel_threshold=0)
+
+    def test_ignores_magic_bytes_within_compressed_data(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json.gz")
+        # without compression, the contents (including the gzip magic bytes) are copied to the archive as is
+        lines = ['{"text": "\x1f\x8b\x08"}'] * 10
+        data = write_archive(path, lines, 50, lambda d: gzip.compress(d, compresslevel=0))
+        self.assert_blocks(path, data, -(-len(data) // 50))
+
+    def test_single_block_archive(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json.gz")
+        data = write_archive(path, self.lines, 10 ** 9, gzip.compress)
+        self.assert_blocks(path, data, 1)
+
+    def test_detects_multiple_blocks_without_decompression(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json.gz")
+        write_archive(path, self.lines, 1000, gzip.compress)
+        self.assertTrue(archive.has_multiple_blocks(path))
+        self.assertTrue(archive.has_multiple_blocks(path, parallelism=2, parallel_threshold=0))
+        write_archive(path, self.lines, 10 ** 9, gzip.compress)
+        self.assertFalse(archive.has_multiple_blocks(path))
+
+    def test_supports_only_single_file_archives(self):
+        self.assertTrue(archive.supports_block_index("docs.json.gz"))
+        self.assertTrue(archive.supports_block_index("docs.json.bz2"))
+        self.assertFalse(archive.supports_block_index("docs.tar.gz"))
+        self.assertFalse(archive.supports_block_index("docs.zip"))
+
+    def test_determines_document_boundaries(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json.gz")
+        data = write_archive(path, self.lines, 1000, gzip.compress)
+        archive.prepare_block_index(path)
+        block_index = archive.BlockIndex(path).load()
+        for lines_per_doc in [1, 2]:
+            for block_number in range(len(block_index)):
+                b, offset, line_number = block_index.document_boundary(block_number, lines_per_doc)
+                position = block_index.blocks[b].uncompressed_offset + offset
+                # the boundary is the first document start at or after the block start
+                self.assertGreaterEqual(position, block_index.blocks[block_number].uncompressed_offset)
+                self.assertEqual(line_number, data[:position].count(b"\n"))
+                self.assertEqual(0, line_number % lines_per_doc)
+                if position > 0:
+                    self.assertEqual(b"\n", data[position - 1:position])
+                self.assertLess(data[block_index.blocks[block_number].uncompressed_offset:position].count(b"\n"), lines_per_doc + 1)
+            self.assertEqual((len(block_index), 0, len(self.lines)), block_index.document_boundary(len(block_index), lines_per_doc))
+
+
+class DecompressionTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.lines = ['{"id": %d, "text": "%s"}' % (i, "x" * (i % 13)) for i in range(500)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def decompress(self, archive_path, **kwargs):
+        target_path = os.path.join(self.tmp_dir.name, "docs.json")
+        progress = []
+        size = archive.decompress(archive_path, target_path, progress_indicator=lambda done, total: progress.append((done, total)),
+                                  **kwargs)
+        with open(target_path, "rb") as f:
+            data = f.read()
+        self.assertEqual(len(data), size)
+        self.assertEqual((os.path.getsize(archive_path), os.path.getsize(archive_path)), progress[-1])
+        return data
+
+    def test_decompresses_blocks_in_parallel(self):
+        for ext, compress in [("gz", gzip.compress), ("bz2", bz2.compress)]:
+            path = os.path.join(self.tmp_dir.name, "docs.json.%s" % ext)
+            data = write_archive(path, self.lines, 2000, compress)
+            self.assertEqual(data, self.decompress(path, parallelism=3, parallel_threshold=0))
+            # no temporary files are left behind
+            self.assertEqual([], [f for f in os.listdir(self.tmp_dir.name) if f.endswith(".part")])
+
+    def test_reuses_block_index(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json.gz")
+        data = write_archive(path, self.lines, 2000, gzip.compress)
+        archive.prepare_block_index(path)
+        self.assertEqual(data, self.decompress(path, parallelism=2, parallel_threshold=0))
+
+    def test_decompresses_single_block_sequentially(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json.bz2")
+        data = write_archive(path, self.lines, 10 ** 9, bz2.compress)
+        self.assertEqual(data, self.decompress(path, parallelism=4, parallel_threshold=0))
+
+    @mock.patch("esrally.utils.archive._verify_candidate", side_effect=AssertionError("single block must not be verified"))
+    def test_does_not_verify_single_block(self, verify_candidate):
+        path = os.path.join(self.tmp_dir.name, "docs.json.gz")
+        data = write_archive(path, self.lines, 10 ** 9, gzip.compress)
+        self.assertEqual(data, self.decompress(path, parallelism=2, parallel_threshold=0))
+        verify_candidate.assert_not_called()
+
+    @mock.patch("esrally.utils.archive._decompress_sequentially")
+    def test_reuses_verified_single_block(self, decompress_sequentially):
+        path = os.path.join(self.tmp_dir.name, "docs.json.gz")
+        # without compression, the gzip magic bytes in the contents are copied to the archive as is and look like further blocks
+        data = b'{"text": "\x1f\x8b\x08"}\n' * 50
+        with open(path, "wb") as f:
+            f.write(gzip.compress(data, compresslevel=0))
+        self.assertEqual(data, self.decompress(path, parallelism=2, parallel_threshold=0))
+        decompress_sequentially.assert_not_called()
+        self.assertEqual(["docs.json", "docs.json.gz"], sorted(os.listdir(self.tmp_dir.name)))
+
+    def test_decompresses_small_archives_sequentially(self):
+        path = os.path.join(self.tmp_dir.name, "docs.json.gz")
+        data = write_archive(path, self.lines, 2000, gzip.compress)
+        self.assertEqual(data, self.decompress(path))
@@ -0,0 +1,115 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from esrally.utils import cache
+
+
+class FingerprintTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "data.json")
+        with open(self.path, "wb") as f:
+            f.write(os.urandom(10000))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_parallel_fingerprint_matches_sequential_fingerprint(self):
+        sequential = cache.fingerprint(self.path, parallelism=1, segment_size=1024)
+        parallel = cache.fingerprint(self.path, parallelism=4, segment_size=1024)
+        self.assertEqual(sequential, parallel)
+        self.assertTrue(sequential.startswith(cache.CHECKSUM_PREFIX))
+
+    def test_fingerprint_changes_with_content(self):
+        before = cache.fingerprint(self.path, segment_size=1024)
+        with open(self.path, "r+b") as f:
+            f.seek(5000)
+            data = f.read(1)
+            f.seek(5000)
+            f.write(bytes([data[0] ^ 0xff]))
+        self.assertNotEqual(before, cache.fingerprint(self.path, segment_size=1024))
+
+    def test_fingerprint_of_empty_file(self):
+        open(self.path, "wb").close()
+        self.assertEqual(cache.fingerprint(self.path, parallelism=1), cache.fingerprint(self.path, parallelism=4))
+
+
+class CacheTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, ".cache")
+        self.archive = self.write("documents.json.bz2", b"compressed")
+        self.documents = self.write("documents.json", b"uncompressed")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_checksum_of_missing_file(self):
+        self.assertIsNone(cache.Cache(self.root).checksum(os.path.join(self.tmp_dir.name, "missing")))
+
+    @mock.patch("esrally.utils.cache.fingerprint", wraps=cache.fingerprint)
+    def test_trusts_checksum_of_unmodified_file(self, fingerprint):
+        checksum = cache.Cache(self.root).checksum(self.archive)
+        self.assertEqual(1, fingerprint.call_count)
+        # a new instance reads persisted checksums
+        self.assertEqual(checksum, cache.Cache(self.root).checksum(self.archive))
+        self.assertEqual(1, fingerprint.call_count)
+
+    @mock.patch("esrally.utils.cache.fingerprint", wraps=cache.fingerprint)
+    def test_verification_calculates_checksum_once(self, fingerprint):
+        cache.Cache(self.root).checksum(self.archive)
+        data_cache = cache.Cache(self.root, verify=True)
+        data_cache.checksum(self.archive)
+        data_cache.checksum(self.archive)
+        self.assertEqual(2, fingerprint.call_count)
+
+    def test_verification_detects_silent_corruption(self):
+        data_cache = cache.Cache(self.root)
+        data_cache.record(data_cache.checksum(self.archive), "decompressed", self.documents)
+        stat = os.stat(self.documents)
+        # same size and modification time but different content
+        self.write("documents.json", b"uncompressex")
+        os.utime(self.documents, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        archive_checksum = cache.Cache(self.root).checksum(self.archive)
+        self.assertTrue(cache.Cache(self.root).is_valid(archive_checksum, "decompressed", self.documents))
+        self.assertFalse(cache.Cache(self.root, verify=True).is_valid(archive_checksum, "decompressed", self.documents))
+
+    def test_records_derived_artifacts(self):
+        data_cache = cache.Cache(self.root)
+        archive_checksum = data_cache.checksum(self.archive)
+        self.assertIsNone(data_cache.lookup(archive_checksum, "decompressed"))
+        self.assertFalse(data_cache.is_valid(archive_checksum, "decompressed", self.documents))
+
+        data_cache.record(archive_checksum, "decompressed", self.documents)
+        self.assertEqual(data_cache.checksum(self.documents), data_cache.lookup(archive_checksum, "decompressed"))
+        self.assertTrue(cache.Cache(self.root).is_valid(archive_checksum, "decompressed", self.documents))
+
+        self.write("documents.json", b"modified")
+        self.assertFalse(data_cache.is_valid(archive_checksum, "decompressed", self.documents))
+        os.remove(self.documents)
+        self.assertFalse(data_cache.is_valid(archive_checksum, "decompressed", self.documents))
+
+    @mock.patch("esrally.utils.cache.fingerprint", wraps=cache.fingerprint)
+    def test_records_artifacts_by_size_and_modification_time(self, fingerprint):
+        data_cache = cache.Cache(self.root, verify=True)
+        archive_checksum = data_cache.checksum(self.archive)
+        data_cache.record(archive_checksum, "decompressed", self.documents, by_content=False)
+        self.assertTrue(data_cache.lookup(archive_checksum, "decompressed").startswith(cache.STAMP_PREFIX))
+        self.assertTrue(cache.Cache(self.root, verify=True).is_valid(archive_checksum, "decompressed", self.documents, by_content=False))
+        # only the archive has been hashed
+        self.assertEqual(1, fingerprint.call_count)
+
+        stat = os.stat(self.documents)
+        self.write("documents.json", b"modified")
+        os.utime(self.documents, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertFalse(data_cache.is_valid(archive_checksum, "decompressed", self.documents, by_content=False))
+        os.remove(self.documents)
+        self.assertFalse(data_cache.is_valid(archive_checksum, "decompressed", self.documents, by_content=False))
@@ -76,3 +76,79 @@ class DecompressionTests(TestCase):
     def read(self, f):
         with open(f, 'r') as content_file:
             return content_file.read()
+
+
+class OffsetTableTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file_path = os.path.join(self.tmp_dir, "docs.json")
+        self.lines = ["{\"id\": %d, \"text\": \"%s\"}\n" % (i, "x" * (i % 17)) for i in range(1000)]
+        with open(self.data_file_path, "wt") as f:
+            f.writelines(self.lines)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir)
+
+    def expected_offsets(self, granularity):
+        offsets = []
+        offset = 0
+        for line_number, line in enumerate(self.lines, start=1):
+            offset += len(line)
+            if line_number % granularity == 0:
+                offsets.append(offset)
+        return offsets
+
+    def test_calculates_offsets_in_current_process(self):
+        self.assertEqual(self.expected_offsets(100), list(io.line_offsets(self.data_file_path, 100, parallelism=1)))
+
+    def test_calculates_offsets_in_parallel(self):
+        for granularity in [1, 7, 100, 1000, 2000]:
+            self.assertEqual(self.expected_offsets(granularity),
+                             list(io.line_offsets(self.data_file_path, granularity, parallelism=3, parallel_threshold=0)),
+                             "granularity [%d]" % granularity)
+
+    def test_skips_lines(self):
+        io.prepare_file_offset_table(self.data_file_path, granularity=100)
+        for lines_to_skip in [0, 1, 99, 100, 101, 550, 999]:
+            with open(self.data_file_path, "rt") as data_file:
+                io.skip_lines(self.data_file_path, data_file, lines_to_skip)
+                self.assertEqual(self.lines[lines_to_skip], data_file.readline())
+
+    def test_looks_up_offsets(self):
+        io.prepare_file_offset_table(self.data_file_path, granularity=100)
+        offsets = self.expected_offsets(100)
+        with io.OffsetIndex(self.data_file_path) as offset_index:
+            self.assertEqual(10, len(offset_index))
+            self.assertEqual((0, 0), offset_index.offset_before_line(99))
+            self.assertEqual((100, offsets[0]), offset_index.offset_before_line(100))
+            self.assertEqual((500, offsets[4]), offset_index.offset_before_line(567))
+            self.assertEqual((1000, offsets[9]), offset_index.offset_before_line(5000))
+
+            self.assertEqual((0, 0), offset_index.line_before_offset(offsets[0] - 1))
+            self.assertEqual((100, offsets[0]), offset_index.line_before_offset(offsets[0]))
+            self.assertEqual((300, offsets[2]), offset_index.line_before_offset(offsets[3] - 1))
+
+    def test_calculates_offsets_across_blocks(self):
+        with mock.patch.object(io, "_LINE_SCAN_BLOCK_SIZE", 1000):
+            for granularity in [1, 7, 100]:
+                self.assertEqual(self.expected_offsets(granularity), list(io.line_offsets(self.data_file_path, granularity, parallelism=1)),
+                                 "granularity [%d]" % granularity)
+
+    def test_removes_legacy_offset_table(self):
+        legacy_offset_file_path = "%s.offset" % self.data_file_path
+        with open(legacy_offset_file_path, "wt") as f:
+            f.write("50000;1234567\n")
+        io.prepare_file_offset_table(self.data_file_path, granularity=100)
+        self.assertFalse(os.path.exists(legacy_offset_file_path))
+        self.assertTrue(os.path.exists(io.offset_index_path(self.data_file_path)))
+
+    def test_rebuilds_offset_table_if_granularity_changes(self):
+        io.prepare_file_offset_table(self.data_file_path, granularity=100)
+        with io.OffsetIndex(self.data_file_path) as offset_index:
+            self.assertEqual(10, len(offset_index))
+
+        io.prepare_file_offset_table(self.data_file_path, granularity=250)
+        with io.OffsetIndex(self.data_file_path) as offset_index:
+            self.assertEqual(250, offset_index.granularity)
+            self.assertEqual(4, len(offset_index))
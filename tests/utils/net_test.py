@@ -0,0 +1,148 @@
+import http.server
+import json
+import os
+import re
+import tempfile
+import threading
+from unittest import TestCase
+
+from esrally import exceptions
+from esrally.utils import net
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    # set by the test
+    content = b""
+    supports_ranges = True
+    # number of requests that are aborted after a few bytes
+    failures = 0
+    requests = []
+    lock = threading.Lock()
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.content)))
+        if self.supports_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        with RangeRequestHandler.lock:
+            RangeRequestHandler.requests.append(range_header)
+            fail = RangeRequestHandler.failures > 0
+            if fail:
+                RangeRequestHandler.failures -= 1
+        if range_header and self.supports_ranges:
+            start, end = [int(v) for v in re.match(r"bytes=(\d+)-(\d+)", range_header).groups()]
+            body = self.content[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, len(self.content)))
+        else:
+            body = self.content
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if fail:
+            # simulate a broken connection
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        RangeRequestHandler.content = os.urandom(100 * 1024)
+        RangeRequestHandler.supports_ranges = True
+        RangeRequestHandler.failures = 0
+        RangeRequestHandler.requests = []
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.url = "http://127.0.0.1:%d/documents.json.bz2" % self.server.server_address[1]
+        self.local_path = os.path.join(self.tmp_dir.name, "documents.json.bz2")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def downloaded_content(self):
+        with open(self.local_path, "rb") as f:
+            return f.read()
+
+    def test_downloads_segments_in_parallel(self):
+        progress = []
+        net.download(self.url, self.local_path, expected_size_in_bytes=len(RangeRequestHandler.content),
+                     progress_indicator=lambda read, total: progress.append((read, total)), segments=4, min_segment_size=1024)
+
+        self.assertEqual(RangeRequestHandler.content, self.downloaded_content())
+        self.assertEqual(4, len(RangeRequestHandler.requests))
+        self.assertTrue(all(r.startswith("bytes=") for r in RangeRequestHandler.requests))
+        self.assertEqual((len(RangeRequestHandler.content), len(RangeRequestHandler.content)), progress[-1])
+        self.assertFalse(os.path.exists(self.local_path + ".tmp.state"))
+
+    def test_downloads_at_once_without_range_support(self):
+        RangeRequestHandler.supports_ranges = False
+        net.download(self.url, self.local_path, segments=4, min_segment_size=1024)
+
+        self.assertEqual(RangeRequestHandler.content, self.downloaded_content())
+        self.assertEqual([None], RangeRequestHandler.requests)
+
+    def test_retries_interrupted_segments(self):
+        RangeRequestHandler.failures = 2
+        net.download(self.url, self.local_path, segments=2, min_segment_size=1024)
+
+        self.assertEqual(RangeRequestHandler.content, self.downloaded_content())
+        self.assertEqual(4, len(RangeRequestHandler.requests))
+
+    def test_resumes_partial_download(self):
+        content = RangeRequestHandler.content
+        size = len(content)
+        half = size // 2
+        tmp_path = self.local_path + ".tmp"
+        # the first segment has been downloaded completely, the second one partially
+        with open(tmp_path, "wb") as f:
+            f.write(content[:half + 100])
+            f.truncate(size)
+        with open(tmp_path + ".state", "wt") as f:
+            json.dump({"url": self.url, "size": size, "segments": [[0, half, half], [half, size, 100]]}, f)
+
+        net.download(self.url, self.local_path, expected_size_in_bytes=size, segments=2, min_segment_size=1024)
+
+        self.assertEqual(content, self.downloaded_content())
+        self.assertEqual(["bytes=%d-%d" % (half + 100, size - 1)], RangeRequestHandler.requests)
+
+    def test_restarts_download_if_state_does_not_match(self):
+        size = len(RangeRequestHandler.content)
+        tmp_path = self.local_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.truncate(size)
+        with open(tmp_path + ".state", "wt") as f:
+            json.dump({"url": "http://example.org/other.bz2", "size": size, "segments": [[0, size, size]]}, f)
+
+        net.download(self.url, self.local_path, segments=1, min_segment_size=1024)
+
+        self.assertEqual(RangeRequestHandler.content, self.downloaded_content())
+
+    def test_rejects_download_with_unexpected_size(self):
+        with self.assertRaises(exceptions.DataError):
+            net.download(self.url, self.local_path, expected_size_in_bytes=10, segments=2, min_segment_size=1024)
+        self.assertFalse(os.path.exists(self.local_path))
+
+
+class ProgressTests(TestCase):
+    def test_aggregates_progress_of_multiple_downloads(self):
+        progress = []
+        aggregate = net.AggregateProgress(lambda read, total: progress.append((read, total)), {"a": 100, "b": 50})
+        a = aggregate.for_download("a")
+        b = aggregate.for_download("b")
+        a(10, 100)
+        b(20, 50)
+        a(100, 100)
+        self.assertEqual([(10, 150), (30, 150), (120, 150)], progress)